@@ -33,17 +33,45 @@ EasyBuild support for building and installing ATLAS, implemented as an easyblock
 """
 
 import fileinput
+import glob
+import hashlib
+import json
 import re
 import os
 import sys
+import time
 from distutils.version import LooseVersion
 
 from easybuild.easyblocks.generic.configuremake import ConfigureMake
 from easybuild.framework.easyconfig import CUSTOM
 from easybuild.tools.build_log import EasyBuildError
+from easybuild.tools.filetools import copy_file, is_readable, mkdir, read_file, remove_dir, write_file
 from easybuild.tools.modules import get_software_root
+from easybuild.tools.py2vs3 import string_type
 from easybuild.tools.run import run_cmd
-from easybuild.tools.systemtools import AMD, INTEL, get_cpu_speed, get_cpu_vendor, get_shared_lib_ext
+from easybuild.tools.systemtools import AMD, INTEL, get_cpu_features, get_cpu_model, get_cpu_speed, get_cpu_vendor
+from easybuild.tools.systemtools import get_shared_lib_ext
+
+
+# maximum CPU frequency supported by the hardware (in kHz), as opposed to the current (or scaling max.) frequency
+CPUINFO_MAX_FREQ_FP = '/sys/devices/system/cpu/cpu0/cpufreq/cpuinfo_max_freq'
+# name of file in cache directory that specifies the key (CPU, compiler, ATLAS version, ...) for the tuning results
+TUNING_CACHE_KEY_FN = 'eb-tuning-key.json'
+
+
+def get_cpu_max_freq():
+    """
+    Return maximum CPU frequency supported by the hardware (in kHz), or None if it can not be determined.
+
+    Unlike the current CPU frequency, this does not depend on the current load or power saving settings.
+    """
+    res = None
+    if is_readable(CPUINFO_MAX_FREQ_FP):
+        try:
+            res = int(read_file(CPUINFO_MAX_FREQ_FP).strip())
+        except ValueError:
+            pass
+    return res
 
 
 class EB_ATLAS(ConfigureMake):
@@ -57,12 +85,19 @@ class EB_ATLAS(ConfigureMake):
     def __init__(self, *args, **kwargs):
         super(EB_ATLAS, self).__init__(*args, **kwargs)
 
+        self.tuning_cache_dir = None
+        self.tuning_key = None
+        self.tuning_reused = False
+
     @staticmethod
     def extra_options():
         extra_vars = {
             'ignorethrottling': [False, "Ignore check done by ATLAS for CPU throttling (not recommended)", CUSTOM],
             'full_lapack': [False, "Build a full LAPACK library (requires netlib's LAPACK)", CUSTOM],
             'sharedlibs': [False, "Enable building of shared libs as well", CUSTOM],
+            'tuning_cache': [None, "Location of directory in which tuning results (architectural defaults) are "
+                                   "cached, for reuse in later builds on identical systems (no caching if None)",
+                             CUSTOM],
         }
         return ConfigureMake.extra_options(extra_vars)
 
@@ -139,6 +174,9 @@ class EB_ATLAS(ConfigureMake):
                                                                      'f77':os.getenv('F77')
                                                                     })
 
+        if self.cfg['tuning_cache']:
+            self.prepare_tuning_cache()
+
         # call configure in parent dir
         cmd = "%s %s/configure --prefix=%s %s" % (self.cfg['preconfigopts'], self.cfg['start_dir'],
                                                  self.installdir, self.cfg['configopts'])
@@ -157,6 +195,89 @@ class EB_ATLAS(ConfigureMake):
                 errormsg = "configure output: %s\nConfigure failed, not sure why (see output above)." % out
             raise EasyBuildError(errormsg)
 
+    def det_tuning_key(self):
+        """
+        Determine key for tuning results: CPU model, features and max. frequency, compilers, ATLAS version
+        and configure options; tuning results can only be reused if all of these are identical.
+        """
+        compilers = {}
+        for var in ['CC', 'F77']:
+            (out, _) = run_cmd("%s --version" % os.getenv(var), simple=False, log_ok=False, trace=False)
+            compilers[var] = {'cmd': os.getenv(var), 'version': (out.strip().splitlines() or [''])[0]}
+
+        return {
+            'atlas_version': self.version,
+            'compilers': compilers,
+            'configopts': self.cfg['configopts'],
+            'cpu_features': sorted(get_cpu_features()),
+            'cpu_model': get_cpu_model(),
+            'cpu_max_freq': get_cpu_max_freq(),
+            'toolchain': '%s/%s' % (self.toolchain.name, self.toolchain.version),
+        }
+
+    def prepare_tuning_cache(self):
+        """
+        Determine location of cached tuning results for this build,
+        and instruct ATLAS to use them as architectural defaults if they are available.
+        """
+        cache_root = self.cfg['tuning_cache']
+        if not isinstance(cache_root, string_type):
+            raise EasyBuildError("Location of directory to cache tuning results in must be specified via "
+                                 "'tuning_cache', found: %s", cache_root)
+
+        self.tuning_key = self.det_tuning_key()
+        key_txt = json.dumps(self.tuning_key, indent=4, sort_keys=True)
+        key_hash = hashlib.sha256(key_txt.encode('utf-8')).hexdigest()[:16]
+        self.tuning_cache_dir = os.path.join(cache_root, '%s-%s-%s' % (self.name, self.version, key_hash))
+        self.log.info("Location of cached tuning results for this build: %s (key: %s)", self.tuning_cache_dir, key_txt)
+
+        key_path = os.path.join(self.tuning_cache_dir, TUNING_CACHE_KEY_FN)
+        if os.path.exists(key_path):
+            cached = json.loads(read_file(key_path))
+            archdefs = glob.glob(os.path.join(self.tuning_cache_dir, '*.tar.bz2'))
+            if cached.get('key') == json.loads(key_txt) and archdefs:
+                # pass directory with architectural defaults to configure
+                # see http://math-atlas.sourceforge.net/atlas_install/node45.html
+                self.cfg.update('configopts', "-Ss ADdir %s" % self.tuning_cache_dir)
+                self.tuning_reused = True
+                self.log.info("Reusing cached tuning results: %s", ', '.join(archdefs))
+            else:
+                self.log.info("Cached tuning results in %s are invalid, removing them", self.tuning_cache_dir)
+                remove_dir(self.tuning_cache_dir)
+        else:
+            self.log.info("No cached tuning results found, full tuning will be done")
+
+    def update_tuning_cache(self, build_time):
+        """
+        Save tuning results as architectural defaults in the cache (if they were not reused),
+        and report on time saved if cached tuning results were reused.
+        """
+        key_path = os.path.join(self.tuning_cache_dir, TUNING_CACHE_KEY_FN)
+
+        if self.tuning_reused:
+            tuned_build_time = json.loads(read_file(key_path)).get('build_time', 0)
+            self.log.info("Reused cached tuning results from %s: build took %.0fs, compared to %.0fs for build "
+                          "with full tuning (saved ~%.0fs)", self.tuning_cache_dir, build_time, tuned_build_time,
+                          tuned_build_time - build_time)
+        else:
+            # create tarball with architectural defaults from tuning results
+            # see http://math-atlas.sourceforge.net/atlas_install/node45.html
+            archs_dir = os.path.join(os.getcwd(), 'ARCHS')
+            tarballs = set(glob.glob(os.path.join(archs_dir, '*.tar.bz2')))
+            run_cmd("make ArchNew && make tarfile", path=archs_dir, log_all=True, simple=True)
+            archdefs = sorted(set(glob.glob(os.path.join(archs_dir, '*.tar.bz2'))) - tarballs)
+
+            if archdefs:
+                mkdir(self.tuning_cache_dir, parents=True)
+                for archdef in archdefs:
+                    copy_file(archdef, self.tuning_cache_dir)
+                write_file(key_path, json.dumps({'build_time': build_time, 'key': self.tuning_key}, indent=4,
+                                                sort_keys=True))
+                self.log.info("Tuning results (build took %.0fs) saved to %s: %s", build_time,
+                              self.tuning_cache_dir, ', '.join(os.path.basename(x) for x in archdefs))
+            else:
+                self.log.warning("No architectural defaults found in %s, not caching tuning results", archs_dir)
+
     def build_step(self, verbose=False):
 
         if self.cfg['parallel'] != 1:
@@ -164,7 +285,9 @@ class EB_ATLAS(ConfigureMake):
             self.cfg['parallel'] = 1
 
         # default make is fine
+        start_time = time.time()
         super(EB_ATLAS, self).build_step(verbose=verbose)
+        build_time = time.time() - start_time
 
         # optionally also build shared libs
         if self.cfg['sharedlibs']:
@@ -182,6 +305,9 @@ class EB_ATLAS(ConfigureMake):
             except OSError as err:
                 raise EasyBuildError("Failed to get back to previous dir after building shared libs: %s ", err)
 
+        if self.tuning_cache_dir and not self.dry_run:
+            self.update_tuning_cache(build_time)
+
     def install_step(self):
         """Install step
 
@@ -54,6 +54,21 @@ from easybuild.tools.run import run_cmd
 from easybuild.tools.systemtools import UNKNOWN, get_glibc_version, get_shared_lib_ext
 
 
+def det_bjam_stats(out):
+    """
+    Determine statistics for bjam run based on its output:
+    number of targets that were found ('found') and had to be updated ('updating'),
+    and number of compilation actions that were performed ('compiled')
+    """
+    res = {'found': 0, 'updating': 0, 'compiled': 0}
+    for key in ['found', 'updating']:
+        regex = re.compile(r'^\.\.\.%s ([0-9]+) targets?\.\.\.' % key, re.M)
+        res[key] = sum(int(x) for x in regex.findall(out))
+
+    res['compiled'] = len(re.findall(r'^\S+\.compile\.c(\+\+)?(\.pch)? ', out, re.M))
+    return res
+
+
 class EB_Boost(EasyBlock):
     """Support for building Boost."""
 
@@ -63,6 +78,11 @@ class EB_Boost(EasyBlock):
 
         self.objdir = None
 
+        # build directory for bjam, shared across variants so build targets that are the same can be reused
+        self.bjam_builddir = None
+        # statistics for each bjam run ('found', 'updating' and 'compiled' targets), see build_boost_variant
+        self.bjam_stats = []
+
         self.pyvers = []
 
         if LooseVersion(self.version) >= LooseVersion("1.71.0"):
@@ -172,22 +192,39 @@ class EB_Boost(EasyBlock):
 
             write_file('user-config.jam', txt, append=True)
 
-    def build_boost_variant(self, bjamoptions, paracmd):
-        """Build Boost library with specified options for bjam."""
+    def build_boost_variant(self, bjamoptions, paracmd, variant=None):
+        """
+        Build Boost library with specified options for bjam.
+
+        Build targets are not cleaned up afterwards, so they can be reused when building other variants
+        (bjam keeps track of build targets for different build properties in separate subdirectories).
+        """
+        out = ''
         # build with specified options
         cmd = "%s ./%s %s %s %s" % (self.cfg['prebuildopts'], self.bjamcmd, bjamoptions, paracmd, self.cfg['buildopts'])
-        run_cmd(cmd, log_all=True, simple=True)
+        out += run_cmd(cmd, log_all=True, simple=False)[0]
         # install built Boost library
         cmd = "%s ./%s %s install %s %s" % (
             self.cfg['preinstallopts'], self.bjamcmd, bjamoptions, paracmd, self.cfg['installopts'])
-        run_cmd(cmd, log_all=True, simple=True)
-        # clean up before proceeding with next build
-        run_cmd("./%s --clean-all" % self.bjamcmd, log_all=True, simple=True)
+        out += run_cmd(cmd, log_all=True, simple=False)[0]
+
+        self.bjam_stats.append((variant or bjamoptions, det_bjam_stats(out)))
+
+    def log_bjam_stats(self):
+        """Log summary of reused build targets for each of the variants that were built."""
+        lines = ["%-30s %10s %10s %10s %10s" % ('variant', 'targets', 'updated', 'reused', 'compiled')]
+        for variant, stats in self.bjam_stats:
+            reused = stats['found'] - stats['updating']
+            lines.append("%-30s %10d %10d %10d %10d" % (variant, stats['found'], stats['updating'], reused,
+                                                        stats['compiled']))
+        self.log.info("Summary of build targets for Boost variants:\n%s", '\n'.join(lines))
 
     def build_step(self):
         """Build Boost with bjam tool."""
 
-        bjamoptions = " --prefix=%s" % self.objdir
+        # use build directory that is shared across variants (see build_boost_variant)
+        self.bjam_builddir = os.path.join(self.builddir, 'bjam_build')
+        bjamoptions = " --prefix=%s --build-dir=%s" % (self.objdir, self.bjam_builddir)
 
         cxxflags = os.getenv('CXXFLAGS')
         # only disable -D_GLIBCXX_USE_CXX11_ABI if use_glibcxx11_abi was explicitly set to False
@@ -222,24 +259,27 @@ class EB_Boost(EasyBlock):
 
         if self.cfg['boost_mpi']:
             self.log.info("Building boost_mpi library")
-            self.build_boost_variant(bjamoptions + " --user-config=user-config.jam --with-mpi", paracmd)
+            self.build_boost_variant(bjamoptions + " --user-config=user-config.jam --with-mpi", paracmd, variant='mpi')
 
         if self.cfg['boost_multi_thread']:
             self.log.info("Building boost with multi threading")
-            self.build_boost_variant(bjamoptions + " threading=multi --layout=tagged", paracmd)
+            self.build_boost_variant(bjamoptions + " threading=multi --layout=tagged", paracmd, variant='multi-thread')
 
         # if both boost_mpi and boost_multi_thread are enabled, build boost mpi with multi-thread support
         if self.cfg['boost_multi_thread'] and self.cfg['boost_mpi']:
             self.log.info("Building boost_mpi with multi threading")
             extra_bjamoptions = " --user-config=user-config.jam --with-mpi threading=multi --layout=tagged"
-            self.build_boost_variant(bjamoptions + extra_bjamoptions, paracmd)
+            self.build_boost_variant(bjamoptions + extra_bjamoptions, paracmd, variant='mpi + multi-thread')
 
         # install remainder of boost libraries
         self.log.info("Installing boost libraries")
 
         cmd = "%s ./%s %s install %s %s" % (
             self.cfg['preinstallopts'], self.bjamcmd, bjamoptions, paracmd, self.cfg['installopts'])
-        run_cmd(cmd, log_all=True, simple=True)
+        (out, _) = run_cmd(cmd, log_all=True, simple=False)
+        self.bjam_stats.append(('default', det_bjam_stats(out)))
+
+        self.log_bjam_stats()
 
     def install_step(self):
         """Install Boost by copying files to install dir."""
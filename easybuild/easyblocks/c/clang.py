@@ -36,10 +36,12 @@ Support for building and installing Clang, implemented as an easyblock.
 
 import glob
 import os
+import resource
 import shutil
+import time
 from distutils.version import LooseVersion
 
-from easybuild.easyblocks.generic.cmakemake import CMakeMake
+from easybuild.easyblocks.generic.cmakemake import NINJA_GENERATOR, CMakeMake
 from easybuild.framework.easyconfig import CUSTOM
 from easybuild.tools import run
 from easybuild.tools.build_log import EasyBuildError
@@ -47,8 +49,9 @@ from easybuild.tools.config import build_option
 from easybuild.tools.filetools import apply_regex_substitutions, change_dir, mkdir
 from easybuild.tools.modules import get_software_root
 from easybuild.tools.run import run_cmd
-from easybuild.tools.systemtools import AARCH32, AARCH64, POWER, X86_64
+from easybuild.tools.systemtools import AARCH32, AARCH64, POWER, UNKNOWN, X86_64
 from easybuild.tools.systemtools import get_cpu_architecture, get_os_name, get_os_version, get_shared_lib_ext
+from easybuild.tools.systemtools import get_total_memory
 
 # List of all possible build targets for Clang
 CLANG_TARGETS = ["all", "AArch64", "ARM", "CppBackend", "Hexagon", "Mips",
@@ -63,6 +66,12 @@ DEFAULT_TARGETS_MAP = {
     X86_64: ['X86'],
 }
 
+# Targets to build in intermediate stages when bootstrapping (only what is required to build the next stage);
+# TableGen binaries from stage 1 are used in stages 2 and 3
+BOOTSTRAP_STAGE1_TARGETS = ['clang', 'llvm-tblgen', 'clang-tblgen']
+BOOTSTRAP_STAGE2_TARGETS = ['clang']
+TABLEGEN_BINARIES = [('LLVM_TABLEGEN', 'llvm-tblgen'), ('CLANG_TABLEGEN', 'clang-tblgen')]
+
 
 class EB_Clang(CMakeMake):
     """Support for bootstrapping Clang."""
@@ -76,11 +85,19 @@ class EB_Clang(CMakeMake):
             'bootstrap': [True, "Bootstrap Clang using GCC", CUSTOM],
             'usepolly': [False, "Build Clang with polly", CUSTOM],
             'build_lld': [False, "Build the LLVM lld linker", CUSTOM],
+            'compile_job_memory': [1, "Memory (in GiB) to reserve per compile job, used to determine number of "
+                                      "concurrent compile jobs (only with Ninja generator)", CUSTOM],
             'default_openmp_runtime': [None, "Default OpenMP runtime for clang (for example, 'libomp')", CUSTOM],
             'enable_rtti': [False, "Enable Clang RTTI", CUSTOM],
             'libcxx': [False, "Build the LLVM C++ standard library", CUSTOM],
+            'link_job_memory': [4, "Memory (in GiB) to reserve per link job, used to determine number of "
+                                   "concurrent link jobs if link_jobs is not specified (only with Ninja generator)",
+                                CUSTOM],
             'static_analyzer': [True, "Install the static analyser of Clang", CUSTOM],
             'skip_all_tests': [False, "Skip running of tests", CUSTOM],
+            'test_intermediate_stages': [True, "Build all targets for and run tests on intermediate stages when "
+                                               "bootstrapping (if disabled, only what is required to build the "
+                                               "next stage is built)", CUSTOM],
             # The sanitizer tests often fail on HPC systems due to the 'weird' environment.
             'skip_sanitizer_tests': [True, "Do not run the sanitizer tests", CUSTOM],
         }
@@ -96,6 +113,7 @@ class EB_Clang(CMakeMake):
         self.llvm_obj_dir_stage2 = None
         self.llvm_obj_dir_stage3 = None
         self.make_parallel_opts = ""
+        self.stage_stats = []
 
     def check_readiness_step(self):
         """Fail early on RHEL 5.x and derivatives because of known bug in libc."""
@@ -277,9 +295,67 @@ class EB_Clang(CMakeMake):
         if self.cfg['parallel']:
             self.make_parallel_opts = "-j %s" % self.cfg['parallel']
 
+        # size compile and link jobs separately, since linking LLVM/Clang binaries requires a lot more memory;
+        # LLVM only supports separate job pools for compile and link jobs with Ninja
+        if self.det_generator() == NINJA_GENERATOR:
+            compile_jobs, link_jobs = self.det_parallel_jobs()
+            self.cfg.update('configopts', "-DLLVM_PARALLEL_COMPILE_JOBS=%s" % compile_jobs)
+            self.cfg.update('configopts', "-DLLVM_PARALLEL_LINK_JOBS=%s" % link_jobs)
+            # LLVM defines the job pool for link jobs itself, so make sure CMakeMake doesn't
+            self.cfg['link_jobs'] = None
+
         self.log.info("Configuring")
         super(EB_Clang, self).configure_step(srcdir=self.llvm_src_dir)
 
+    def det_parallel_jobs(self):
+        """
+        Determine number of concurrent compile and link jobs, based on available cores and memory.
+
+        :return: tuple with number of compile jobs and number of link jobs
+        """
+        parallel = self.cfg['parallel'] or 1
+        link_jobs = self.cfg['link_jobs']
+
+        total_mem = get_total_memory()
+        if total_mem == UNKNOWN:
+            self.log.warning("Total memory unknown, not limiting number of concurrent compile/link jobs")
+            compile_jobs = parallel
+            link_jobs = link_jobs or parallel
+        else:
+            total_mem_gib = float(total_mem) / 1024
+            compile_jobs = max(1, min(parallel, int(total_mem_gib // self.cfg['compile_job_memory'])))
+            link_jobs = link_jobs or max(1, min(parallel, int(total_mem_gib // self.cfg['link_job_memory'])))
+
+        self.log.info("Using max. %s concurrent compile jobs and %s concurrent link jobs (total memory: %s MB)",
+                      compile_jobs, link_jobs, total_mem)
+        return compile_jobs, link_jobs
+
+    def build_tool(self):
+        """Return command to drive build with, depending on CMake generator being used."""
+        if self.generator == NINJA_GENERATOR:
+            return 'ninja'
+        else:
+            return 'make'
+
+    def run_stage(self, stage, func):
+        """
+        Run specified function to build a particular stage of Clang, and keep track of the time it took,
+        the CPU time used by the commands being run, and the peak memory usage (resident set size) of these commands.
+
+        Note: peak resident set size is the largest one of any command run so far (not only for this stage).
+        """
+        start_time = time.time()
+        start_rusage = resource.getrusage(resource.RUSAGE_CHILDREN)
+
+        func()
+
+        rusage = resource.getrusage(resource.RUSAGE_CHILDREN)
+        secs = time.time() - start_time
+        cpu_secs = (rusage.ru_utime + rusage.ru_stime) - (start_rusage.ru_utime + start_rusage.ru_stime)
+        self.stage_stats.append((stage, secs, cpu_secs, rusage.ru_maxrss))
+        self.log.info("Built %s in %.1fs (CPU time: %.1fs, peak resident set size of a single process: %.2f GiB)",
+                      stage, secs, cpu_secs, float(rusage.ru_maxrss) / 1024 ** 2)
+
     def disable_sanitizer_tests(self):
         """Disable the tests of all the sanitizers by removing the test directories from the build system"""
         if LooseVersion(self.version) < LooseVersion('3.6'):
@@ -310,8 +386,12 @@ class EB_Clang(CMakeMake):
 
             apply_regex_substitutions(cmakelists_tests, regex_subs)
 
-    def build_with_prev_stage(self, prev_obj, next_obj):
-        """Build Clang stage N using Clang stage N-1"""
+    def build_with_prev_stage(self, prev_obj, next_obj, targets=None):
+        """
+        Build Clang stage N using Clang stage N-1
+
+        :param targets: list of targets to build in an intermediate stage (all targets are built if None)
+        """
 
         # Create and enter build directory.
         mkdir(next_obj)
@@ -324,13 +404,28 @@ class EB_Clang(CMakeMake):
         options = "-DCMAKE_INSTALL_PREFIX=%s " % self.installdir
         options += "-DCMAKE_C_COMPILER='%s' " % CC
         options += "-DCMAKE_CXX_COMPILER='%s' " % CXX
+        if self.generator:
+            options += "-G '%s' " % self.generator
+
+        # reuse TableGen binaries from stage 1, rather than building them again and using those
+        for (var, tblgen) in TABLEGEN_BINARIES:
+            tblgen_path = os.path.join(self.llvm_obj_dir_stage1, 'bin', tblgen)
+            if os.path.exists(tblgen_path) or self.dry_run:
+                options += "-D%s='%s' " % (var, tblgen_path)
+            else:
+                self.log.warning("%s not found in stage 1, so not setting $%s", tblgen_path, var)
+
+        # no need for tests, examples and docs in intermediate stage
+        if targets:
+            options += "-DLLVM_INCLUDE_TESTS=OFF -DLLVM_INCLUDE_EXAMPLES=OFF -DLLVM_INCLUDE_DOCS=OFF "
+
         options += self.cfg['configopts']
 
         self.log.info("Configuring")
         run_cmd("cmake %s %s" % (options, self.llvm_src_dir), log_all=True)
 
         self.log.info("Building")
-        run_cmd("make %s" % self.make_parallel_opts, log_all=True)
+        run_cmd("%s %s %s" % (self.build_tool(), self.make_parallel_opts, ' '.join(targets or [])), log_all=True)
 
     def run_clang_tests(self, obj_dir):
         """Run Clang tests in specified directory (unless disabled)."""
@@ -338,7 +433,14 @@ class EB_Clang(CMakeMake):
             change_dir(obj_dir)
 
             self.log.info("Running tests")
-            run_cmd("make %s check-all" % self.make_parallel_opts, log_all=True)
+            run_cmd("%s %s check-all" % (self.build_tool(), self.make_parallel_opts), log_all=True)
+
+    def test_intermediate_stages(self):
+        """
+        Determine whether intermediate stages should be tested when bootstrapping;
+        if not, only what is required to build the next stage is built in intermediate stages.
+        """
+        return self.cfg['test_intermediate_stages'] and not self.cfg['skip_all_tests']
 
     def build_step(self):
         """Build Clang stage 1, 2, 3"""
@@ -346,20 +448,44 @@ class EB_Clang(CMakeMake):
         # Stage 1: build using system compiler.
         self.log.info("Building stage 1")
         change_dir(self.llvm_obj_dir_stage1)
-        super(EB_Clang, self).build_step()
+
+        if self.cfg['bootstrap'] and not self.test_intermediate_stages():
+            # only build what is required to build the next stage in intermediate stages
+            # (incl. TableGen binaries in stage 1, which are reused in stage 2 & 3)
+            stage1_targets, stage2_targets = BOOTSTRAP_STAGE1_TARGETS, BOOTSTRAP_STAGE2_TARGETS
+        else:
+            stage1_targets, stage2_targets = None, None
+
+        # build stage 1 via parent build step, so prebuildopts/buildopts/compiler cache are taken into account
+        orig_buildopts = self.cfg['buildopts']
+        if stage1_targets:
+            self.cfg.update('buildopts', ' '.join(stage1_targets))
+        try:
+            self.run_stage('stage 1', lambda: super(EB_Clang, self).build_step())
+        finally:
+            self.cfg['buildopts'] = orig_buildopts
 
         if self.cfg['bootstrap']:
-            # Stage 1: run tests.
-            self.run_clang_tests(self.llvm_obj_dir_stage1)
+            # Stage 1: run tests (only possible if all targets were built).
+            if stage1_targets is None:
+                self.run_clang_tests(self.llvm_obj_dir_stage1)
 
             self.log.info("Building stage 2")
-            self.build_with_prev_stage(self.llvm_obj_dir_stage1, self.llvm_obj_dir_stage2)
-            self.run_clang_tests(self.llvm_obj_dir_stage2)
+            self.run_stage('stage 2', lambda: self.build_with_prev_stage(self.llvm_obj_dir_stage1,
+                                                                         self.llvm_obj_dir_stage2,
+                                                                         targets=stage2_targets))
+            if stage2_targets is None:
+                self.run_clang_tests(self.llvm_obj_dir_stage2)
 
             self.log.info("Building stage 3")
-            self.build_with_prev_stage(self.llvm_obj_dir_stage2, self.llvm_obj_dir_stage3)
+            self.run_stage('stage 3', lambda: self.build_with_prev_stage(self.llvm_obj_dir_stage2,
+                                                                         self.llvm_obj_dir_stage3))
             # Don't run stage 3 tests here, do it in the test step.
 
+        self.log.info("Build time, CPU time and peak resident set size of a single process, per stage:\n" +
+                      '\n'.join("* %s: %.1fs, %.1fs, %.2f GiB" % (stage, secs, cpu_secs, float(max_rss) / 1024 ** 2)
+                                for (stage, secs, cpu_secs, max_rss) in self.stage_stats))
+
     def test_step(self):
         """Run Clang tests."""
         if self.cfg['bootstrap']:
@@ -39,23 +39,55 @@ EasyBuild support for building and installing CP2K, implemented as an easyblock
 
 import fileinput
 import glob
+import json
 import re
 import os
 import sys
+import time
 from distutils.version import LooseVersion
 
 import easybuild.tools.toolchain as toolchain
+from easybuild.easyblocks.generic.paralleltasks import no_mpi_binding_cmd, run_tasks_parallel
 from easybuild.framework.easyblock import EasyBlock
 from easybuild.framework.easyconfig import CUSTOM
-from easybuild.tools.build_log import EasyBuildError
+from easybuild.tools.build_log import EasyBuildError, print_msg
 from easybuild.tools.environment import setvar
-from easybuild.tools.filetools import change_dir, copy_dir, copy_file, mkdir, write_file
-from easybuild.tools.config import build_option
+from easybuild.tools.filetools import change_dir, copy_dir, copy_file, mkdir, read_file, remove_dir, write_file
+from easybuild.tools.config import build_option, log_path
 from easybuild.tools.modules import get_software_root, get_software_version
 from easybuild.tools.run import run_cmd
 from easybuild.tools.systemtools import get_avail_core_count
 
 
+# default tolerance (relative error) for comparing test results with reference values (cfr. do_regtest)
+REGTEST_DEFAULT_TOLERANCE = 1.0E-14
+
+# name of JSON report for regression test, when using native regression test driver
+REGTEST_REPORT_FN = 'cp2k-regtest-report.json'
+
+REGTEST_DRIVERS = ['do_regtest', 'native']
+
+
+def parse_regtest_value(path, pattern, column):
+    """
+    Extract value from CP2K output file, from last line that matches specified pattern, in specified column
+    (cfr. 'grep <pattern> <path> | tail -1 | awk "{print $<column>}"' in do_regtest)
+
+    :return: extracted value (float), or None if no value could be extracted
+    """
+    res = None
+    if os.path.exists(path):
+        lines = [line for line in read_file(path).split('\n') if pattern in line]
+        if lines:
+            fields = lines[-1].split()
+            if len(fields) >= column:
+                try:
+                    res = float(fields[column - 1].replace('D', 'E').replace('d', 'e'))
+                except ValueError:
+                    pass
+    return res
+
+
 class EB_CP2K(EasyBlock):
     """
     Support for building CP2K
@@ -85,6 +117,10 @@ class EB_CP2K(EasyBlock):
 
         self.make_instructions = ''
 
+        if self.cfg['regtest_driver'] not in REGTEST_DRIVERS:
+            raise EasyBuildError("Unknown regression test driver specified: '%s', known drivers are %s",
+                                 self.cfg['regtest_driver'], REGTEST_DRIVERS)
+
     @staticmethod
     def extra_options():
         extra_vars = {
@@ -101,6 +137,11 @@ class EB_CP2K(EasyBlock):
             'runtest': [True, "Build and run CP2K tests", CUSTOM],
             'omp_num_threads': [None, "Value to set $OMP_NUM_THREADS to during testing", CUSTOM],
             'plumed': [None, "Enable PLUMED support", CUSTOM],
+            'regtest_driver': ['do_regtest', "Regression test driver to use: 'do_regtest' (script included with "
+                                             "CP2K) or 'native' (runs test directories concurrently across all "
+                                             "available cores, and produces a JSON report)", CUSTOM],
+            'regtest_mpi_ranks': [2, "Number of MPI ranks to use per test (only for native regression test driver)",
+                                  CUSTOM],
             'type': ['popt', "Type of build ('popt' or 'psmp')", CUSTOM],
             'typeopt': [True, "Enable optimization", CUSTOM],
         }
@@ -676,6 +717,10 @@ class EB_CP2K(EasyBlock):
                     regtest_refdir = d
                     break
 
+            if self.cfg['regtest_driver'] == 'native':
+                self.run_regtest_native(regtest_refdir)
+                return
+
             # location of do_regtest script
             cfg_fn = "cp2k_regtest.cfg"
             regtest_script = os.path.join(self.cfg['start_dir'], 'tools', 'regtesting', 'do_regtest')
@@ -795,6 +840,230 @@ class EB_CP2K(EasyBlock):
             # number of correct tests: just report
             test_report("CORRECT")
 
+    def det_regtest_dirs(self, testsdir, cp2k_exe, mpi_ranks):
+        """
+        Determine list of test directories to run, based on TEST_DIRS file;
+        test directories with requirements that are not met are skipped (cfr. do_regtest)
+
+        :param testsdir: path to 'tests' directory
+        :param cp2k_exe: path to CP2K executable
+        :param mpi_ranks: number of MPI ranks that will be used per test
+        """
+        # determine features CP2K was built with, from 'cp2kflags:' line in output of 'cp2k --version'
+        (out, _) = run_cmd("%s --version" % cp2k_exe, log_all=False, log_ok=False, simple=False)
+        res = re.search(r'^\s*cp2kflags:(.*)$', out, re.M)
+        if res:
+            cp2k_flags = res.group(1).split()
+        else:
+            cp2k_flags = []
+        self.log.info("Features supported by %s: %s", cp2k_exe, cp2k_flags)
+
+        test_dirs = []
+        for line in read_file(os.path.join(testsdir, 'TEST_DIRS')).split('\n'):
+            fields = line.split('#')[0].split()
+            if not fields:
+                continue
+            test_dir, reqs = fields[0], fields[1:]
+
+            unmet_reqs = []
+            for req in reqs:
+                mpiranks_req = re.match(r'^mpiranks\s*(==|>=|<=|>|<|%)\s*([0-9]+)$', req)
+                if mpiranks_req:
+                    op, val = mpiranks_req.group(1), int(mpiranks_req.group(2))
+                    ok = {
+                        '==': mpi_ranks == val,
+                        '>=': mpi_ranks >= val,
+                        '<=': mpi_ranks <= val,
+                        '>': mpi_ranks > val,
+                        '<': mpi_ranks < val,
+                        '%': mpi_ranks % val == 0,
+                    }[op]
+                else:
+                    ok = req in cp2k_flags
+                if not ok:
+                    unmet_reqs.append(req)
+
+            if unmet_reqs:
+                self.log.info("Skipping test directory %s, unmet requirements: %s", test_dir, unmet_reqs)
+            else:
+                test_dirs.append(test_dir)
+
+        return test_dirs
+
+    def run_regtest_dir(self, test_dir, workdir, refdir, test_types, cp2k_exe, mpi_ranks, omp_threads,
+                        no_binding=False):
+        """
+        Run all tests in specified test directory (one after the other, since tests may depend on each other).
+
+        :param no_binding: disable binding of MPI processes to cores (when test directories are run concurrently)
+        :return: list of dictionaries with result for each test
+        """
+        change_dir(workdir)
+        if omp_threads:
+            setvar('OMP_NUM_THREADS', str(omp_threads))
+
+        results = []
+        for line in read_file('TEST_FILES').split('\n'):
+            fields = line.split('#')[0].split()
+            if not fields:
+                continue
+
+            inp, test_type = fields[0], int(fields[1])
+            tolerance = REGTEST_DEFAULT_TOLERANCE
+            if len(fields) > 2:
+                tolerance = float(fields[2].replace('D', 'E'))
+
+            outfile = inp + '.out'
+            cmd = "%s > %s 2>&1" % (self.toolchain.mpi_cmd_for('%s %s' % (cp2k_exe, inp), mpi_ranks), outfile)
+            if no_binding:
+                cmd = no_mpi_binding_cmd(cmd)
+
+            start_time = time.time()
+            (_, ec) = run_cmd(cmd, log_all=False, log_ok=False, simple=False)
+            result = {
+                'dir': test_dir,
+                'input': inp,
+                'exit_code': ec,
+                'time': round(time.time() - start_time, 3),
+                'type': test_type,
+            }
+
+            if ec != 0:
+                result['status'] = 'FAILED'
+            elif test_type == 0:
+                result['status'] = 'CORRECT'
+            elif test_type not in test_types:
+                result['status'] = 'FAILED'
+                result['error'] = "unknown test type %s (not listed in TEST_TYPES)" % test_type
+            else:
+                pattern, column = test_types[test_type]
+                value = parse_regtest_value(outfile, pattern, column)
+
+                # reference value is either specified in TEST_FILES, or obtained from reference output
+                if len(fields) > 3:
+                    ref_value = float(fields[3].replace('D', 'E'))
+                elif refdir:
+                    ref_value = parse_regtest_value(os.path.join(refdir, test_dir, outfile), pattern, column)
+                else:
+                    ref_value = None
+
+                result.update({'value': value, 'ref_value': ref_value, 'tolerance': tolerance})
+                if value is None:
+                    result['status'] = 'FAILED'
+                elif ref_value is None:
+                    result['status'] = 'NEW'
+                else:
+                    if ref_value == 0:
+                        rel_error = abs(value)
+                    else:
+                        rel_error = abs((value - ref_value) / ref_value)
+                    result['rel_error'] = rel_error
+                    if rel_error > tolerance:
+                        result['status'] = 'WRONG'
+                    else:
+                        result['status'] = 'CORRECT'
+
+            results.append(result)
+
+        return results
+
+    def run_regtest_native(self, regtest_refdir):
+        """
+        Run regression test using native driver: test directories are run concurrently as separate MPI jobs,
+        using all available cores; results for each test are collected in a JSON report.
+        """
+        testsdir = os.path.join(self.cfg['start_dir'], 'tests')
+        cp2k_exe = os.path.join(self.cfg['start_dir'], 'exe', self.typearch, 'cp2k.%s' % self.cfg['type'])
+
+        mpi_ranks = self.cfg['regtest_mpi_ranks']
+        omp_threads = None
+        if self.cfg['type'] == 'psmp':
+            omp_threads = int(self.cfg['omp_num_threads'] or 1)
+        cores_per_job = mpi_ranks * (omp_threads or 1)
+        if get_avail_core_count() < cores_per_job:
+            raise EasyBuildError("Cannot run MPI tests as not enough cores (< %s) are available", cores_per_job)
+        max_jobs = max(1, self.cfg['parallel'] // cores_per_job)
+
+        # types of tests: pattern to search for in output + column that holds value to compare
+        test_types = {}
+        lines = [x for x in read_file(os.path.join(testsdir, 'TEST_TYPES')).split('\n') if x.strip()]
+        for idx, line in enumerate(lines[1:int(lines[0].split()[0]) + 1]):
+            pattern, column = line.rsplit('!', 1)
+            test_types[idx + 1] = (pattern, int(column))
+
+        refdir = None
+        if regtest_refdir:
+            refdir = os.path.join(self.builddir, regtest_refdir)
+
+        # copy of tests directory in which tests are run
+        testdir_base = os.path.dirname(os.path.normpath(self.cfg['start_dir']))
+        workdir = os.path.join(testdir_base, 'TEST-%s-%s-native' % (self.typearch, self.cfg['type']))
+        if os.path.exists(workdir):
+            remove_dir(workdir)
+        copy_dir(testsdir, workdir)
+
+        test_dirs = self.det_regtest_dirs(testsdir, cp2k_exe, mpi_ranks)
+
+        report_path = os.path.join(workdir, REGTEST_REPORT_FN)
+        report = {
+            'cp2k': cp2k_exe,
+            'mpi_ranks': mpi_ranks,
+            'omp_threads': omp_threads,
+            'reference': regtest_refdir,
+            'tests': [],
+        }
+
+        def run_dir(test_dir):
+            """Run tests in specified test directory, always returns a list of results."""
+            try:
+                return self.run_regtest_dir(test_dir, os.path.join(workdir, test_dir), refdir, test_types,
+                                            cp2k_exe, mpi_ranks, omp_threads, no_binding=max_jobs > 1)
+            except (EasyBuildError, IOError, OSError, ValueError) as err:
+                return [{'dir': test_dir, 'input': None, 'status': 'FAILED', 'time': 0, 'error': str(err)}]
+
+        def add_results(test_dir, results):
+            """Add results for completed test directory to report."""
+            report['tests'].extend(results)
+            write_file(report_path, json.dumps(report, indent=4, sort_keys=True))
+
+        tasks = [(test_dir, lambda d=test_dir: run_dir(d)) for test_dir in test_dirs]
+
+        print_msg("running %d CP2K regression test directories (%d jobs at a time, %d MPI ranks each)..." %
+                  (len(tasks), max_jobs, mpi_ranks), silent=self.silent)
+        run_tasks_parallel(tasks, max_jobs, logfile=self.logfile, done_callback=add_results)
+
+        # sort results in order of test directories, and determine summary
+        report['tests'].sort(key=lambda x: test_dirs.index(x['dir']))
+        report['summary'] = {}
+        for status in ['CORRECT', 'WRONG', 'FAILED', 'NEW']:
+            report['summary'][status] = len([x for x in report['tests'] if x['status'] == status])
+        write_file(report_path, json.dumps(report, indent=4, sort_keys=True))
+        self.log.info("Regression test report written to %s", report_path)
+
+        slowest = sorted(report['tests'], key=lambda x: x['time'], reverse=True)[:10]
+        slowest = ["%8.1fs %s/%s" % (x['time'], x['dir'], x['input']) for x in slowest]
+        self.log.info("Slowest tests:\n%s", '\n'.join(slowest))
+        for test in report['tests']:
+            if test['status'] in ['WRONG', 'FAILED']:
+                self.log.warning("Regression test %s/%s: %s", test['dir'], test['input'], test['status'])
+
+        tot_cnt = len(report['tests'])
+        for status in ['FAILED', 'WRONG', 'NEW', 'CORRECT']:
+            cnt = report['summary'][status]
+            msg = "Regression test reported %s / %s %s tests" % (cnt, tot_cnt, status.lower())
+            # failed tests indicate problem with installation
+            # wrong tests are only an issue when there are excessively many
+            if (status == 'FAILED' and cnt > 0) or (status == 'WRONG' and tot_cnt and float(cnt) / tot_cnt > 0.1):
+                if self.cfg['ignore_regtest_fails']:
+                    self.log.warning(msg)
+                    self.log.info("Ignoring failures in regression test, as requested.")
+                else:
+                    raise EasyBuildError(msg)
+            elif status == 'CORRECT' or cnt == 0:
+                self.log.info(msg)
+            else:
+                self.log.warning(msg)
+
     def install_step(self):
         """Install built CP2K
         - copy from exe to bin
@@ -855,6 +1124,13 @@ class EB_CP2K(EasyBlock):
             except (OSError, IOError) as err:
                 raise EasyBuildError("Failed to copy regression test results dir: %s", err)
 
+            # copy report produced by native regression test driver to log directory in installation directory
+            testdir_base = os.path.dirname(os.path.normpath(self.cfg['start_dir']))
+            report_path = os.path.join(testdir_base, 'TEST-%s-%s-native' % (self.typearch, self.cfg['type']),
+                                       REGTEST_REPORT_FN)
+            if self.cfg['regtest_driver'] == 'native' and os.path.exists(report_path):
+                copy_file(report_path, os.path.join(self.installdir, log_path(), REGTEST_REPORT_FN))
+
     def sanity_check_step(self):
         """Custom sanity check for CP2K"""
 
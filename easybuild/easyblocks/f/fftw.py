@@ -27,14 +27,17 @@ EasyBuild support for building and installing FFTW, implemented as an easyblock
 
 @author: Kenneth Hoste (HPC-UGent)
 """
+import os
 from distutils.version import LooseVersion
 
 import easybuild.tools.toolchain as toolchain
 from easybuild.easyblocks.generic.configuremake import ConfigureMake
+from easybuild.easyblocks.generic.paralleltasks import run_tasks_parallel, split_parallelism
 from easybuild.framework.easyconfig import CUSTOM
 from easybuild.toolchains.compiler.gcc import TC_CONSTANT_GCC
-from easybuild.tools.build_log import EasyBuildError
+from easybuild.tools.build_log import EasyBuildError, print_msg
 from easybuild.tools.config import build_option
+from easybuild.tools.filetools import change_dir, mkdir
 from easybuild.tools.modules import get_software_version
 from easybuild.tools.systemtools import AARCH32, AARCH64, POWER, X86_64
 from easybuild.tools.systemtools import get_cpu_architecture, get_cpu_features, get_shared_lib_ext
@@ -63,6 +66,9 @@ class EB_FFTW(ConfigureMake):
         """Custom easyconfig parameters for FFTW."""
         extra_vars = {
             'auto_detect_cpu_features': [True, "Auto-detect available CPU features, and configure accordingly", CUSTOM],
+            'parallel_precisions': [False, "Configure and build libraries for different precisions concurrently, "
+                                           "in separate build directories (installation is done one after the other)",
+                                    CUSTOM],
             'use_fma': [None, "Configure with --enable-avx-128-fma (DEPRECATED, use 'use_fma4' instead)", CUSTOM],
             'with_mpi': [True, "Enable building of FFTW MPI library", CUSTOM],
             'with_openmp': [True, "Enable building of FFTW OpenMP library", CUSTOM],
@@ -89,6 +95,10 @@ class EB_FFTW(ConfigureMake):
         """Initialisation of custom class variables for FFTW."""
         super(EB_FFTW, self).__init__(*args, **kwargs)
 
+        # list of (precision, configure options) tuples for precisions that are built concurrently,
+        # only used when 'parallel_precisions' is enabled
+        self.prec_variants = []
+
         # do not enable MPI if the toolchain does not support it
         if not self.toolchain.mpi_family():
             self.log.info("Disabling MPI support because the toolchain used does not support it.")
@@ -152,6 +162,7 @@ class EB_FFTW(ConfigureMake):
         common_config_opts = self.cfg['configopts']
 
         self.cfg['configopts'] = []
+        prec_variants = []
 
         for prec in FFTW_PRECISION_FLAGS:
             if self.cfg[EB_FFTW._prec_param(prec)]:
@@ -208,12 +219,67 @@ class EB_FFTW(ConfigureMake):
                         prec_configopts.append('--disable-vsx')
 
                 # append additional configure options (may be empty string, but that's OK)
-                self.cfg.update('configopts', [' '.join(prec_configopts) + ' ' + common_config_opts])
+                prec_variants.append((prec, ' '.join(prec_configopts) + ' ' + common_config_opts))
 
-        self.log.debug("List of configure options to iterate over: %s", self.cfg['configopts'])
+        if self.cfg['parallel_precisions'] and len(prec_variants) > 1 and not self.dry_run:
+            # no iterating over configure options, libraries for all precisions are built concurrently
+            self.prec_variants = prec_variants
+            self.cfg['configopts'] = common_config_opts
+            self.log.debug("Configure options for precisions to build concurrently: %s", self.prec_variants)
+        else:
+            self.cfg['configopts'] = [x[1] for x in prec_variants]
+            self.log.debug("List of configure options to iterate over: %s", self.cfg['configopts'])
 
         return super(EB_FFTW, self).run_all_steps(*args, **kwargs)
 
+    def prec_builddir(self, prec):
+        """Return path to (out-of-tree) build directory for specified precision."""
+        return os.path.join(self.builddir, 'easybuild_obj_%s' % prec)
+
+    def configure_step(self):
+        """
+        Custom configure step for FFTW: configuring is done in the build step when building
+        for different precisions concurrently.
+        """
+        if self.prec_variants:
+            self.log.info("Configuring for precisions %s is done concurrently in build step",
+                          ', '.join(x[0] for x in self.prec_variants))
+        else:
+            super(EB_FFTW, self).configure_step()
+
+    def build_step(self):
+        """
+        Custom build step for FFTW: configure and build for different precisions concurrently (if enabled),
+        splitting available parallelism across precisions
+        """
+        if not self.prec_variants:
+            super(EB_FFTW, self).build_step()
+            return
+
+        srcdir = self.cfg['start_dir']
+        max_workers, prec_parallel = split_parallelism(self.cfg['parallel'], len(self.prec_variants))
+
+        def configure_build(prec, configopts):
+            """Configure and build for specified precision (in separate process)."""
+            mkdir(self.prec_builddir(prec), parents=True)
+            change_dir(self.prec_builddir(prec))
+            self.cfg['configopts'] = configopts
+            self.cfg['parallel'] = prec_parallel
+            super(EB_FFTW, self).configure_step(cmd_prefix=os.path.join(srcdir, ''))
+            super(EB_FFTW, self).build_step()
+
+        tasks = [(prec, lambda p=prec, c=opts: configure_build(p, c)) for (prec, opts) in self.prec_variants]
+
+        print_msg("building for %d precisions in parallel (max. %d at a time, using %d cores each)..." %
+                  (len(tasks), max_workers, prec_parallel), silent=self.silent)
+        res = run_tasks_parallel(tasks, max_workers, logfile=self.logfile)
+
+        for prec, _ in self.prec_variants:
+            self.log.info("Configuring and building for %s precision took %.1f seconds (CPU time: %.1f seconds)",
+                          prec, res[prec]['time'], res[prec]['cpu_time'])
+
+        change_dir(srcdir)
+
     def test_step(self):
         """Custom implementation of test step for FFTW."""
 
@@ -226,7 +292,23 @@ class EB_FFTW(ConfigureMake):
                 if 'OMPI_MCA_rmaps_base_oversubscribe' not in self.cfg['pretestopts']:
                     self.cfg.update('pretestopts', "export OMPI_MCA_rmaps_base_oversubscribe=true && ")
 
-        super(EB_FFTW, self).test_step()
+        if self.prec_variants:
+            for prec, _ in self.prec_variants:
+                change_dir(self.prec_builddir(prec))
+                super(EB_FFTW, self).test_step()
+            change_dir(self.cfg['start_dir'])
+        else:
+            super(EB_FFTW, self).test_step()
+
+    def install_step(self):
+        """Custom install step for FFTW: install for different precisions one by one (if built concurrently)."""
+        if self.prec_variants:
+            for prec, _ in self.prec_variants:
+                change_dir(self.prec_builddir(prec))
+                super(EB_FFTW, self).install_step()
+            change_dir(self.cfg['start_dir'])
+        else:
+            super(EB_FFTW, self).install_step()
 
     def sanity_check_step(self):
         """Custom sanity check for FFTW."""
@@ -33,15 +33,18 @@ EasyBuild support for building and installing GCC, implemented as an easyblock
 @author: Toon Willems (Ghent University)
 @author: Ward Poelmans (Ghent University)
 """
+import functools
 import glob
 import os
 import re
 import shutil
+import time
 from copy import copy
 from distutils.version import LooseVersion
 
 import easybuild.tools.environment as env
 from easybuild.easyblocks.generic.configuremake import ConfigureMake
+from easybuild.easyblocks.generic.paralleltasks import det_max_concurrency, run_tasks_parallel, split_parallelism
 from easybuild.framework.easyconfig import CUSTOM
 from easybuild.tools.build_log import EasyBuildError
 from easybuild.tools.config import build_option
@@ -60,6 +63,60 @@ COMP_CMD_SYMLINKS = {
     'f95': 'gfortran',
 }
 
+# supported build modes: plain build with the system compiler (no bootstrap), regular 3-stage bootstrap,
+# profile-guided bootstrap, or bootstrap with LTO (bootstrap-lto build config)
+BUILD_MODE_PLAIN = 'plain'
+BUILD_MODE_BOOTSTRAP = 'bootstrap'
+BUILD_MODE_PROFILED = 'profiledbootstrap'
+BUILD_MODE_LTO = 'lto'
+BUILD_MODES = [BUILD_MODE_PLAIN, BUILD_MODE_BOOTSTRAP, BUILD_MODE_PROFILED, BUILD_MODE_LTO]
+
+
+def det_build_mode(build_mode, profiled, withlto):
+    """
+    Determine build mode to use for GCC, and check whether it is compatible with other relevant easyconfig parameters.
+
+    :param build_mode: build mode specified via 'build_mode' easyconfig parameter (None for default)
+    :param profiled: value for 'profiled' easyconfig parameter
+    :param withlto: value for 'withlto' easyconfig parameter
+    :return: build mode to use
+    """
+    if build_mode is None:
+        build_mode = BUILD_MODE_PROFILED if profiled else BUILD_MODE_BOOTSTRAP
+    elif build_mode not in BUILD_MODES:
+        raise EasyBuildError("Unknown build mode '%s' specified, should be one of: %s",
+                             build_mode, ', '.join(BUILD_MODES))
+    elif profiled and build_mode != BUILD_MODE_PROFILED:
+        raise EasyBuildError("Build mode '%s' conflicts with 'profiled' being enabled", build_mode)
+
+    if build_mode == BUILD_MODE_LTO and not withlto:
+        raise EasyBuildError("Build mode '%s' requires that LTO support is enabled (withlto)", BUILD_MODE_LTO)
+
+    return build_mode
+
+
+def det_stage2_deps(libs, clooguseisl):
+    """
+    Determine dependencies between libraries to build in stage 2 of a staged build.
+
+    :param libs: list of libraries to build in stage 2
+    :param clooguseisl: value for 'clooguseisl' easyconfig parameter
+    :return: dict with list of libraries that each library depends on
+    """
+    deps = {}
+    for lib in libs:
+        if lib != 'gmp':
+            deps[lib] = ['gmp']
+
+    if 'cloog' in deps:
+        if clooguseisl:
+            if 'isl' in libs:
+                deps['cloog'].append('isl')
+        elif 'ppl' in libs:
+            deps['cloog'].append('ppl')
+
+    return deps
+
 
 class EB_GCC(ConfigureMake):
     """
@@ -70,6 +127,10 @@ class EB_GCC(ConfigureMake):
     @staticmethod
     def extra_options():
         extra_vars = {
+            'bootstrap_lean': [False, "Remove object files of earlier bootstrap stages as soon as they are "
+                                      "no longer needed, to limit disk usage (bootstrap-lean)", CUSTOM],
+            'build_mode': [None, "Build mode, one of: %s (default: '%s', or '%s' if 'profiled' is enabled)" %
+                           (', '.join(BUILD_MODES), BUILD_MODE_BOOTSTRAP, BUILD_MODE_PROFILED), CUSTOM],
             'clooguseisl': [False, "Use ISL with CLooG or not", CUSTOM],
             'generic': [None, "Build GCC and support libraries such that it runs on all processors of the target "
                               "architecture (use False to enforce non-generic regardless of configuration)", CUSTOM],
@@ -92,6 +153,8 @@ class EB_GCC(ConfigureMake):
 
         self.stagedbuild = False
 
+        self.build_mode = det_build_mode(self.cfg['build_mode'], self.cfg['profiled'], self.cfg['withlto'])
+
         # need to make sure version is an actual version
         # required because of support in SystemCompiler generic easyblock to specify 'system' as version,
         # which results in deriving the actual compiler version
@@ -115,6 +178,35 @@ class EB_GCC(ConfigureMake):
 
         self.platform_lib = get_platform_name(withversion=True)
 
+    def det_bootstrap_configopts(self):
+        """Determine configure options related to bootstrapping, for build mode being used."""
+        if self.build_mode == BUILD_MODE_PLAIN:
+            configopts = " --disable-bootstrap "
+        else:
+            configopts = " --enable-bootstrap "
+            if self.build_mode == BUILD_MODE_LTO:
+                # build compiler with -flto in stage 2 and 3
+                configopts += "--with-build-config=bootstrap-lto "
+        return configopts
+
+    def det_build_target(self):
+        """Determine make target to use for build mode being used."""
+        if self.build_mode == BUILD_MODE_PLAIN:
+            target = ''
+            if self.cfg['bootstrap_lean']:
+                self.log.info("Ignoring 'bootstrap_lean', not relevant for build mode '%s'", self.build_mode)
+        else:
+            if self.build_mode == BUILD_MODE_PROFILED:
+                target = 'profiledbootstrap'
+            else:
+                target = 'bootstrap'
+
+            # object files of earlier stages are deleted as soon as they are no longer needed with *-lean targets
+            if self.cfg['bootstrap_lean']:
+                target += '-lean'
+
+        return target
+
     def create_dir(self, dirname):
         """
         Create a dir to build in.
@@ -345,9 +437,9 @@ class EB_GCC(ConfigureMake):
         else:
             self.configopts += " --enable-gold --enable-ld=default"
 
-        # enable bootstrap build for self-containment (unless for staged build)
+        # enable bootstrap build for self-containment (unless for staged build, or when doing a plain build)
         if not self.stagedbuild:
-            configopts += " --enable-bootstrap"
+            configopts += self.det_bootstrap_configopts()
         else:
             configopts += " --disable-bootstrap"
 
@@ -396,6 +488,112 @@ class EB_GCC(ConfigureMake):
 
         self.disable_lto_mpfr_old_gcc(objdir)
 
+    def set_stage2_gmp_cppflags(self, stage2prefix):
+        """Update $CPPFLAGS to make sure correct GMP (built in stage 2) is found."""
+        libpath = os.path.join(stage2prefix, 'lib')
+        incpath = os.path.join(stage2prefix, 'include')
+
+        cppflags = os.getenv('CPPFLAGS', '')
+        env.setvar('CPPFLAGS', "%s -L%s -I%s " % (cppflags, libpath, incpath))
+
+    def build_stage2_lib(self, lib, stage2prefix, paracmd):
+        """
+        Configure, build and install specified library in stage 2 of a staged build.
+
+        :param lib: name of library to build
+        :param stage2prefix: installation prefix for stage 2
+        :param paracmd: option for make to control parallelism
+        """
+        self.log.debug("Building %s in stage 2" % lib)
+
+        libdir = os.path.join(stage2prefix, lib)
+        try:
+            os.chdir(libdir)
+        except OSError as err:
+            raise EasyBuildError("Failed to change to %s: %s", libdir, err)
+
+        if lib == "gmp":
+            cmd = "./configure --prefix=%s " % stage2prefix
+            cmd += "--with-pic --disable-shared --enable-cxx "
+
+            # ensure generic build when 'generic' is set to True or when --optarch=GENERIC is used
+            # non-generic build can be enforced with generic=False if --optarch=GENERIC is used
+            optarch_generic = build_option('optarch') == OPTARCH_GENERIC
+            if self.cfg['generic'] or (optarch_generic and self.cfg['generic'] is not False):
+                cmd += "--enable-fat "
+
+        elif lib == "ppl":
+            cmd = "./configure --prefix=%s --with-pic -disable-shared " % stage2prefix
+            # only enable C/C++ interfaces (Java interface is sometimes troublesome)
+            cmd += "--enable-interfaces='c c++' "
+
+            # enable watchdog (or not)
+            if self.pplver <= LooseVersion("0.11"):
+                if self.cfg['pplwatchdog']:
+                    cmd += "--enable-watchdog "
+                else:
+                    cmd += "--disable-watchdog "
+            elif self.cfg['pplwatchdog']:
+                raise EasyBuildError("Enabling PPL watchdog only supported in PPL <= v0.11 .")
+
+            # make sure GMP we just built is found
+            cmd += "--with-gmp=%s " % stage2prefix
+        elif lib == "isl":
+            cmd = "./configure --prefix=%s --with-pic --disable-shared " % stage2prefix
+            cmd += "--with-gmp=system --with-gmp-prefix=%s " % stage2prefix
+
+            # ensure generic build when 'generic' is set to True or when --optarch=GENERIC is used
+            # non-generic build can be enforced with generic=False if --optarch=GENERIC is used
+            optarch_generic = build_option('optarch') == OPTARCH_GENERIC
+            if self.cfg['generic'] or (optarch_generic and self.cfg['generic'] is not False):
+                cmd += "--without-gcc-arch "
+
+        elif lib == "cloog":
+            v0_15 = LooseVersion("0.15")
+            v0_16 = LooseVersion("0.16")
+
+            cmd = "./configure --prefix=%s --with-pic --disable-shared " % stage2prefix
+
+            # use ISL or PPL
+            if self.cfg['clooguseisl']:
+                if self.cfg['withisl']:
+                    self.log.debug("Using external ISL for CLooG")
+                    cmd += "--with-isl=system --with-isl-prefix=%s " % stage2prefix
+                elif self.cloogver >= v0_16:
+                    self.log.debug("Using bundled ISL for CLooG")
+                    cmd += "--with-isl=bundled "
+                else:
+                    raise EasyBuildError("Using ISL is only supported in CLooG >= v0.16 (detected v%s).",
+                                         self.cloogver)
+            else:
+                if self.cloogname == "cloog-ppl" and self.cloogver >= v0_15 and self.cloogver < v0_16:
+                    cmd += "--with-ppl=%s " % stage2prefix
+                else:
+                    errormsg = "PPL only supported with CLooG-PPL v0.15.x (detected v%s)" % self.cloogver
+                    errormsg += "\nNeither using PPL or ISL-based ClooG, I'm out of options..."
+                    raise EasyBuildError(errormsg)
+
+            # make sure GMP is found
+            if self.cloogver >= v0_15 and self.cloogver < v0_16:
+                cmd += "--with-gmp=%s " % stage2prefix
+            elif self.cloogver >= v0_16:
+                cmd += "--with-gmp=system --with-gmp-prefix=%s " % stage2prefix
+            else:
+                raise EasyBuildError("Don't know how to specify location of GMP to configure of CLooG v%s.",
+                                     self.cloogver)
+        else:
+            raise EasyBuildError("Don't know how to configure for %s", lib)
+
+        # configure
+        self.run_configure_cmd(cmd)
+
+        # build and 'install'
+        cmd = "make %s" % paracmd
+        run_cmd(cmd, log_all=True, simple=True)
+
+        cmd = "make install"
+        run_cmd(cmd, log_all=True, simple=True)
+
     def build_step(self):
 
         if self.stagedbuild:
@@ -433,109 +631,37 @@ class EB_GCC(ConfigureMake):
             stage2_info = self.prep_extra_src_dirs("stage2", target_prefix=stage2prefix)
             configopts = stage2_info['configopts']
 
-            # build PPL and CLooG (GMP as dependency)
-
-            for lib in ["gmp"] + self.with_dirs:
-                self.log.debug("Building %s in stage 2" % lib)
-                if lib == "gmp" or self.cfg['with%s' % lib]:
-                    libdir = os.path.join(stage2prefix, lib)
-                    try:
-                        os.chdir(libdir)
-                    except OSError as err:
-                        raise EasyBuildError("Failed to change to %s: %s", libdir, err)
-                    if lib == "gmp":
-                        cmd = "./configure --prefix=%s " % stage2prefix
-                        cmd += "--with-pic --disable-shared --enable-cxx "
-
-                        # ensure generic build when 'generic' is set to True or when --optarch=GENERIC is used
-                        # non-generic build can be enforced with generic=False if --optarch=GENERIC is used
-                        optarch_generic = build_option('optarch') == OPTARCH_GENERIC
-                        if self.cfg['generic'] or (optarch_generic and self.cfg['generic'] is not False):
-                            cmd += "--enable-fat "
-
-                    elif lib == "ppl":
-                        self.pplver = LooseVersion(stage2_info['versions']['ppl'])
-
-                        cmd = "./configure --prefix=%s --with-pic -disable-shared " % stage2prefix
-                        # only enable C/C++ interfaces (Java interface is sometimes troublesome)
-                        cmd += "--enable-interfaces='c c++' "
-
-                        # enable watchdog (or not)
-                        if self.pplver <= LooseVersion("0.11"):
-                            if self.cfg['pplwatchdog']:
-                                cmd += "--enable-watchdog "
-                            else:
-                                cmd += "--disable-watchdog "
-                        elif self.cfg['pplwatchdog']:
-                            raise EasyBuildError("Enabling PPL watchdog only supported in PPL <= v0.11 .")
-
-                        # make sure GMP we just built is found
-                        cmd += "--with-gmp=%s " % stage2prefix
-                    elif lib == "isl":
-                        cmd = "./configure --prefix=%s --with-pic --disable-shared " % stage2prefix
-                        cmd += "--with-gmp=system --with-gmp-prefix=%s " % stage2prefix
-
-                        # ensure generic build when 'generic' is set to True or when --optarch=GENERIC is used
-                        # non-generic build can be enforced with generic=False if --optarch=GENERIC is used
-                        optarch_generic = build_option('optarch') == OPTARCH_GENERIC
-                        if self.cfg['generic'] or (optarch_generic and self.cfg['generic'] is not False):
-                            cmd += "--without-gcc-arch "
-
-                    elif lib == "cloog":
-                        self.cloogname = stage2_info['names']['cloog']
-                        self.cloogver = LooseVersion(stage2_info['versions']['cloog'])
-                        v0_15 = LooseVersion("0.15")
-                        v0_16 = LooseVersion("0.16")
-
-                        cmd = "./configure --prefix=%s --with-pic --disable-shared " % stage2prefix
-
-                        # use ISL or PPL
-                        if self.cfg['clooguseisl']:
-                            if self.cfg['withisl']:
-                                self.log.debug("Using external ISL for CLooG")
-                                cmd += "--with-isl=system --with-isl-prefix=%s " % stage2prefix
-                            elif self.cloogver >= v0_16:
-                                self.log.debug("Using bundled ISL for CLooG")
-                                cmd += "--with-isl=bundled "
-                            else:
-                                raise EasyBuildError("Using ISL is only supported in CLooG >= v0.16 (detected v%s).",
-                                                     self.cloogver)
-                        else:
-                            if self.cloogname == "cloog-ppl" and self.cloogver >= v0_15 and self.cloogver < v0_16:
-                                cmd += "--with-ppl=%s " % stage2prefix
-                            else:
-                                errormsg = "PPL only supported with CLooG-PPL v0.15.x (detected v%s)" % self.cloogver
-                                errormsg += "\nNeither using PPL or ISL-based ClooG, I'm out of options..."
-                                raise EasyBuildError(errormsg)
-
-                        # make sure GMP is found
-                        if self.cloogver >= v0_15 and self.cloogver < v0_16:
-                            cmd += "--with-gmp=%s " % stage2prefix
-                        elif self.cloogver >= v0_16:
-                            cmd += "--with-gmp=system --with-gmp-prefix=%s " % stage2prefix
-                        else:
-                            raise EasyBuildError("Don't know how to specify location of GMP to configure of CLooG v%s.",
-                                                 self.cloogver)
-                    else:
-                        raise EasyBuildError("Don't know how to configure for %s", lib)
-
-                    # configure
-                    self.run_configure_cmd(cmd)
-
-                    # build and 'install'
-                    cmd = "make %s" % paracmd
-                    run_cmd(cmd, log_all=True, simple=True)
-
-                    cmd = "make install"
-                    run_cmd(cmd, log_all=True, simple=True)
+            # build PPL and CLooG (GMP as dependency);
+            # libraries are built concurrently where dependencies allow it, sharing the available cores
+            libs = [lib for lib in ["gmp"] + self.with_dirs if lib == "gmp" or self.cfg['with%s' % lib]]
+
+            # determine versions in current process, since these are also required in stage 3
+            if 'ppl' in libs:
+                self.pplver = LooseVersion(stage2_info['versions']['ppl'])
+            if 'cloog' in libs:
+                self.cloogname = stage2_info['names']['cloog']
+                self.cloogver = LooseVersion(stage2_info['versions']['cloog'])
+
+            deps = det_stage2_deps(libs, self.cfg['clooguseisl'])
+
+            # GMP is built first, on its own (all other libraries depend on it), using all available cores;
+            # available cores are split across the other libraries that can actually be built concurrently
+            max_workers, parallel = split_parallelism(self.cfg['parallel'] or 1, det_max_concurrency(libs, deps))
+            tasks = []
+            for lib in libs:
+                if lib == 'gmp':
+                    lib_paracmd = "-j %s" % (self.cfg['parallel'] or 1)
+                else:
+                    lib_paracmd = "-j %s" % parallel
+                tasks.append((lib, functools.partial(self.build_stage2_lib, lib, stage2prefix, lib_paracmd)))
 
-                    if lib == "gmp":
-                        # make sure correct GMP is found
-                        libpath = os.path.join(stage2prefix, 'lib')
-                        incpath = os.path.join(stage2prefix, 'include')
+            def gmp_done(lib, _):
+                """Make sure GMP built in stage 2 is found, once it is installed (before other libraries are built)."""
+                if lib == 'gmp':
+                    self.set_stage2_gmp_cppflags(stage2prefix)
 
-                        cppflags = os.getenv('CPPFLAGS', '')
-                        env.setvar('CPPFLAGS', "%s -L%s -I%s " % (cppflags, libpath, incpath))
+            self.log.info("Building %s in stage 2 (max. %d at a time)", ', '.join(libs), max_workers)
+            run_tasks_parallel(tasks, max_workers, deps=deps, logfile=self.logfile, done_callback=gmp_done)
 
             #
             # STAGE 3: bootstrap build of final GCC (with PPL/CLooG support)
@@ -552,8 +678,8 @@ class EB_GCC(ConfigureMake):
             configopts = stage3_info['configopts']
             configopts += " --prefix=%(p)s --with-local-prefix=%(p)s" % {'p': self.installdir}
 
-            # enable bootstrapping for self-containment
-            configopts += " --enable-bootstrap "
+            # enable bootstrapping for self-containment (unless when doing a plain build)
+            configopts += self.det_bootstrap_configopts()
 
             # PPL config options
             if self.cfg['withppl']:
@@ -588,14 +714,16 @@ class EB_GCC(ConfigureMake):
             cmd = "../configure %s %s" % (self.configopts, configopts)
             self.run_configure_cmd(cmd)
 
-        # build with bootstrapping for self-containment
-        if self.cfg['profiled']:
-            self.cfg.update('buildopts', 'profiledbootstrap')
-        else:
-            self.cfg.update('buildopts', 'bootstrap')
+        # build with bootstrapping for self-containment (unless when doing a plain build)
+        build_target = self.det_build_target()
+        if build_target:
+            self.cfg.update('buildopts', build_target)
 
         # call standard build_step
+        start_time = time.time()
         super(EB_GCC, self).build_step()
+        self.log.info("Self-build of GCC using build mode '%s' (make target: '%s') took %.1fs",
+                      self.build_mode, build_target, time.time() - start_time)
 
     # make install is just standard install_step, nothing special there
 
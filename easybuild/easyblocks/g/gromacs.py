@@ -33,25 +33,132 @@ EasyBuild support for building and installing GROMACS, implemented as an easyblo
 @author: Oliver Stueker (Compute Canada/ACENET)
 @author: Davide Vanzo (Vanderbilt University)
 """
+import functools
 import glob
 import os
 import re
 import shutil
+import stat
+import tempfile
 from distutils.version import LooseVersion
 
 import easybuild.tools.environment as env
 import easybuild.tools.toolchain as toolchain
 from easybuild.easyblocks.generic.configuremake import ConfigureMake
 from easybuild.easyblocks.generic.cmakemake import CMakeMake
+from easybuild.easyblocks.generic.paralleltasks import run_tasks_parallel, split_parallelism
 from easybuild.framework.easyconfig import CUSTOM
-from easybuild.tools.build_log import EasyBuildError, print_warning
+from easybuild.tools.build_log import EasyBuildError, print_msg, print_warning
 from easybuild.tools.config import build_option
-from easybuild.tools.filetools import download_file, extract_file, which
+from easybuild.tools.filetools import adjust_permissions, change_dir, copy_file, download_file, extract_file, mkdir
+from easybuild.tools.filetools import move_file, remove_dir, which, write_file
 from easybuild.tools.modules import get_software_libdir, get_software_root, get_software_version
 from easybuild.tools.run import run_cmd
 from easybuild.tools.toolchain.compiler import OPTARCH_GENERIC
 from easybuild.tools.systemtools import X86_64, get_cpu_architecture, get_shared_lib_ext, get_cpu_features
 
+# GMX_SIMD levels supported for multi-SIMD installations (best first),
+# with CPU flags (as listed in /proc/cpuinfo) that are required to use them
+GMX_SIMD_CPU_FLAGS = [
+    ('AVX_512_KNL', ['avx512f', 'avx512er', 'avx512pf']),
+    ('AVX_512', ['avx512f', 'avx512cd', 'avx512bw', 'avx512dq', 'avx512vl']),
+    ('AVX2_256', ['avx2', 'fma']),
+    ('AVX2_128', ['avx2', 'fma']),
+    ('AVX_256', ['avx']),
+    ('AVX_128_FMA', ['avx', 'fma4']),
+    ('SSE4.1', ['sse4_1']),
+    ('SSE2', ['sse2']),
+    ('ARM_NEON_ASIMD', ['asimd']),
+]
+
+# subdirectory of bin/ for binaries of default build in multi-SIMD installations
+GMX_SIMD_DEFAULT_SUBDIR = 'default'
+
+# launcher script for multi-SIMD installations, which picks the binary for the best supported GMX_SIMD level
+GMX_SIMD_LAUNCHER_TEMPLATE = """#!/bin/sh
+# launcher for %(binary)s, picks binary for best GMX_SIMD level supported by CPU (generated by EasyBuild)
+bindir=$(cd "$(dirname "$0")" && pwd)
+cpu_flags=" $(grep -m 1 -E '^(flags|Features)' /proc/cpuinfo 2> /dev/null | cut -d: -f2) "
+
+has_cpu_flags() {
+    for flag in "$@"; do
+        case "$cpu_flags" in
+            *" $flag "*) ;;
+            *) return 1 ;;
+        esac
+    done
+    return 0
+}
+%(checks)s
+exec "$bindir/%(default_subdir)s/%(binary)s" "$@"
+"""
+GMX_SIMD_LAUNCHER_CHECK_TEMPLATE = """
+if has_cpu_flags %(flags)s && [ -x "$bindir/%(simd)s/%(binary)s" ]; then
+    exec "$bindir/%(simd)s/%(binary)s" "$@"
+fi"""
+
+# regular expression for names of GROMACS binaries that are installed for each GMX_SIMD level
+GMX_SIMD_BINARY_REGEX = re.compile(r'^gmx(_mpi)?(_d)?$')
+
+# marker included in header of generated launcher scripts, to recognise them
+GMX_SIMD_LAUNCHER_MARKER = b'(generated by EasyBuild)'
+
+
+def is_gmx_simd_launcher(path):
+    """Check whether specified file is a launcher script generated for a multi-SIMD installation."""
+    with open(path, 'rb') as fh:
+        header = fh.read(256)
+    return header.startswith(b'#!') and GMX_SIMD_LAUNCHER_MARKER in header
+
+
+def install_gmx_simd_launchers(bindir, simd_levels):
+    """
+    Move GROMACS binaries that were installed in specified bin directory to the subdirectory for the default build,
+    and install launchers in their place that pick the binary for the best GMX_SIMD level supported by the CPU.
+
+    Launchers that were installed already (e.g. when iterating over configure options) are left in place,
+    so this can be done multiple times for the same installation.
+
+    :param bindir: bin directory of GROMACS installation
+    :param simd_levels: list of GMX_SIMD levels for which binaries are installed in bin/<GMX_SIMD level>
+    :return: list of paths to installed launchers
+    """
+    default_bindir = os.path.join(bindir, GMX_SIMD_DEFAULT_SUBDIR)
+
+    binaries = []
+    for binary in sorted(os.listdir(bindir)):
+        path = os.path.join(bindir, binary)
+        if GMX_SIMD_BINARY_REGEX.match(binary) and os.path.isfile(path) and not is_gmx_simd_launcher(path):
+            binaries.append(binary)
+    if not binaries:
+        raise EasyBuildError("No GROMACS binaries found in %s", bindir)
+
+    mkdir(default_bindir)
+    for binary in binaries:
+        move_file(os.path.join(bindir, binary), os.path.join(default_bindir, binary))
+
+    # install launcher for each binary, checking GMX_SIMD levels from best to worst
+    launchers = []
+    for binary in binaries:
+        checks = []
+        for simd, flags in GMX_SIMD_CPU_FLAGS:
+            if simd in simd_levels:
+                checks.append(GMX_SIMD_LAUNCHER_CHECK_TEMPLATE % {
+                    'binary': binary,
+                    'flags': ' '.join(flags),
+                    'simd': simd,
+                })
+        launcher = os.path.join(bindir, binary)
+        write_file(launcher, GMX_SIMD_LAUNCHER_TEMPLATE % {
+            'binary': binary,
+            'checks': ''.join(checks),
+            'default_subdir': GMX_SIMD_DEFAULT_SUBDIR,
+        })
+        adjust_permissions(launcher, stat.S_IXUSR | stat.S_IXGRP | stat.S_IXOTH)
+        launchers.append(launcher)
+
+    return launchers
+
 
 class EB_GROMACS(CMakeMake):
     """Support for building/installing GROMACS."""
@@ -64,6 +171,11 @@ class EB_GROMACS(CMakeMake):
             'mpiexec': ['mpirun', "MPI executable to use when running tests", CUSTOM],
             'mpiexec_numproc_flag': ['-np', "Flag to introduce the number of MPI tasks when running tests", CUSTOM],
             'mpi_numprocs': [0, "Number of MPI tasks to use when running tests", CUSTOM],
+            'simd_variants': [[], "List of GMX_SIMD levels to also build binaries for, which are installed in "
+                                  "bin/<GMX_SIMD level>, with a launcher that picks the best binary for the CPU "
+                                  "at runtime (only for GROMACS >= 5.1)", CUSTOM],
+            'parallel_mpi_build': [False, "Configure, build and test MPI and non-MPI variants concurrently, "
+                                          "in separate build directories (only for GROMACS >= 4.6)", CUSTOM],
         }
         return CMakeMake.extra_options(extra_vars)
 
@@ -73,6 +185,21 @@ class EB_GROMACS(CMakeMake):
         self.lib_subdir = ''
         self.pre_env = ''
 
+        # build directories for non-MPI and MPI variants, only used when both are built concurrently
+        self.variant_builddirs = []
+
+        # configure options for non-MPI and MPI variants (keys are suffixes for binaries),
+        # used to build binaries for other GMX_SIMD levels
+        self.variant_configopts = {}
+
+        known_simd_levels = [x[0] for x in GMX_SIMD_CPU_FLAGS]
+        unknown_simd_levels = [x for x in self.cfg['simd_variants'] if x not in known_simd_levels]
+        if unknown_simd_levels:
+            raise EasyBuildError("Unknown GMX_SIMD levels specified in 'simd_variants': %s (known levels: %s)",
+                                 ', '.join(unknown_simd_levels), ', '.join(known_simd_levels))
+        if self.cfg['simd_variants'] and LooseVersion(self.version) < LooseVersion('5.1'):
+            raise EasyBuildError("Multi-SIMD installations via 'simd_variants' require GROMACS 5.1 or newer")
+
     def get_gromacs_arch(self):
         """Determine value of GMX_SIMD CMake flag based on optarch string.
 
@@ -146,6 +273,8 @@ class EB_GROMACS(CMakeMake):
 
     def configure_step(self):
         """Custom configuration procedure for GROMACS: set configure options for configure or cmake."""
+        # only retain configure options for variants of current iteration (cfr. install_simd_variants)
+        self.variant_configopts = {}
 
         # check whether PLUMED is loaded as a dependency
         plumed_root = get_software_root('PLUMED')
@@ -314,18 +443,99 @@ class EB_GROMACS(CMakeMake):
             # complete configuration with configure_method of parent
             self.cfg['separate_build_dir'] = True
             out = super(EB_GROMACS, self).configure_step()
+            self.check_configure_output(out)
+            self.variant_configopts[''] = self.cfg['configopts']
+
+            # configure MPI variant up front (in separate build directory) if it is to be built concurrently
+            usempi = self.toolchain.options.get('usempi', None)
+            if usempi and self.cfg['parallel_mpi_build'] and not self.dry_run:
+                _, variant_parallel = split_parallelism(self.cfg['parallel'], 2)
+                obj_dirs = ['easybuild_obj', 'easybuild_obj_mpi']
+                self.variant_builddirs = [os.path.join(self.builddir, x) for x in obj_dirs]
+                self.log.info("Configuring MPI variant in %s, to build it concurrently with non-MPI variant",
+                              self.variant_builddirs[1])
+
+                self.prepare_mpi_configopts(variant_parallel)
+                out = super(EB_GROMACS, self).configure_step(builddir=self.variant_builddirs[1])
+                self.check_configure_output(out)
+
+    def check_configure_output(self, out):
+        """Check output of CMake configuration."""
+        # for recent GROMACS versions, make very sure that a decent BLAS, LAPACK and FFT is found and used
+        if LooseVersion(self.version) >= LooseVersion('4.6.5'):
+            patterns = [
+                r"Using external FFT library - \S*",
+                r"Looking for dgemm_ - found",
+                r"Looking for cheev_ - found",
+            ]
+            for pattern in patterns:
+                regex = re.compile(pattern, re.M)
+                if not regex.search(out):
+                    raise EasyBuildError("Pattern '%s' not found in GROMACS configuration output.", pattern)
+
+    def prepare_mpi_configopts(self, parallel):
+        """
+        Update configure options for building MPI variant (GROMACS >= 4.6).
+
+        :param parallel: default number of MPI tasks to use for tests
+        """
+        self.cfg['configopts'] = re.sub(r'-DGMX_MPI=OFF', r'', self.cfg['configopts'])
 
-            # for recent GROMACS versions, make very sure that a decent BLAS, LAPACK and FFT is found and used
-            if LooseVersion(self.version) >= LooseVersion('4.6.5'):
-                patterns = [
-                    r"Using external FFT library - \S*",
-                    r"Looking for dgemm_ - found",
-                    r"Looking for cheev_ - found",
-                ]
-                for pattern in patterns:
-                    regex = re.compile(pattern, re.M)
-                    if not regex.search(out):
-                        raise EasyBuildError("Pattern '%s' not found in GROMACS configuration output.", pattern)
+        if self.cfg['mpi_numprocs'] == 0:
+            self.log.info("No number of test MPI tasks specified -- using default: %s" % parallel)
+            self.cfg['mpi_numprocs'] = parallel
+
+        elif self.cfg['mpi_numprocs'] > parallel:
+            self.log.warning("Number of test MPI tasks (%s) is greater than value for 'parallel': %s",
+                             self.cfg['mpi_numprocs'], parallel)
+
+        self.cfg.update('configopts', "-DGMX_MPI=ON -DGMX_THREAD_MPI=OFF")
+
+        mpiexec = which(self.cfg['mpiexec'])
+        if mpiexec:
+            self.cfg.update('configopts', "-DMPIEXEC=%s" % mpiexec)
+            self.cfg.update('configopts', "-DMPIEXEC_NUMPROC_FLAG=%s" % self.cfg['mpiexec_numproc_flag'])
+            self.cfg.update('configopts', "-DNUMPROC=%s" % self.cfg['mpi_numprocs'])
+        elif self.cfg['runtest']:
+            raise EasyBuildError("'%s' not found in $PATH", self.cfg['mpiexec'])
+
+        self.log.info("Using %s as MPI executable when testing, with numprocs flag '%s' and %s tasks",
+                      self.cfg['mpiexec'], self.cfg['mpiexec_numproc_flag'], self.cfg['mpi_numprocs'])
+
+        self.variant_configopts['_mpi'] = self.cfg['configopts']
+
+    def run_variants_parallel(self, step_name, func):
+        """
+        Run specified function for non-MPI and MPI variants concurrently, in the corresponding build directories,
+        with available parallelism split across both variants.
+        """
+        max_workers, variant_parallel = split_parallelism(self.cfg['parallel'], len(self.variant_builddirs))
+
+        def run_variant(builddir):
+            """Run specified function in build directory for variant (in separate process)."""
+            change_dir(builddir)
+            self.cfg['parallel'] = variant_parallel
+            func()
+
+        labels = ['non-MPI', 'MPI']
+        tasks = []
+        for label, builddir in zip(labels, self.variant_builddirs):
+            tasks.append((label, lambda d=builddir: run_variant(d)))
+
+        print_msg("running %s step for %s variants in parallel (max. %d at a time, using %d cores each)..." %
+                  (step_name, ' and '.join(labels), max_workers, variant_parallel), silent=self.silent)
+        res = run_tasks_parallel(tasks, max_workers, logfile=self.logfile)
+
+        for label in labels:
+            self.log.info("%s step for %s variant took %.1f seconds", step_name, label, res[label]['time'])
+
+    def build_step(self, *args, **kwargs):
+        """Custom build step for GROMACS: build non-MPI and MPI variants concurrently (if enabled)."""
+        if self.variant_builddirs:
+            build_step = super(EB_GROMACS, self).build_step
+            self.run_variants_parallel('build', lambda: build_step(*args, **kwargs))
+        else:
+            super(EB_GROMACS, self).build_step(*args, **kwargs)
 
     def test_step(self):
         """Run the basic tests (but not necessarily the full regression tests) using make check"""
@@ -335,12 +545,24 @@ class EB_GROMACS(CMakeMake):
             # make very sure OMP_NUM_THREADS is set to 1, to avoid hanging GROMACS regression test
             env.setvar('OMP_NUM_THREADS', '1')
 
-            self.cfg['runtest'] = 'check'
-            if self.cfg['parallel']:
-                # run 'make check' in parallel since it involves more compilation
-                self.cfg.update('runtest', "-j %s" % self.cfg['parallel'])
+            if self.variant_builddirs:
+                # 'make check' for non-MPI and MPI variants is run concurrently (if enough cores are available)
+                self.run_variants_parallel('test', self.run_make_check)
+            else:
+                self.run_make_check()
+
+        elif self.cfg['runtest'] and self.variant_builddirs:
+            # specified tests are only run for MPI variant (cfr. install_step)
+            change_dir(self.variant_builddirs[1])
             super(EB_GROMACS, self).test_step()
 
+    def run_make_check(self):
+        """Run 'make check', in parallel since it involves more compilation."""
+        self.cfg['runtest'] = 'check'
+        if self.cfg['parallel']:
+            self.cfg.update('runtest', "-j %s" % self.cfg['parallel'])
+        super(EB_GROMACS, self).test_step()
+
     def install_step(self):
         """
         Custom install step for GROMACS; figure out where libraries were installed to.
@@ -348,7 +570,14 @@ class EB_GROMACS(CMakeMake):
         """
         # run 'make install' in parallel since it involves more compilation
         self.cfg.update('installopts', "-j %s" % self.cfg['parallel'])
-        super(EB_GROMACS, self).install_step()
+
+        if self.variant_builddirs:
+            # non-MPI and MPI variants were built concurrently, install them one after the other
+            for builddir in self.variant_builddirs:
+                change_dir(builddir)
+                super(EB_GROMACS, self).install_step()
+        else:
+            super(EB_GROMACS, self).install_step()
 
         # the GROMACS libraries get installed in different locations (deeper subdirectory), depending on the platform;
         # this is determined by the GNUInstallDirs CMake module;
@@ -375,8 +604,8 @@ class EB_GROMACS(CMakeMake):
         if not self.lib_subdir:
             raise EasyBuildError("Failed to determine lib subdirectory in %s", self.installdir)
 
-        # Install a version with the MPI suffix
-        if self.toolchain.options.get('usempi', None):
+        # Install a version with the MPI suffix (if it was not installed already)
+        if self.toolchain.options.get('usempi', None) and not self.variant_builddirs:
             if LooseVersion(self.version) < LooseVersion('4.6'):
 
                 cmd = "make distclean"
@@ -390,29 +619,7 @@ class EB_GROMACS(CMakeMake):
                 super(EB_GROMACS, self).install_step()
 
             else:
-                self.cfg['configopts'] = re.sub(r'-DGMX_MPI=OFF', r'', self.cfg['configopts'])
-
-                if self.cfg['mpi_numprocs'] == 0:
-                    self.log.info("No number of test MPI tasks specified -- using default: %s" % self.cfg['parallel'])
-                    self.cfg['mpi_numprocs'] = self.cfg['parallel']
-
-                elif self.cfg['mpi_numprocs'] > self.cfg['parallel']:
-                    self.log.warning("Number of test MPI tasks (%s) is greater than value for 'parallel': %s",
-                                     self.cfg['mpi_numprocs'], self.cfg['parallel'])
-
-                self.cfg.update('configopts', "-DGMX_MPI=ON -DGMX_THREAD_MPI=OFF")
-
-                mpiexec = which(self.cfg['mpiexec'])
-                if mpiexec:
-                    self.cfg.update('configopts', "-DMPIEXEC=%s" % mpiexec)
-                    self.cfg.update('configopts', "-DMPIEXEC_NUMPROC_FLAG=%s" % self.cfg['mpiexec_numproc_flag'])
-                    self.cfg.update('configopts', "-DNUMPROC=%s" % self.cfg['mpi_numprocs'])
-                elif self.cfg['runtest']:
-                    raise EasyBuildError("'%s' not found in $PATH", self.cfg['mpiexec'])
-
-
-                self.log.info("Using %s as MPI executable when testing, with numprocs flag '%s' and %s tasks",
-                              self.cfg['mpiexec'], self.cfg['mpiexec_numproc_flag'], self.cfg['mpi_numprocs'])
+                self.prepare_mpi_configopts(self.cfg['parallel'])
 
                 # clean up obj dir before reconfiguring
                 shutil.rmtree(os.path.join(self.builddir, 'easybuild_obj'))
@@ -425,6 +632,73 @@ class EB_GROMACS(CMakeMake):
 
                 self.log.info("A full regression test suite is available from the GROMACS web site")
 
+        if self.cfg['simd_variants'] and not self.dry_run:
+            self.install_simd_variants()
+
+    def install_simd_variants(self):
+        """
+        Build and install binaries for additional GMX_SIMD levels (in bin/<GMX_SIMD level>),
+        and install launchers that pick the binary for the best GMX_SIMD level supported by the CPU at runtime.
+
+        Binaries for each GMX_SIMD level are linked statically to the GROMACS libraries,
+        and are installed in a separate staging directory first, so the default installation is left untouched.
+
+        Only the variants that were built in the current iteration are considered (cfr. configure_step),
+        and launchers installed in an earlier iteration are left in place.
+        """
+        bindir = os.path.join(self.installdir, 'bin')
+        srcdir = self.cfg['start_dir']
+        stagedir = tempfile.mkdtemp(prefix='eb-simd-', dir=self.builddir)
+
+        builds = []
+        for simd in self.cfg['simd_variants']:
+            for suffix in sorted(self.variant_configopts):
+                configopts = self.variant_configopts[suffix]
+                for regex in [r'-DGMX_SIMD=\S+', r'-DGMX_PREFER_STATIC_LIBS=\S+', r'-DBUILD_SHARED_LIBS=\S+']:
+                    configopts = re.sub(regex, '', configopts)
+                configopts = ' '.join([
+                    configopts,
+                    '-DGMX_SIMD=%s' % simd,
+                    '-DGMX_PREFER_STATIC_LIBS=ON -DBUILD_SHARED_LIBS=OFF',
+                    '-DCMAKE_INSTALL_PREFIX=%s' % os.path.join(stagedir, simd + suffix),
+                ])
+                builds.append((simd, simd + suffix, configopts))
+
+        max_workers, build_parallel = split_parallelism(self.cfg['parallel'], len(builds))
+
+        def build_simd_variant(label, configopts):
+            """Configure, build and install (in staging directory) for specified GMX_SIMD level."""
+            self.cfg['configopts'] = configopts
+            self.cfg['parallel'] = build_parallel
+            CMakeMake.configure_step(self, srcdir=srcdir, builddir=os.path.join(stagedir, 'easybuild_obj_%s' % label))
+            CMakeMake.build_step(self)
+            CMakeMake.install_step(self)
+
+        tasks = [(label, functools.partial(build_simd_variant, label, opts)) for (_, label, opts) in builds]
+
+        print_msg("building binaries for %d GMX_SIMD levels in parallel (max. %d at a time, using %d cores each)..." %
+                  (len(tasks), max_workers, build_parallel), silent=self.silent)
+
+        # tasks are run in this process when they are not run in parallel, so restore what they change afterwards
+        orig_configopts, orig_parallel = self.cfg['configopts'], self.cfg['parallel']
+        try:
+            run_tasks_parallel(tasks, max_workers, logfile=self.logfile)
+        finally:
+            self.cfg['configopts'] = orig_configopts
+            self.cfg['parallel'] = orig_parallel
+
+        # install binaries of default installation in separate subdirectory, with a launcher in their place
+        launchers = install_gmx_simd_launchers(bindir, self.cfg['simd_variants'])
+        self.log.info("Installed launchers %s for GMX_SIMD levels %s", launchers, self.cfg['simd_variants'])
+
+        for simd, label, _ in builds:
+            mkdir(os.path.join(bindir, simd), parents=True)
+            for binary in os.listdir(os.path.join(stagedir, label, 'bin')):
+                if GMX_SIMD_BINARY_REGEX.match(binary):
+                    copy_file(os.path.join(stagedir, label, 'bin', binary), os.path.join(bindir, simd, binary))
+
+        remove_dir(stagedir)
+
     def make_module_req_guess(self):
         """Custom library subdirectories for GROMACS."""
         guesses = super(EB_GROMACS, self).make_module_req_guess()
@@ -495,4 +769,19 @@ class EB_GROMACS(CMakeMake):
                 [os.path.join(self.lib_subdir, l) for l in lib_files],
             'dirs': dirs,
         }
-        super(EB_GROMACS, self).sanity_check_step(custom_paths=custom_paths)
+
+        custom_commands = []
+        if self.cfg['simd_variants']:
+            # check binaries for each GMX_SIMD level, but only run those supported by the CPU of the build host
+            cpu_features = get_cpu_features()
+            simd_subdirs = [GMX_SIMD_DEFAULT_SUBDIR]
+            for simd, flags in GMX_SIMD_CPU_FLAGS:
+                if simd in self.cfg['simd_variants']:
+                    custom_paths['files'].extend([os.path.join('bin', simd, b) for b in bin_files])
+                    if all(flag in cpu_features for flag in flags):
+                        simd_subdirs.append(simd)
+            for subdir in simd_subdirs + ['']:
+                for binary in bin_files:
+                    custom_commands.append("%s --version" % os.path.join(self.installdir, 'bin', subdir, binary))
+
+        super(EB_GROMACS, self).sanity_check_step(custom_paths=custom_paths, custom_commands=custom_commands)
@@ -0,0 +1,111 @@
+##
+# Copyright 2019 Ghent University
+#
+# This file is part of EasyBuild,
+# originally created by the HPC team of Ghent University (http://ugent.be/hpc/en),
+# with support of Ghent University (http://ugent.be/hpc),
+# the Flemish Supercomputer Centre (VSC) (https://www.vscentrum.be),
+# Flemish Research Foundation (FWO) (http://www.fwo.be/en)
+# and the Department of Economy, Science and Innovation (EWI) (http://www.ewi-vlaanderen.be/en).
+#
+# https://github.com/easybuilders/easybuild
+#
+# EasyBuild is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation v2.
+#
+# EasyBuild is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with EasyBuild.  If not, see <http://www.gnu.org/licenses/>.
+##
+"""
+Support for checking all extensions at once (using a single run of the interpreter) in the sanity check,
+rather than running the filter command for each extension separately.
+
+Not an easyblock itself, but used by several (generic) easyblocks.
+"""
+from easybuild.base import fancylogger
+from easybuild.tools.run import run_cmd
+from easybuild.tools.utilities import nub
+
+
+def run_batch_check(cmd, names, prefix, parse_result, inp=None):
+    """
+    Check all specified names using a single run of the specified command.
+
+    The command must print the result for each name on a separate line, that starts with the specified prefix.
+
+    :param cmd: command to run
+    :param names: list of names to check
+    :param prefix: prefix of output lines that provide a result
+    :param parse_result: function to parse a result line (without prefix), which returns a (name, result) tuple
+                         (or None for a malformed line); result must be a dict that specifies whether the check
+                         was successful ('ok') and the error message ('error'), and optionally time spent ('time')
+    :param inp: input to pass to command via stdin (if any)
+    :return: dict with result for each of the names; no result is available for names that could not be checked
+             (for example when the interpreter crashed)
+    """
+    log = fancylogger.getLogger('run_batch_check', fname=False)
+
+    (out, ec) = run_cmd(cmd, log_ok=False, simple=False, inp=inp, regexp=False, trace=False)
+
+    res = {}
+    for line in out.split('\n'):
+        if line.startswith(prefix):
+            name_res = parse_result(line[len(prefix):])
+            if name_res:
+                res[name_res[0]] = name_res[1]
+
+    if ec:
+        missing = [x for x in names if x not in res]
+        log.warning("Batch check failed (exit code %s), no result for: %s", ec, missing)
+
+    return res
+
+
+def batch_check_exts(exts, check_func, descr):
+    """
+    Check specified extensions all at once, and store result in 'batch_check_result' of each of them.
+
+    :param exts: list of (extension, name to check) tuples
+    :param check_func: function to check a list of names at once (see run_batch_check)
+    :param descr: description of what is checked, used in log messages (e.g., 'import of Python modules')
+    """
+    log = fancylogger.getLogger('batch_check_exts', fname=False)
+
+    log.info("Checking %s for %d extensions at once", descr, len(exts))
+    res = check_func(nub(name for (_, name) in exts))
+
+    summary = []
+    for ext, name in exts:
+        if name in res:
+            ext.batch_check_result = res[name]
+            status = ('FAILED', 'OK')[res[name]['ok']]
+            if 'time' in res[name]:
+                status += " (%.2fs)" % res[name]['time']
+        else:
+            ext.batch_check_result = {'ok': False, 'error': "no result available"}
+            status = 'NOT CHECKED'
+        summary.append("* %s (%s): %s" % (ext.name, name, status))
+
+    log.info("Result of checking %s:\n%s", descr, '\n'.join(summary))
+
+
+def batch_check_passed(ext, descr):
+    """
+    Determine whether check done via batch_check_exts passed for specified extension.
+
+    If not (or if no result is available), the extension should be checked separately using the filter command.
+    """
+    res = ext.batch_check_result
+    if res and res['ok']:
+        ext.log.info("Check of %s passed for %s, no need to run filter command", descr, ext.name)
+        return True
+
+    if res:
+        ext.log.info("Check of %s failed for %s, checking again separately: %s", descr, ext.name, res['error'])
+    return False
@@ -35,14 +35,42 @@ import copy
 import os
 
 import easybuild.tools.environment as env
+from easybuild.easyblocks.generic.paralleltasks import det_max_concurrency, run_tasks_parallel, split_parallelism
 from easybuild.framework.easyblock import EasyBlock
 from easybuild.framework.easyconfig import CUSTOM
 from easybuild.framework.easyconfig.easyconfig import get_easyblock_class
 from easybuild.tools.build_log import EasyBuildError, print_msg
+from easybuild.tools.filetools import extract_file, mkdir
 from easybuild.tools.modules import get_software_root, get_software_version
 from easybuild.tools.py2vs3 import string_type
 
 
+def det_component_deps(comps):
+    """
+    Determine dependencies between components, based on names of required components.
+
+    Components for which no required components are specified (None) are considered to require all earlier
+    components; components can only be considered to be independent by specifying an empty list.
+
+    :param comps: list of tuples with label, name and list of names of required components (or None), for each component
+    :return: dictionary with list of labels of required components, for each component label
+    """
+    deps = {}
+    for idx, (label, _, requires) in enumerate(comps):
+        earlier_comps = comps[:idx]
+        if requires is None:
+            deps[label] = [x[0] for x in earlier_comps]
+        else:
+            deps[label] = []
+            for name in requires:
+                comp_labels = [x[0] for x in earlier_comps if x[1] == name]
+                if not comp_labels:
+                    raise EasyBuildError("Component %s requires %s, which is not an earlier component", label, name)
+                deps[label].extend(comp_labels)
+
+    return deps
+
+
 class Bundle(EasyBlock):
     """
     Bundle of modules: only generate module files, nothing to build/install
@@ -59,6 +87,12 @@ class Bundle(EasyBlock):
             'default_component_specs': [{}, "Default specs to use for every component", CUSTOM],
             'components': [(), "List of components to install: tuples w/ name, version and easyblock to use", CUSTOM],
             'default_easyblock': [None, "Default easyblock to use for components", CUSTOM],
+            'parallel_components': [False, "Install components in parallel (using 'parallel' workers), "
+                                           "taking into account dependencies between components", CUSTOM],
+            'requires_components': [None, "Names of (earlier) components required by a component, only relevant "
+                                          "when 'parallel_components' is enabled (if None: all earlier components); "
+                                          "components are only installed in parallel if this is specified for "
+                                          "at least one component", CUSTOM],
         })
         return EasyBlock.extra_options(extra_vars)
 
@@ -184,77 +218,194 @@ class Bundle(EasyBlock):
         """Do nothing."""
         pass
 
+    def prepare_component(self, cfg, builddir=None):
+        """
+        Create easyblock instance for specified component, and prepare it for installation.
+
+        :param builddir: separate build directory to use for this component (sources are unpacked in it);
+                         if None, the build directory of the bundle is used (in which all sources are unpacked)
+        """
+        comp = cfg.easyblock(cfg)
+
+        # correct build/install dirs
+        comp.builddir = builddir or self.builddir
+        comp.install_subdir, comp.installdir = self.install_subdir, self.installdir
+
+        # make sure we can build in parallel
+        comp.set_parallel()
+
+        comp_srcs = []
+
+        # find match entries in self.src for this component
+        for source in comp.cfg['sources']:
+            if isinstance(source, string_type):
+                comp_src_fn = source
+            elif isinstance(source, dict):
+                if 'filename' in source:
+                    comp_src_fn = source['filename']
+                else:
+                    raise EasyBuildError("Encountered source file specified as dict without 'filename': %s", source)
+            else:
+                raise EasyBuildError("Specification of unknown type for source file: %s", source)
+
+            found = False
+            for src in self.src:
+                if src['name'] == comp_src_fn:
+                    self.log.info("Found spec for source %s for component %s: %s", comp_src_fn, comp.name, src)
+                    comp_srcs.append(copy.copy(src))
+                    found = True
+                    break
+            if not found:
+                raise EasyBuildError("Failed to find spec for source %s for component %s", comp_src_fn, comp.name)
+
+        # unpack sources for this component in its own build directory, *before* determining the start directory
+        if builddir:
+            mkdir(builddir, parents=True)
+            for src in comp_srcs:
+                self.log.info("Unpacking source %s for component %s in %s", src['name'], comp.name, builddir)
+                extract_file(src['path'], builddir, cmd=src['cmd'], extra_options=comp.cfg['unpack_options'])
+
+        # figure out correct start directory (relative to build directory, since comp.src is still empty)
+        comp.guess_start_dir()
+
+        # need to run fetch_patches to ensure per-component patches are applied
+        comp.fetch_patches()
+
+        # location of unpacked source is used to determine where to apply patch(es)
+        for src in comp_srcs:
+            src['finalpath'] = comp.cfg['start_dir']
+        comp.src = comp_srcs
+
+        return comp
+
+    def install_component(self, comp):
+        """
+        Run relevant steps to install specified component.
+
+        :return: dictionary with subdirectories of installation directory to add to environment variables
+        """
+        cfg = comp.cfg
+        for step_name in ['patch', 'configure', 'build', 'install']:
+            if step_name in cfg['skipsteps']:
+                comp.log.info("Skipping '%s' step for component %s v%s", step_name, cfg['name'], cfg['version'])
+            else:
+                comp.run_step(step_name, [lambda x: getattr(x, '%s_step' % step_name)])
+
+        return comp.make_module_req_guess()
+
+    def update_env_for_component(self, reqs):
+        """
+        Update environment to ensure stuff provided by former components can be picked up by latter components;
+        once the installation is finalised, this is handled by the generated module
+        """
+        for envvar in reqs:
+            curr_val = os.getenv(envvar, '')
+            curr_paths = curr_val.split(os.pathsep)
+            for subdir in reqs[envvar]:
+                path = os.path.join(self.installdir, subdir)
+                if path not in curr_paths:
+                    if curr_val:
+                        new_val = '%s:%s' % (path, curr_val)
+                    else:
+                        new_val = path
+                    env.setvar(envvar, new_val)
+
+    def det_component_deps(self, labels):
+        """
+        Determine dependencies between components, based on 'requires_components'.
+
+        :param labels: list of labels for components (same order as self.comp_cfgs)
+        :return: dictionary with list of labels of required components, for each component label
+        """
+        comps = [(label, cfg['name'], cfg['requires_components']) for (label, cfg) in zip(labels, self.comp_cfgs)]
+        deps = det_component_deps(comps)
+        for label in labels:
+            self.log.info("Components required by %s: %s", label, deps[label])
+
+        return deps
+
+    def use_parallel_components(self):
+        """
+        Determine whether components should be installed in parallel:
+        only if 'parallel_components' is enabled, and required components are specified for at least one component.
+        """
+        res = False
+        if self.cfg['parallel_components'] and len(self.comp_cfgs) > 1:
+            if any(cfg['requires_components'] is not None for cfg in self.comp_cfgs):
+                res = True
+            else:
+                self.log.info("Not installing components in parallel, no 'requires_components' specified")
+        return res
+
+    def extract_step(self):
+        """Unpack sources, unless components are installed in parallel (sources are unpacked per component then)."""
+        if self.use_parallel_components():
+            self.log.info("Sources are unpacked in separate build directory for each component")
+        else:
+            super(Bundle, self).extract_step()
+
     def install_step(self):
         """Install components, if specified."""
         comp_cnt = len(self.cfg['components'])
+
+        if self.use_parallel_components():
+            self.install_components_parallel()
+            return
+
         for idx, cfg in enumerate(self.comp_cfgs):
 
             print_msg("installing bundle component %s v%s (%d/%d)..." % (cfg['name'], cfg['version'], idx+1, comp_cnt))
             self.log.info("Installing component %s v%s using easyblock %s", cfg['name'], cfg['version'], cfg.easyblock)
 
-            comp = cfg.easyblock(cfg)
-
-            # correct build/install dirs
-            comp.builddir = self.builddir
-            comp.install_subdir, comp.installdir = self.install_subdir, self.installdir
-
-            # make sure we can build in parallel
-            comp.set_parallel()
-
-            # figure out correct start directory
-            comp.guess_start_dir()
+            comp = self.prepare_component(cfg)
+            reqs = self.install_component(comp)
+            self.update_env_for_component(reqs)
 
-            # need to run fetch_patches to ensure per-component patches are applied
-            comp.fetch_patches()
-
-            comp.src = []
+    def install_components_parallel(self):
+        """
+        Install components in parallel (in separate build directories), taking into account dependencies.
 
-            # find match entries in self.src for this component
-            for source in comp.cfg['sources']:
-                if isinstance(source, string_type):
-                    comp_src_fn = source
-                elif isinstance(source, dict):
-                    if 'filename' in source:
-                        comp_src_fn = source['filename']
-                    else:
-                        raise EasyBuildError("Encountered source file specified as dict without 'filename': %s", source)
-                else:
-                    raise EasyBuildError("Specification of unknown type for source file: %s", source)
-
-                found = False
-                for src in self.src:
-                    if src['name'] == comp_src_fn:
-                        self.log.info("Found spec for source %s for component %s: %s", comp_src_fn, comp.name, src)
-                        comp.src.append(src)
-                        found = True
-                        break
-                if not found:
-                    raise EasyBuildError("Failed to find spec for source %s for component %s", comp_src_fn, comp.name)
-
-                # location of first unpacked source is used to determine where to apply patch(es)
-                comp.src[-1]['finalpath'] = comp.cfg['start_dir']
-
-            # run relevant steps
-            for step_name in ['patch', 'configure', 'build', 'install']:
-                if step_name in cfg['skipsteps']:
-                    comp.log.info("Skipping '%s' step for component %s v%s", step_name, cfg['name'], cfg['version'])
+        Environment updates for completed components are applied in the order in which components are listed,
+        regardless of the order in which components complete.
+        """
+        labels = ['%s-%s' % (cfg['name'], cfg['version']) for cfg in self.comp_cfgs]
+        deps = self.det_component_deps(labels)
+
+        # only split available parallelism across components that can actually be installed concurrently
+        max_workers, comp_parallel = split_parallelism(self.cfg['parallel'], det_max_concurrency(labels, deps))
+
+        tasks = []
+        for label, cfg in zip(labels, self.comp_cfgs):
+            self.log.info("Preparing component %s v%s using easyblock %s", cfg['name'], cfg['version'], cfg.easyblock)
+            comp = self.prepare_component(cfg, builddir=os.path.join(self.builddir, 'easybuild_components', label))
+            comp.cfg['parallel'] = min(comp.cfg['parallel'], comp_parallel)
+
+            tasks.append((label, lambda comp=comp: self.install_component(comp)))
+
+        base_env = {}
+        comp_reqs = {}
+
+        def update_env(label, reqs):
+            """Update environment for completed component (in order of components)."""
+            comp_reqs[label] = reqs
+            for envvar in set(x for r in comp_reqs.values() for x in r):
+                if envvar not in base_env:
+                    base_env[envvar] = os.getenv(envvar)
+                if base_env[envvar] is None:
+                    env.unset_env_vars([envvar], verbose=False)
                 else:
-                    comp.run_step(step_name, [lambda x: getattr(x, '%s_step' % step_name)])
-
-            # update environment to ensure stuff provided by former components can be picked up by latter components
-            # once the installation is finalised, this is handled by the generated module
-            reqs = comp.make_module_req_guess()
-            for envvar in reqs:
-                curr_val = os.getenv(envvar, '')
-                curr_paths = curr_val.split(os.pathsep)
-                for subdir in reqs[envvar]:
-                    path = os.path.join(self.installdir, subdir)
-                    if path not in curr_paths:
-                        if curr_val:
-                            new_val = '%s:%s' % (path, curr_val)
-                        else:
-                            new_val = path
-                        env.setvar(envvar, new_val)
+                    env.setvar(envvar, base_env[envvar], verbose=False)
+            for comp_label in labels:
+                if comp_label in comp_reqs:
+                    self.update_env_for_component(comp_reqs[comp_label])
+
+        print_msg("installing %d bundle components in parallel (max. %d at a time, using %d cores each)..." %
+                  (len(labels), max_workers, comp_parallel), silent=self.silent)
+        res = run_tasks_parallel(tasks, max_workers, deps=deps, logfile=self.logfile, done_callback=update_env)
+
+        for label in labels:
+            self.log.info("Installation of component %s took %.1f seconds (CPU time: %.1f seconds)",
+                          label, res[label]['time'], res[label]['cpu_time'])
 
     def make_module_extra(self, *args, **kwargs):
         """Set extra stuff in module file, e.g. $EBROOT*, $EBVERSION*, etc."""
@@ -35,8 +35,9 @@ EasyBuild support for software that is configured with CMake, implemented as an
 """
 import os
 
-from easybuild.easyblocks.generic.configuremake import ConfigureMake
+from easybuild.easyblocks.generic.configuremake import DEFAULT_BUILD_CMD, DEFAULT_INSTALL_CMD, ConfigureMake
 from easybuild.framework.easyconfig import CUSTOM
+from easybuild.tools.build_log import EasyBuildError, print_warning
 from easybuild.tools.config import build_option
 from easybuild.tools.filetools import change_dir, mkdir, which
 from easybuild.tools.environment import setvar
@@ -47,6 +48,31 @@ from easybuild.tools.utilities import nub
 
 DEFAULT_CONFIGURE_CMD = 'cmake'
 
+MAKEFILES_GENERATOR = 'Unix Makefiles'
+NINJA_GENERATOR = 'Ninja'
+KNOWN_GENERATORS = [MAKEFILES_GENERATOR, NINJA_GENERATOR]
+
+# name of Ninja job pool used for link steps
+LINK_JOB_POOL = 'link_job_pool'
+
+
+def det_cmake_generator(generator, silent=False):
+    """
+    Determine CMake generator to use, taking into account whether Ninja is available.
+
+    :param generator: name of requested CMake generator (None for default generator)
+    :return: name of CMake generator to use (None for default generator)
+    """
+    if generator not in [None] + KNOWN_GENERATORS:
+        raise EasyBuildError("Unknown CMake generator '%s', should be one of: %s", generator, KNOWN_GENERATORS)
+
+    if generator == NINJA_GENERATOR and which('ninja') is None:
+        print_warning("Ninja generator requested but 'ninja' command not found, falling back to Makefiles",
+                      silent=silent)
+        generator = None
+
+    return generator
+
 
 class CMakeMake(ConfigureMake):
     """Support for configuring build with CMake instead of traditional configure script"""
@@ -60,11 +86,25 @@ class CMakeMake(ConfigureMake):
             'allow_system_boost': [False, "Always allow CMake to pick up on Boost installed in OS "
                                           "(even if Boost is included as a dependency)", CUSTOM],
             'configure_cmd': [DEFAULT_CONFIGURE_CMD, "Configure command to use", CUSTOM],
+            'generator': [None, "CMake generator to use ('%s' or '%s', default: Makefiles); "
+                                "falls back to Makefiles if Ninja is not available" % tuple(KNOWN_GENERATORS), CUSTOM],
+            'link_jobs': [None, "Maximum number of link steps to run concurrently (only supported with Ninja)", CUSTOM],
             'srcdir': [None, "Source directory location to provide to cmake command", CUSTOM],
             'separate_build_dir': [False, "Perform build in a separate directory", CUSTOM],
         })
         return extra_vars
 
+    def __init__(self, *args, **kwargs):
+        """Initialize CMakeMake-specific variables."""
+        super(CMakeMake, self).__init__(*args, **kwargs)
+
+        # CMake generator being used (None implies default generator, i.e. Makefiles), see configure_step
+        self.generator = None
+
+    def det_generator(self):
+        """Determine CMake generator to use, taking into account whether Ninja is available."""
+        return det_cmake_generator(self.cfg.get('generator', None), silent=self.silent)
+
     def configure_step(self, srcdir=None, builddir=None):
         """Configure build using cmake"""
 
@@ -95,6 +135,24 @@ class CMakeMake(ConfigureMake):
                 srcdir = default_srcdir
 
         options = ['-DCMAKE_INSTALL_PREFIX=%s' % self.installdir]
+
+        # generator is only relevant if cmake command is composed here
+        self.generator = None
+        if self.cfg.get('configure_cmd') == DEFAULT_CONFIGURE_CMD:
+            self.generator = self.det_generator()
+        if self.generator:
+            options.append("-G '%s'" % self.generator)
+
+        # limit number of concurrent link steps via a job pool (only supported by Ninja generator)
+        link_jobs = self.cfg.get('link_jobs', None)
+        if link_jobs:
+            if self.generator == NINJA_GENERATOR:
+                options.extend([
+                    '-DCMAKE_JOB_POOLS=%s=%s' % (LINK_JOB_POOL, link_jobs),
+                    '-DCMAKE_JOB_POOL_LINK=%s' % LINK_JOB_POOL,
+                ])
+            else:
+                self.log.warning("Ignoring link_jobs=%s, only supported with Ninja generator", link_jobs)
         env_to_options = {
             'CC': 'CMAKE_C_COMPILER',
             'CFLAGS': 'CMAKE_C_FLAGS',
@@ -111,13 +169,22 @@ class CMakeMake(ConfigureMake):
                     self.log.info("Using absolute path to compiler command: %s", value)
                 options.append("-D%s='%s'" % (option, value))
 
+        # use compiler cache via CMAKE_<LANG>_COMPILER_LAUNCHER (requires CMake >= 3.4) if enabled,
+        # symlinking compiler commands to ccache is only required when a custom configure command is used;
+        # Fortran is left out, since ccache can only cache Fortran compilations in very limited cases
+        ccache = self.prepare_compiler_cache(wrap_compilers=self.cfg.get('configure_cmd') != DEFAULT_CONFIGURE_CMD)
+        if ccache:
+            for lang in ['C', 'CXX']:
+                options.append('-DCMAKE_%s_COMPILER_LAUNCHER=%s' % (lang, ccache))
+
         if build_option('rpath'):
             # instruct CMake not to fiddle with RPATH when --rpath is used, since it will undo stuff on install...
             # https://github.com/LLNL/spack/blob/0f6a5cd38538e8969d11bd2167f11060b1f53b43/lib/spack/spack/build_environment.py#L416
             options.append('-DCMAKE_SKIP_RPATH=ON')
 
-        # show what CMake is doing by default
-        options.append('-DCMAKE_VERBOSE_MAKEFILE=ON')
+        # show what CMake is doing by default (not relevant for Ninja, which is run with -v, see build_step)
+        if self.generator != NINJA_GENERATOR:
+            options.append('-DCMAKE_VERBOSE_MAKEFILE=ON')
 
         if not self.cfg.get('allow_system_boost', False):
             # don't pick up on system Boost if Boost is included as dependency
@@ -150,3 +217,63 @@ class CMakeMake(ConfigureMake):
         (out, _) = run_cmd(command, log_all=True, simple=False)
 
         return out
+
+    def build_step(self, verbose=False, path=None):
+        """Build with ninja when Ninja generator is used, or with make (via ConfigureMake) otherwise."""
+
+        if self.generator != NINJA_GENERATOR:
+            return super(CMakeMake, self).build_step(verbose=verbose, path=path)
+
+        build_cmd = self.cfg.get('build_cmd')
+        if build_cmd in [None, DEFAULT_BUILD_CMD]:
+            # show full command lines for build steps, like CMAKE_VERBOSE_MAKEFILE does for make
+            build_cmd = 'ninja -v'
+
+        paracmd = ''
+        if self.cfg['parallel']:
+            paracmd = "-j %s" % self.cfg['parallel']
+
+        cmd = ' '.join([
+            self.cfg['prebuildopts'],
+            build_cmd,
+            paracmd,
+            self.cfg['buildopts'],
+        ])
+
+        (out, _) = run_cmd(cmd, path=path, log_all=True, simple=False, log_output=verbose)
+
+        self.report_compiler_cache_stats()
+
+        return out
+
+    def test_step(self):
+        """Run tests with ninja when Ninja generator is used, or with make (via ConfigureMake) otherwise."""
+
+        if self.generator != NINJA_GENERATOR:
+            return super(CMakeMake, self).test_step()
+
+        if self.cfg['runtest']:
+            cmd = "%s ninja %s %s" % (self.cfg['pretestopts'], self.cfg['runtest'], self.cfg['testopts'])
+            (out, _) = run_cmd(cmd, log_all=True, simple=False)
+
+            return out
+
+    def install_step(self):
+        """Install with ninja when Ninja generator is used, or with make (via ConfigureMake) otherwise."""
+
+        if self.generator != NINJA_GENERATOR:
+            return super(CMakeMake, self).install_step()
+
+        install_cmd = self.cfg.get('install_cmd')
+        if install_cmd in [None, DEFAULT_INSTALL_CMD]:
+            install_cmd = 'ninja install'
+
+        cmd = ' '.join([
+            self.cfg['preinstallopts'],
+            install_cmd,
+            self.cfg['installopts'],
+        ])
+
+        (out, _) = run_cmd(cmd, log_all=True, simple=False)
+
+        return out
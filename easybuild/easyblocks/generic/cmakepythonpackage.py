@@ -56,6 +56,11 @@ class CMakePythonPackage(CMakeMake, PythonPackage):
         """Initialize with PythonPackage."""
         PythonPackage.__init__(self, *args, **kwargs)
 
+        # class variables that are normally initialized by ConfigureMake/CMakeMake constructors
+        self.compiler_cache = None
+        self.compiler_cache_stats = None
+        self.generator = None
+
     def configure_step(self, *args, **kwargs):
         """Main configuration using cmake"""
 
@@ -40,14 +40,18 @@ import re
 import stat
 from datetime import datetime
 
+import easybuild.tools.toolchain as toolchain
 from easybuild.easyblocks import VERSION as EASYBLOCKS_VERSION
 from easybuild.framework.easyblock import EasyBlock
 from easybuild.framework.easyconfig import CUSTOM
-from easybuild.tools.build_log import print_warning
-from easybuild.tools.config import source_paths
+from easybuild.tools.build_log import EasyBuildError, print_warning
+from easybuild.tools.config import build_option, build_path, source_paths
+from easybuild.tools.environment import setvar
 from easybuild.tools.filetools import CHECKSUM_TYPE_SHA256, adjust_permissions, compute_checksum, download_file
-from easybuild.tools.filetools import read_file, remove_file, verify_checksum
+from easybuild.tools.filetools import read_file, remove_file, verify_checksum, which
+from easybuild.tools.py2vs3 import string_type
 from easybuild.tools.run import run_cmd
+from easybuild.tools.toolchain.toolchain import CCACHE
 
 # string that indicates that a configure script was generated by Autoconf
 # note: bytes string since this constant is used to check the contents of 'configure' which is read as bytes
@@ -66,6 +70,34 @@ DEFAULT_CONFIGURE_CMD = './configure'
 DEFAULT_BUILD_CMD = 'make'
 DEFAULT_INSTALL_CMD = 'make install'
 
+# name of subdirectory of build path that is used as compiler cache (by default)
+COMPILER_CACHE_SUBDIR = 'ccache'
+
+
+def get_compiler_cache_stats(ccache):
+    """
+    Obtain statistics for compiler cache, using specified ccache command.
+
+    :return: dict with number of cache hits and cache misses
+    """
+    stats = {'hits': 0, 'misses': 0}
+
+    # 'ccache --print-stats' is only supported by ccache 4.x, use 'ccache -s' as fallback for older versions
+    out, ec = run_cmd("%s --print-stats" % ccache, simple=False, log_ok=False, trace=False)
+    if ec == 0:
+        counters = dict(line.split('\t', 1) for line in out.splitlines() if line.count('\t') == 1)
+        for key, stat_key in [('direct_cache_hit', 'hits'), ('preprocessed_cache_hit', 'hits'),
+                              ('cache_miss', 'misses')]:
+            stats[stat_key] += int(counters.get(key, 0))
+    else:
+        out, _ = run_cmd("%s -s" % ccache, simple=False, log_ok=False, trace=False)
+        for regex, stat_key in [(r"^cache hit \((direct|preprocessed)\)\s+(?P<cnt>[0-9]+)", 'hits'),
+                                (r"^cache miss\s+(?P<cnt>[0-9]+)", 'misses')]:
+            for res in re.finditer(regex, out, re.M):
+                stats[stat_key] += int(res.group('cnt'))
+
+    return stats
+
 
 class ConfigureMake(EasyBlock):
     """
@@ -78,6 +110,10 @@ class ConfigureMake(EasyBlock):
         extra_vars = EasyBlock.extra_options(extra=extra_vars)
         extra_vars.update({
             'build_cmd': [DEFAULT_BUILD_CMD, "Build command to use", CUSTOM],
+            'compiler_cache': [False, "Use ccache to cache compiled objects across builds: True, or location of "
+                                      "cache directory (default: $CCACHE_DIR, or '%s' in build path)" %
+                               COMPILER_CACHE_SUBDIR, CUSTOM],
+            'compiler_cache_max_size': ['10G', "Maximum size of compiler cache (see $CCACHE_MAXSIZE)", CUSTOM],
             'build_type': [None, "Value to provide to --build option of configure script, e.g., x86_64-pc-linux-gnu "
                                  "(determined by config.guess shipped with EasyBuild if None,"
                                  " False implies to leave it up to the configure script)", CUSTOM],
@@ -98,6 +134,10 @@ class ConfigureMake(EasyBlock):
 
         self.config_guess = None
 
+        # ccache command & statistics at start of build, if compiler cache is used (see prepare_compiler_cache)
+        self.compiler_cache = None
+        self.compiler_cache_stats = None
+
     def obtain_config_guess(self, download_source_path=None, search_source_paths=None):
         """
         Locate or download an up-to-date config.guess for use with ConfigureMake
@@ -175,6 +215,84 @@ class ConfigureMake(EasyBlock):
                 tup = (self.config_guess, config_guess_checksum, CONFIG_GUESS_SHA256)
                 print_warning("SHA256 checksum of config.guess at %s does not match expected checksum: %s vs %s" % tup)
 
+    def prepare_compiler_cache(self, wrap_compilers=True):
+        """
+        Prepare for using compiler cache (ccache), if enabled via 'compiler_cache' easyconfig parameter.
+
+        Objects are cached by ccache based on (preprocessed) source, compiler options and compiler identity
+        (based on contents of compiler binary).
+        Falls back to building without compiler cache (with a warning) if ccache is not available,
+        or if the compilers being used are not supported.
+
+        :param wrap_compilers: put symlinks to ccache in place (via $PATH) for compiler commands
+        :return: path to ccache command, or None if compiler cache is not used
+        """
+        compiler_cache = self.cfg.get('compiler_cache', False)
+
+        if self.compiler_cache or not compiler_cache:
+            return self.compiler_cache
+
+        if build_option('use_%s' % CCACHE):
+            self.log.info("Compiler cache already enabled via --use-%s, so not preparing it again", CCACHE)
+            return None
+
+        ccache = which(CCACHE)
+        if ccache is None:
+            print_warning("Compiler cache requested but '%s' command not found, building without it" % CCACHE,
+                          silent=self.silent)
+            return None
+
+        try:
+            comp_fam = self.toolchain.comp_family()
+        except EasyBuildError:
+            comp_fam = None
+
+        # compiler families for which compiler cache is supported
+        supported_comp_fams = [toolchain.CLANG, toolchain.CLANGGCC, toolchain.GCC,  # @UndefinedVariable
+                               toolchain.INTELCOMP, toolchain.SYSTEM]  # @UndefinedVariable
+        if comp_fam not in supported_comp_fams:
+            print_warning("Compiler cache not supported for compiler family %s, building without it" % comp_fam,
+                          silent=self.silent)
+            return None
+
+        if isinstance(compiler_cache, string_type):
+            cache_dir = compiler_cache
+        else:
+            cache_dir = os.getenv('CCACHE_DIR') or os.path.join(build_path(), COMPILER_CACHE_SUBDIR)
+
+        setvar('CCACHE_DIR', cache_dir)
+        setvar('CCACHE_MAXSIZE', str(self.cfg.get('compiler_cache_max_size', '10G')))
+        # identify compilers by contents rather than by mtime, so reinstalled compilers are still cache hits
+        setvar('CCACHE_COMPILERCHECK', 'content')
+        # rewrite absolute paths in build directory to relative paths, so cache hits are possible across build dirs
+        setvar('CCACHE_BASEDIR', self.builddir)
+
+        if wrap_compilers:
+            compilers = self.toolchain.comp_cache_compilers(CCACHE)
+            self.toolchain.symlink_commands({CCACHE: (ccache, compilers)})
+            self.toolchain.cached_compilers.update(compilers)
+
+        self.compiler_cache = ccache
+        self.compiler_cache_stats = get_compiler_cache_stats(ccache)
+        self.log.info("Using compiler cache %s via %s", cache_dir, ccache)
+
+        return ccache
+
+    def report_compiler_cache_stats(self):
+        """
+        Report statistics for compiler cache for this build (if compiler cache is used).
+
+        Note: numbers may be inaccurate if the compiler cache is used by other builds at the same time.
+        """
+        if self.compiler_cache:
+            stats = get_compiler_cache_stats(self.compiler_cache)
+            hits = stats['hits'] - self.compiler_cache_stats['hits']
+            misses = stats['misses'] - self.compiler_cache_stats['misses']
+            hit_rate = 100.0 * hits / max(1, hits + misses)
+            self.log.info("Compiler cache statistics for this build: %d hits, %d misses (hit rate: %.1f%%)",
+                          hits, misses, hit_rate)
+            self.compiler_cache_stats = stats
+
     def fetch_step(self, *args, **kwargs):
         """Custom fetch step for ConfigureMake so we use an updated config.guess."""
         super(ConfigureMake, self).fetch_step(*args, **kwargs)
@@ -188,6 +306,8 @@ class ConfigureMake(EasyBlock):
         - typically ./configure --prefix=/install/path style
         """
 
+        self.prepare_compiler_cache()
+
         if self.cfg.get('configure_cmd_prefix'):
             if cmd_prefix:
                 tup = (cmd_prefix, self.cfg['configure_cmd_prefix'])
@@ -289,6 +409,8 @@ class ConfigureMake(EasyBlock):
 
         (out, _) = run_cmd(cmd, path=path, log_all=True, simple=False, log_output=verbose)
 
+        self.report_compiler_cache_stats()
+
         return out
 
     def test_step(self):
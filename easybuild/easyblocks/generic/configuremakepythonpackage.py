@@ -52,6 +52,10 @@ class ConfigureMakePythonPackage(ConfigureMake, PythonPackage):
         """Initialize with PythonPackage."""
         PythonPackage.__init__(self, *args, **kwargs)
 
+        # class variables that are normally initialized by ConfigureMake constructor
+        self.compiler_cache = None
+        self.compiler_cache_stats = None
+
     def configure_step(self, *args, **kwargs):
         """Configure build using 'python configure'."""
         PythonPackage.configure_step(self, *args, **kwargs)
@@ -0,0 +1,422 @@
+##
+# Copyright 2019 Ghent University
+#
+# This file is part of EasyBuild,
+# originally created by the HPC team of Ghent University (http://ugent.be/hpc/en),
+# with support of Ghent University (http://ugent.be/hpc),
+# the Flemish Supercomputer Centre (VSC) (https://www.vscentrum.be),
+# Flemish Research Foundation (FWO) (http://www.fwo.be/en)
+# and the Department of Economy, Science and Innovation (EWI) (http://www.ewi-vlaanderen.be/en).
+#
+# https://github.com/easybuilders/easybuild
+#
+# EasyBuild is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation v2.
+#
+# EasyBuild is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with EasyBuild.  If not, see <http://www.gnu.org/licenses/>.
+##
+"""
+Support for running tasks in parallel (each in a separate process, taking into account dependencies between them),
+and for installing extensions in parallel.
+
+Not an easyblock itself, but used by several (generic) easyblocks.
+"""
+import os
+import pickle
+import resource
+import signal
+import sys
+import tempfile
+import time
+
+import easybuild.tools.environment as env
+from easybuild.base import fancylogger
+from easybuild.framework.easyconfig import CUSTOM
+from easybuild.tools.build_log import EasyBuildError, print_msg
+from easybuild.tools.config import build_option
+from easybuild.tools.filetools import change_dir, read_file, remove_dir
+from easybuild.tools.utilities import nub
+
+
+# environment variables to disable binding of MPI processes to cores
+NO_MPI_BINDING_ENV = {
+    'HYDRA_BIND': 'none',  # MPICH & co (Hydra process manager)
+    'I_MPI_PIN': 'off',  # Intel MPI
+    'MV2_ENABLE_AFFINITY': '0',  # MVAPICH2
+    'OMPI_MCA_hwloc_base_binding_policy': 'none',  # Open MPI (equivalent to 'mpirun --bind-to none')
+}
+
+
+def _run_task(func, res_fn, task_logfile, logfile=None):
+    """
+    Run specified task function in current process, and write result to specified file (pickled).
+
+    Log messages are redirected to specified log file for the task (away from the specified log file, if any).
+    """
+    fancylogger.logToFile(task_logfile)
+    if logfile:
+        fancylogger.logToFile(logfile, enable=False)
+
+    try:
+        res = (True, func())
+    except EasyBuildError as err:
+        res = (False, err.msg)
+    except (Exception, KeyboardInterrupt, SystemExit) as err:
+        res = (False, str(err))
+
+    handle = open(res_fn, 'wb')
+    pickle.dump(res, handle)
+    handle.close()
+
+    return res[0]
+
+
+def _children_rusage():
+    """Return total CPU time (in seconds) and max. resident set size (in KB) of (terminated) child processes."""
+    rusage = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return (rusage.ru_utime + rusage.ru_stime, rusage.ru_maxrss)
+
+
+def run_tasks_parallel(tasks, max_workers, deps=None, logfile=None, done_callback=None):
+    """
+    Run tasks concurrently, taking into account dependencies between tasks.
+
+    Each task is run in a separate (forked) process, so tasks can freely change the current working directory
+    and environment, without affecting each other or the main process.
+    Log messages of each task are collected in a separate log file, which is included in the log
+    (in the order in which tasks were specified) once all tasks are done.
+
+    Tasks are run one after the other in the current process if max_workers is less than 2, or in dry run mode
+    (still taking into account dependencies between tasks).
+
+    :param tasks: list of (label, function) tuples; each function is called without arguments
+    :param max_workers: maximum number of tasks to run concurrently
+    :param deps: dict with list of labels of tasks that must be completed before task with specified label is started
+    :param logfile: path to log file, from which log messages of tasks should be redirected
+    :param done_callback: function to call (in current process) with label and return value of each completed task,
+                          before any tasks that depend on it are started
+    :return: dict with results per task label: return value of task function ('result', must be picklable),
+             wall time in seconds ('time'), CPU time in seconds ('cpu_time'),
+             and max. resident set size in KB ('max_rss', only reliable when tasks are run concurrently)
+    """
+    log = fancylogger.getLogger('run_tasks_parallel', fname=False)
+
+    if deps is None:
+        deps = {}
+
+    labels = [label for (label, _) in tasks]
+    for label in deps:
+        unknown_deps = [dep for dep in deps[label] if dep not in labels]
+        if label not in labels or unknown_deps:
+            raise EasyBuildError("Unknown tasks found in dependencies for task '%s': %s", label, unknown_deps)
+
+    res = {}
+
+    if max_workers < 2 or build_option('extended_dry_run'):
+        log.info("Running %d tasks one after the other: %s", len(tasks), ', '.join(labels))
+        task_funcs = dict(tasks)
+        pending = labels[:]
+        while pending:
+            # pick first task for which all dependencies are done
+            ready = [label for label in pending if all(dep in res for dep in deps.get(label, []))]
+            if not ready:
+                raise EasyBuildError("Circular dependencies found between tasks: %s", ', '.join(pending))
+            label, func = ready[0], task_funcs[ready[0]]
+            pending.remove(label)
+
+            start_time, (start_cpu_time, _) = time.time(), _children_rusage()
+            task_res = func()
+            cpu_time, max_rss = _children_rusage()
+            res[label] = {
+                'result': task_res,
+                'time': time.time() - start_time,
+                'cpu_time': cpu_time - start_cpu_time,
+                'max_rss': max_rss,
+            }
+            if done_callback:
+                done_callback(label, task_res)
+        return res
+
+    log.info("Running %d tasks using max. %d workers: %s", len(tasks), max_workers, ', '.join(labels))
+
+    tmpdir = tempfile.mkdtemp(prefix='eb-tasks-')
+    res_fns = dict((label, os.path.join(tmpdir, 'task%d.res' % idx)) for (idx, label) in enumerate(labels))
+    task_funcs = dict(tasks)
+    task_logfiles = dict((label, os.path.join(tmpdir, 'task%d.log' % idx)) for (idx, label) in enumerate(labels))
+    pending = labels[:]
+    running = {}
+    failed = []
+
+    try:
+        while pending or running:
+            # start tasks for which all dependencies are done, in order, as long as no task has failed
+            for label in pending[:]:
+                if failed or len(running) >= max_workers:
+                    break
+                if all(dep in res for dep in deps.get(label, [])):
+                    func = task_funcs[label]
+                    sys.stdout.flush()
+                    sys.stderr.flush()
+                    pid = os.fork()
+                    if pid == 0:
+                        # never return from forked child process, no matter what happens
+                        ec = 1
+                        try:
+                            if _run_task(func, res_fns[label], task_logfiles[label], logfile=logfile):
+                                ec = 0
+                        finally:
+                            sys.stdout.flush()
+                            sys.stderr.flush()
+                            os._exit(ec)
+
+                    log.info("Started task '%s' (PID %s)", label, pid)
+                    running[pid] = (label, time.time())
+                    pending.remove(label)
+
+            if not running:
+                if pending and not failed:
+                    raise EasyBuildError("Circular dependencies found between tasks: %s", ', '.join(pending))
+                break
+
+            # wait for any of the running tasks to finish
+            pid, status, rusage = os.wait4(-1, 0)
+            if pid not in running:
+                continue
+            label, start_time = running.pop(pid)
+
+            task_res = 'no result available (exit status %s)' % status
+            ok = False
+            if os.path.exists(res_fns[label]):
+                (ok, task_res) = pickle.load(open(res_fns[label], 'rb'))
+
+            if ok and status == 0:
+                res[label] = {
+                    'result': task_res,
+                    'time': time.time() - start_time,
+                    'cpu_time': rusage.ru_utime + rusage.ru_stime,
+                    'max_rss': rusage.ru_maxrss,
+                }
+                log.info("Task '%s' completed in %.1fs", label, res[label]['time'])
+                if done_callback:
+                    done_callback(label, task_res)
+            else:
+                log.warning("Task '%s' failed: %s", label, task_res)
+                failed.append((label, task_res))
+
+    except (Exception, KeyboardInterrupt):
+        # make sure that no tasks are left running behind
+        for pid in running:
+            os.kill(pid, signal.SIGTERM)
+        for pid in running:
+            os.waitpid(pid, 0)
+        raise
+
+    finally:
+        # include log messages of tasks in log, in order
+        for label in labels:
+            if os.path.exists(task_logfiles[label]):
+                log.info("Log output for task '%s':\n%s", label, read_file(task_logfiles[label]))
+        remove_dir(tmpdir)
+
+    if failed:
+        raise EasyBuildError("%d task(s) failed: %s", len(failed), '; '.join('%s (%s)' % x for x in failed))
+
+    return res
+
+
+def split_parallelism(parallel, cnt):
+    """
+    Split specified parallelism across specified number of concurrent tasks.
+
+    :return: number of concurrent tasks to use (at most cnt), and level of parallelism per task (at least 1)
+    """
+    workers = max(1, min(cnt, parallel))
+    return workers, max(1, parallel // workers)
+
+
+def no_mpi_binding_cmd(cmd):
+    """
+    Return command in which binding of MPI processes to cores is disabled, for commonly used MPI libraries.
+
+    This should be used for MPI programs that are run concurrently, since otherwise the processes of each of them
+    are bound to the same (first) cores.
+    """
+    return 'export %s && %s' % (' '.join('%s=%s' % x for x in sorted(NO_MPI_BINDING_ENV.items())), cmd)
+
+
+def det_max_concurrency(labels, deps):
+    """
+    Determine maximum number of tasks that can run concurrently, based on dependencies between tasks.
+
+    Tasks are grouped by the length of the longest chain of tasks they (indirectly) depend on;
+    the size of the largest group is used as the maximum number of concurrent tasks.
+
+    :param labels: list of task labels
+    :param deps: dictionary with list of labels of required tasks, for each task label
+    :return: maximum number of concurrent tasks (at least 1)
+    """
+    levels = {}
+
+    def det_level(label, seen):
+        """Determine level for task with specified label (0 if it does not depend on any other task)."""
+        if label not in levels:
+            if label in seen:
+                raise EasyBuildError("Circular dependencies found between tasks: %s", ', '.join(seen))
+            reqs = deps.get(label) or []
+            levels[label] = 1 + max([det_level(req, seen + [label]) for req in reqs] or [-1])
+        return levels[label]
+
+    level_cnts = {}
+    for label in labels:
+        level = det_level(label, [])
+        level_cnts[level] = level_cnts.get(level, 0) + 1
+
+    return max(list(level_cnts.values()) or [1])
+
+
+class ParallelExtsInstall(object):
+    """
+    Mixin class for easyblocks that support installing their extensions in parallel (see 'parallel_exts_install').
+
+    Extensions that support it (see DeferrableExtension) defer their installation while the extensions are processed;
+    deferred installations are performed in parallel at the end of the extensions step, or as soon as an extension
+    that can not be deferred is installed (since it may require the extensions listed before it).
+    """
+
+    @staticmethod
+    def extra_options(extra_vars=None):
+        """Easyconfig parameters specific to installing extensions in parallel."""
+        if extra_vars is None:
+            extra_vars = {}
+        extra_vars.update({
+            'parallel_exts_install': [False, "Install extensions in parallel (using 'parallel' workers), "
+                                             "taking into account dependencies between extensions", CUSTOM],
+        })
+        return extra_vars
+
+    def __init__(self, *args, **kwargs):
+        """Initialize list of extensions for which installation is deferred."""
+        super(ParallelExtsInstall, self).__init__(*args, **kwargs)
+
+        # list of extensions for which installation is deferred, so they can be installed in parallel
+        self.deferred_exts = None
+        if self.cfg['parallel_exts_install'] and not self.dry_run:
+            self.deferred_exts = []
+
+    def extensions_step(self, *args, **kwargs):
+        """Install extensions, incl. those for which installation was deferred to install them in parallel."""
+        super(ParallelExtsInstall, self).extensions_step(*args, **kwargs)
+        self.install_deferred_exts()
+
+    def install_deferred_exts(self):
+        """
+        Install extensions for which installation was deferred in parallel (using 'parallel' workers),
+        taking into account dependencies on extensions that are listed before them.
+        """
+        if not self.deferred_exts:
+            return
+
+        tasks, deps, exts = [], {}, {}
+        for idx, ext in enumerate(self.deferred_exts):
+            label = ext.deferred['label']
+            tasks.append((label, ext.install_deferred))
+            deps[label] = nub(x.deferred['label'] for x in self.deferred_exts[:idx]
+                              if x.deferred['name'] in ext.deferred['requires'])
+            exts[label] = ext
+            self.log.debug("Extensions required by extension %s: %s", label, deps[label])
+
+        def install_done(label, res):
+            """Process result of installing extension, before installing extensions that depend on it."""
+            exts[label].install_deferred_done(res)
+
+        max_workers = self.cfg['parallel']
+        print_msg("installing %d extensions in parallel (max. %d at a time)..." % (len(tasks), max_workers),
+                  silent=self.silent)
+
+        # installations are performed in the environment that was in place when they were deferred,
+        # so make sure the original environment is restored afterwards
+        orig_env, cwd = os.environ.copy(), os.getcwd()
+        try:
+            res = run_tasks_parallel(tasks, max_workers, deps=deps, logfile=self.logfile, done_callback=install_done)
+        finally:
+            env.restore_env(orig_env)
+            change_dir(cwd)
+
+        for label, _ in tasks:
+            self.log.info("Installation of extension %s took %.1f seconds", label, res[label]['time'])
+
+        self.deferred_exts = []
+
+
+class DeferrableExtension(object):
+    """
+    Mixin class for extensions for which installation can be deferred, so they can be installed in parallel,
+    if the parent easyblock supports it (see ParallelExtsInstall).
+
+    Deferred installations are performed in the working directory and environment that were in place
+    when installation was deferred (i.e. including the build environment prepared for that extension);
+    post-installation steps (postrun) are only performed once the extension is actually installed.
+    """
+
+    def __init__(self, *args, **kwargs):
+        """Initialize deferred installation details."""
+        super(DeferrableExtension, self).__init__(*args, **kwargs)
+
+        # details on deferred installation (see defer_install)
+        self.deferred = None
+
+    def can_defer_install(self):
+        """Determine whether installation of this extension can be deferred."""
+        if self.is_extension and isinstance(self.master, ParallelExtsInstall):
+            return self.master.deferred_exts is not None
+        return False
+
+    def defer_install(self, name, requires):
+        """
+        Defer installation of this extension.
+
+        :param name: name of this extension, as used in requirements of other extensions
+        :param requires: names of extensions that must be installed before this extension
+        """
+        self.deferred = {
+            'cwd': os.getcwd(),
+            'env': os.environ.copy(),
+            'label': '%s %s' % (self.name, self.version),
+            'name': name,
+            'requires': set(requires),
+        }
+        self.log.info("Deferring installation of extension %s, requires: %s", name, sorted(self.deferred['requires']))
+        self.master.deferred_exts.append(self)
+
+    def install_deferred(self):
+        """Perform deferred installation, in working directory and environment of when it was deferred."""
+        env.restore_env(self.deferred['env'])
+        change_dir(self.deferred['cwd'])
+        return self.deferred_install_step()
+
+    def deferred_install_step(self):
+        """
+        Actually install extension for which installation was deferred.
+
+        :return: (picklable) result that is passed to install_deferred_done
+        """
+        raise EasyBuildError("deferred_install_step not implemented for %s", self.__class__.__name__)
+
+    def install_deferred_done(self, res):
+        """Process result of deferred installation (in the main process), and perform post-installation steps."""
+        env.restore_env(self.deferred['env'])
+        change_dir(self.deferred['cwd'])
+        self.deferred = None
+        self.postrun()
+
+    def postrun(self):
+        """Perform post-installation steps, unless installation was deferred (see install_deferred_done)."""
+        if self.deferred is None:
+            super(DeferrableExtension, self).postrun()
@@ -30,7 +30,9 @@ EasyBuild support for Perl module, implemented as an easyblock
 """
 import os
 
-from easybuild.easyblocks.perl import EXTS_FILTER_PERL_MODULES, get_major_perl_version, get_site_suffix
+from easybuild.easyblocks.generic.batchcheck import batch_check_exts, batch_check_passed
+from easybuild.easyblocks.perl import EXTS_FILTER_PERL_MODULES, check_perl_modules, get_major_perl_version
+from easybuild.easyblocks.perl import get_site_suffix
 from easybuild.framework.easyconfig import CUSTOM
 from easybuild.framework.extensioneasyblock import ExtensionEasyBlock
 from easybuild.easyblocks.generic.configuremake import ConfigureMake
@@ -46,6 +48,8 @@ class PerlModule(ExtensionEasyBlock, ConfigureMake):
     def extra_options():
         """Easyconfig parameters specific to Perl modules."""
         extra_vars = {
+            'batch_module_check': [True, "Check availability of all Perl modules using a single Perl process, "
+                                         "only if the default filter for Perl modules is used", CUSTOM],
             'runtest': ['test', "Run unit tests.", CUSTOM],  # overrides default
         }
         return ExtensionEasyBlock.extra_options(extra_vars)
@@ -54,6 +58,8 @@ class PerlModule(ExtensionEasyBlock, ConfigureMake):
         """Initialize custom class variables."""
         super(PerlModule, self).__init__(*args, **kwargs)
         self.testcmd = None
+        # result of checking availability of Perl module (see batch_module_check)
+        self.batch_check_result = None
 
         # Environment variables PERL_MM_OPT and PERL_MB_OPT cause installations to fail.
         # Therefore it is better to unset these variables.
@@ -121,14 +127,49 @@ class PerlModule(ExtensionEasyBlock, ConfigureMake):
         """Run install procedure for Perl modules."""
         self.install_perl_module()
 
+    def get_exts_filter(self):
+        """Return filter to use for extension sanity check."""
+        # disabling templating is required here to support legacy string templates like name/version
+        self.cfg.enable_templating = False
+        res = self.cfg['exts_filter'] or EXTS_FILTER_PERL_MODULES
+        self.cfg.enable_templating = True
+        return tuple(res)
+
+    def batch_module_check(self):
+        """
+        Check availability of all Perl module extensions of the parent that use the default filter,
+        using a single Perl process. Result is stored in 'batch_check_result' of each extension (if available).
+        """
+        exts = []
+        for ext in self.master.ext_instances:
+            if isinstance(ext, PerlModule) and ext.batch_check_result is None and ext.cfg['batch_module_check']:
+                modname = ext.options.get('modulename', ext.name)
+                if ext.get_exts_filter() == EXTS_FILTER_PERL_MODULES and modname:
+                    exts.append((ext, modname))
+
+        batch_check_exts(exts, check_perl_modules, "availability of Perl modules")
+
     def sanity_check_step(self, *args, **kwargs):
         """
         Custom sanity check for Perl modules
         """
-        return ExtensionEasyBlock.sanity_check_step(self, EXTS_FILTER_PERL_MODULES, *args, **kwargs)
+        exts_filter = EXTS_FILTER_PERL_MODULES
+
+        # check availability of all Perl modules at once (if the default filter is used),
+        # only the extensions for which this fails are checked separately (using the filter command)
+        if self.is_extension and self.cfg['batch_module_check'] and not self.dry_run:
+            if self.batch_check_result is None and self.get_exts_filter() == EXTS_FILTER_PERL_MODULES:
+                self.batch_module_check()
+
+            if batch_check_passed(self, "availability of Perl module"):
+                self.cfg['exts_filter'] = None
+                exts_filter = None
+
+        return ExtensionEasyBlock.sanity_check_step(self, exts_filter, *args, **kwargs)
 
     def make_module_req_guess(self):
         """Customized dictionary of paths to look for with PERL*LIB."""
+        # %Config values are obtained via a single (cached) probe of the 'perl' command
         majver = get_major_perl_version()
         sitearchsuffix = get_site_suffix('sitearch')
         sitelibsuffix = get_site_suffix('sitelib')
@@ -30,13 +30,14 @@ EasyBuild support for installing a bundle of Python packages, implemented as a g
 import os
 
 from easybuild.easyblocks.generic.bundle import Bundle
+from easybuild.easyblocks.generic.paralleltasks import ParallelExtsInstall
 from easybuild.easyblocks.generic.pythonpackage import EBPYTHONPREFIXES, EXTS_FILTER_PYTHON_PACKAGES
 from easybuild.easyblocks.generic.pythonpackage import PythonPackage, det_pylibdir
 from easybuild.tools.build_log import EasyBuildError
 from easybuild.tools.modules import get_software_root
 
 
-class PythonBundle(Bundle):
+class PythonBundle(ParallelExtsInstall, Bundle):
     """
     Bundle of modules: only generate module files, nothing to build/install
     """
@@ -47,6 +48,7 @@ class PythonBundle(Bundle):
         if extra_vars is None:
             extra_vars = {}
         # combine custom easyconfig parameters of Bundle & PythonPackage
+        extra_vars = ParallelExtsInstall.extra_options(extra_vars)
         extra_vars = Bundle.extra_options(extra_vars)
         return PythonPackage.extra_options(extra_vars)
 
@@ -31,21 +31,26 @@ EasyBuild support for Python packages, implemented as an easyblock
 @author: Pieter De Baets (Ghent University)
 @author: Jens Timmerman (Ghent University)
 """
+import glob
+import hashlib
+import json
 import os
 import re
 import sys
 import tempfile
 from distutils.version import LooseVersion
-from distutils.sysconfig import get_config_vars
 
 import easybuild.tools.environment as env
 from easybuild.base import fancylogger
+from easybuild.easyblocks.generic.batchcheck import batch_check_exts, batch_check_passed, run_batch_check
+from easybuild.easyblocks.generic.paralleltasks import DeferrableExtension
 from easybuild.easyblocks.python import EBPYTHONPREFIXES, EXTS_FILTER_PYTHON_PACKAGES
 from easybuild.framework.easyconfig import CUSTOM
 from easybuild.framework.extensioneasyblock import ExtensionEasyBlock
 from easybuild.tools.build_log import EasyBuildError
-from easybuild.tools.config import build_option
-from easybuild.tools.filetools import mkdir, remove_dir, which
+from easybuild.tools.config import build_option, build_path
+from easybuild.tools.filetools import change_dir, compute_checksum, det_size, mkdir, read_file, remove_dir
+from easybuild.tools.filetools import remove_file, which, write_file
 from easybuild.tools.modules import get_software_root
 from easybuild.tools.py2vs3 import string_type
 from easybuild.tools.run import run_cmd
@@ -61,12 +66,160 @@ SETUP_PY_INSTALL_CMD = "%(python)s setup.py %(install_target)s --prefix=%(prefix
 SETUP_PY_DEVELOP_CMD = "%(python)s setup.py develop --prefix=%(prefix)s %(installopts)s"
 UNKNOWN = 'UNKNOWN'
 
+# environment variables that affect the wheel being built, see PythonPackage.get_cached_wheel
+WHEEL_CACHE_ENV_VARS = ['CC', 'CFLAGS', 'CPPFLAGS', 'CXX', 'CXXFLAGS', 'F77', 'F90', 'F90FLAGS', 'FC', 'FCFLAGS',
+                        'FFLAGS', 'LDFLAGS', 'LDSHARED', 'LIBS']
+# process-wide statistics for wheel cache
+_wheel_cache_stats = {'hits': 0, 'misses': 0, 'evicted': 0}
+
+# maximum time (in seconds) allowed for importing a single Python module, see check_python_imports
+PYTHON_IMPORT_CHECK_TIMEOUT = 300
+# script to check importing of Python modules (specified as arguments) in a single Python session;
+# result for each module is printed on a single line (as JSON), right after trying to import it
+PYTHON_IMPORT_CHECK_PREFIX = 'EB_IMPORT_CHECK '
+PYTHON_IMPORT_CHECK_SCRIPT = """
+import json
+import os
+import signal
+import sys
+import time
+import traceback
+
+# mimic 'python -c': look for modules in current working directory rather than location of this script
+sys.path[0] = os.getcwd()
+
+timeout = int(sys.argv[1])
+
+
+class ImportTimeout(Exception):
+    pass
+
+
+def timeout_handler(signum, frame):
+    raise ImportTimeout("import timed out after %%d seconds" %% timeout)
+
+
+signal.signal(signal.SIGALRM, timeout_handler)
+
+for modname in sys.argv[2:]:
+    res = {'name': modname, 'ok': True, 'error': ''}
+    start_time = time.time()
+    signal.alarm(timeout)
+    try:
+        __import__(modname)
+    except BaseException:
+        res.update({'ok': False, 'error': traceback.format_exc()})
+    signal.alarm(0)
+    res['time'] = time.time() - start_time
+    sys.stdout.write('\\n%s%%s\\n' %% json.dumps(res))
+    sys.stdout.flush()
+""" % PYTHON_IMPORT_CHECK_PREFIX
+
+
+# code to run with the Python command being probed, see probe_python;
+# all output lines are prefixed to allow filtering out other output (like warnings)
+PYTHON_PROBE_PREFIX = 'EB_PYTHON_PROBE '
+PYTHON_PROBE_LIBDIR_PREFIX = '/tmp/'
+PYTHON_PROBE_PYCODE = '; '.join([
+    'import sys',
+    'import distutils.sysconfig as dsc',
+    'print("%(pref)sversion=%%s.%%s.%%s" %% sys.version_info[:3])',
+    'print("%(pref)spurelib=%%s" %% dsc.get_python_lib(plat_specific=False, prefix="%(libpref)s"))',
+    'print("%(pref)splatlib=%%s" %% dsc.get_python_lib(plat_specific=True, prefix="%(libpref)s"))',
+    'print("%(pref)sabiflags=%%s" %% getattr(sys, "abiflags", ""))',
+    'print("%(pref)sldshared=%%s" %% (dsc.get_config_var("LDSHARED") or ""))',
+]) % {'pref': PYTHON_PROBE_PREFIX, 'libpref': PYTHON_PROBE_LIBDIR_PREFIX}
+
+# process-wide cache for results of probing 'python' commands, see probe_python
+_python_probe_cache = {}
+
+
+def python_probe_cache_key(python_cmd):
+    """
+    Determine key for cached probe results of specified 'python' command.
+
+    The key is composed of the resolved path to the Python interpreter (+ its mtime and inode),
+    the value of $PATH and the installation prefix of the Python module (if any),
+    so results are invalidated when either of these change.
+    Returns None if the 'python' command could not be resolved.
+    """
+    if os.path.isabs(python_cmd):
+        python_path = python_cmd
+    else:
+        python_path = which(python_cmd)
+
+    if python_path is None:
+        return None
+
+    python_path = os.path.realpath(python_path)
+    try:
+        python_stat = os.stat(python_path)
+    except OSError:
+        return None
+
+    return (python_path, python_stat.st_mtime, python_stat.st_ino, os.getenv('PATH'), get_software_root('Python'))
+
+
+def clear_python_probe_cache():
+    """Clear cached results of probing 'python' commands."""
+    _python_probe_cache.clear()
+
+
+def probe_python(python_cmd=None):
+    """
+    Probe specified 'python' command, using a single run of the Python interpreter.
+
+    Results are cached per Python interpreter, see python_probe_cache_key.
+
+    :param python_cmd: 'python' command to probe (if None: use 'python' that is listed first in $PATH)
+    :return: dict with Python version ('version'), library directories relative to installation prefix
+             ('purelib', 'platlib'), ABI flags ('abiflags') and value of $LDSHARED ('ldshared')
+    """
+    log = fancylogger.getLogger('probe_python', fname=False)
+
+    if python_cmd is None:
+        python_cmd = 'python'
+
+    key = python_probe_cache_key(python_cmd)
+    if key is not None and key in _python_probe_cache:
+        res = _python_probe_cache[key]
+        log.debug("Using cached probe results for Python command '%s': %s", python_cmd, res)
+        return dict(res)
+
+    # use run_cmd, we want to talk to the active Python, not the system Python running EasyBuild
+    cmd = "%s -c '%s'" % (python_cmd, PYTHON_PROBE_PYCODE)
+    log.debug("Probing Python command '%s' using command '%s'", python_cmd, cmd)
+    out, ec = run_cmd(cmd, simple=False, force_in_dry_run=True, trace=False)
+
+    res = {}
+    for line in out.split('\n'):
+        if line.startswith(PYTHON_PROBE_PREFIX):
+            probe_key, probe_value = line[len(PYTHON_PROBE_PREFIX):].split('=', 1)
+            res[probe_key] = probe_value.strip()
+
+    missing = [x for x in ['version', 'purelib', 'platlib', 'abiflags', 'ldshared'] if x not in res]
+    if missing:
+        raise EasyBuildError("Failed to determine %s by probing Python command '%s': %s (exit code %s)",
+                             ', '.join(missing), python_cmd, out, ec)
+
+    # library directories obtained should start with specified prefix, otherwise something is very wrong
+    for libdir_key in ['purelib', 'platlib']:
+        libdir = res[libdir_key]
+        if not libdir.startswith(PYTHON_PROBE_LIBDIR_PREFIX):
+            raise EasyBuildError("Python library directory obtained via %s does not start with prefix %s: %s",
+                                 cmd, PYTHON_PROBE_LIBDIR_PREFIX, libdir)
+        res[libdir_key] = libdir[len(PYTHON_PROBE_LIBDIR_PREFIX):]
+
+    log.debug("Probe results for Python command '%s': %s", python_cmd, res)
+    if key is not None:
+        _python_probe_cache[key] = res
+
+    return dict(res)
+
 
 def det_python_version(python_cmd):
     """Determine version of specified 'python' command."""
-    pycode = 'import sys; print("%s.%s.%s" % sys.version_info[:3])'
-    out, _ = run_cmd("%s -c '%s'" % (python_cmd, pycode), simple=False, trace=False)
-    return out.strip()
+    return probe_python(python_cmd)['version']
 
 
 def pick_python_cmd(req_maj_ver=None, req_min_ver=None):
@@ -103,7 +256,12 @@ def pick_python_cmd(req_maj_ver=None, req_min_ver=None):
             else:
                 req_majmin_ver = '%s.%s' % (req_maj_ver, req_min_ver)
 
-            pyver = det_python_version(python_cmd)
+            # a broken 'python' command should not prevent considering other 'python' commands
+            try:
+                pyver = det_python_version(python_cmd)
+            except EasyBuildError as err:
+                log.debug("Failed to determine version of Python command '%s': %s", python_cmd, err)
+                return False
 
             # (strict) check for major version
             maj_ver = pyver.split('.')[0]
@@ -151,33 +309,134 @@ def det_pylibdir(plat_specific=False, python_cmd=None):
     """Determine Python library directory."""
     log = fancylogger.getLogger('det_pylibdir', fname=False)
 
-    if python_cmd is None:
-        # use 'python' that is listed first in $PATH if none was specified
-        python_cmd = 'python'
+    # determine Python lib dir via distutils, using (cached) results of probing the active Python
+    if plat_specific:
+        pylibdir = probe_python(python_cmd)['platlib']
+    else:
+        pylibdir = probe_python(python_cmd)['purelib']
 
-    # determine Python lib dir via distutils
-    # use run_cmd, we can to talk to the active Python, not the system Python running EasyBuild
-    prefix = '/tmp/'
-    args = 'plat_specific=%s, prefix="%s"' % (plat_specific, prefix)
-    pycode = "import distutils.sysconfig; print(distutils.sysconfig.get_python_lib(%s))" % args
-    cmd = "%s -c '%s'" % (python_cmd, pycode)
+    log.debug("Determined pylibdir for '%s' (plat_specific: %s): %s", python_cmd, plat_specific, pylibdir)
+    return pylibdir
 
-    log.debug("Determining Python library directory using command '%s'", cmd)
 
-    out, ec = run_cmd(cmd, simple=False, force_in_dry_run=True, trace=False)
-    txt = out.strip().split('\n')[-1]
+def evict_wheel_cache(path, max_size, keep=None):
+    """
+    Evict least recently used entries from wheel cache at specified location, until its size is below the limit.
+
+    :param path: location of wheel cache
+    :param max_size: maximum size of wheel cache (in MB)
+    :param keep: path to entry that should not be evicted
+    :return: total size of wheel cache (in bytes) and number of entries in it, after eviction
+    """
+    log = fancylogger.getLogger('evict_wheel_cache', fname=False)
 
-    # value obtained should start with specified prefix, otherwise something is very wrong
-    if not txt.startswith(prefix):
-        raise EasyBuildError("Last line of output of %s does not start with specified prefix %s: %s (exit code %s)",
-                             cmd, prefix, out, ec)
+    # entries being created have a name starting with a dot
+    entries = []
+    for entry in os.listdir(path):
+        entry_path = os.path.join(path, entry)
+        if not entry.startswith('.') and os.path.isdir(entry_path) and entry_path != keep:
+            entries.append((os.path.getmtime(entry_path), entry_path, det_size(entry_path)))
 
-    pylibdir = txt[len(prefix):]
-    log.debug("Determined pylibdir using '%s': %s", cmd, pylibdir)
-    return pylibdir
+    # least recently used entries first
+    entries.sort()
+    total_size = sum(x[2] for x in entries)
+    if keep:
+        total_size += det_size(keep)
+
+    while entries and total_size > max_size * 1024 * 1024:
+        _, entry_path, entry_size = entries.pop(0)
+        log.info("Evicting entry %s from wheel cache (%d bytes)", entry_path, entry_size)
+        remove_dir(entry_path)
+        total_size -= entry_size
+        _wheel_cache_stats['evicted'] += 1
 
+    return total_size, len(entries) + int(bool(keep))
 
-class PythonPackage(ExtensionEasyBlock):
+
+def check_python_imports(python_cmd, modnames, timeout=PYTHON_IMPORT_CHECK_TIMEOUT):
+    """
+    Check importing of specified Python modules in a single Python session (in current working directory).
+
+    :param python_cmd: 'python' command to use
+    :param modnames: list of names of Python modules to import
+    :param timeout: maximum time (in seconds) allowed for importing a single module
+    :return: dict with result for each of the Python modules: whether import worked ('ok'),
+             time spent on import in seconds ('time') and error message ('error');
+             no result is available for modules that could not be checked (for example when Python crashed)
+    """
+    fd, script = tempfile.mkstemp(prefix='eb-import-check-', suffix='.py')
+    os.close(fd)
+    write_file(script, PYTHON_IMPORT_CHECK_SCRIPT)
+
+    def parse_result(txt):
+        """Parse result for a single Python module (in JSON format)."""
+        modres = json.loads(txt)
+        return (modres.pop('name'), modres)
+
+    cmd = ' '.join([python_cmd, script, str(timeout)] + modnames)
+    res = run_batch_check(cmd, modnames, PYTHON_IMPORT_CHECK_PREFIX, parse_result)
+    remove_file(script)
+
+    return res
+
+
+def normalize_python_pkg_name(name):
+    """Normalize name of Python package, cfr. PEP 503."""
+    return re.sub(r'[-_.]+', '-', name).lower()
+
+
+def det_python_requirements(path):
+    """
+    Determine names of Python packages required by Python package unpacked at specified location,
+    based on the metadata included in the sources (*.egg-info/requires.txt, PKG-INFO, pyproject.toml).
+
+    Optional requirements (extras) are not taken into account.
+    :return: set of normalized names of required Python packages
+    """
+    name_regex = re.compile(r'^\s*([A-Za-z0-9][A-Za-z0-9._-]*)')
+
+    reqs = []
+    for req_txt in glob.glob(os.path.join(path, '*.egg-info', 'requires.txt')):
+        for line in read_file(req_txt).split('\n'):
+            # requirements listed under a [section] header are only required for extras or specific environments
+            if line.strip().startswith('['):
+                break
+            reqs.append(line)
+
+    pkg_info = os.path.join(path, 'PKG-INFO')
+    if os.path.isfile(pkg_info):
+        requires_dist_regex = re.compile(r'^Requires-Dist:\s*(.*)$', re.M)
+        reqs.extend(x for x in requires_dist_regex.findall(read_file(pkg_info)) if 'extra' not in x)
+
+    pyproject_toml = os.path.join(path, 'pyproject.toml')
+    if os.path.isfile(pyproject_toml):
+        build_reqs_regex = re.compile(r'^\[build-system\][^[]*?^requires\s*=\s*\[([^]]*)\]', re.M | re.S)
+        res = build_reqs_regex.search(read_file(pyproject_toml))
+        if res:
+            reqs.extend(x.strip().strip('"\'') for x in res.group(1).split(','))
+
+    res = set()
+    for req in reqs:
+        name = name_regex.search(req)
+        if name:
+            res.add(normalize_python_pkg_name(name.group(1)))
+
+    return res
+
+
+def install_updates_pth_files(install_cmd, use_pip_editable=False):
+    """
+    Determine whether specified install command may update .pth files (like easy-install.pth) in site-packages,
+    which would be shared with other Python packages that are installed in the same prefix.
+
+    Only (non-editable) installations with pip leave existing .pth files alone;
+    'setup.py install' (for setuptools-based packages), 'setup.py develop' and easy_install
+    update easy-install.pth for every installed package.
+    """
+    return not install_cmd.startswith(PIP_INSTALL_CMD) or use_pip_editable
+
+
+class PythonPackage(DeferrableExtension, ExtensionEasyBlock):
     """Builds and installs a Python package, and provides a dedicated module file."""
 
     @staticmethod
@@ -186,6 +445,8 @@ class PythonPackage(ExtensionEasyBlock):
         if extra_vars is None:
             extra_vars = {}
         extra_vars.update({
+            'batch_import_check': [True, "Check importing of Python modules for all Python package extensions "
+                                         "in a single Python session (failures are checked again separately)", CUSTOM],
             'buildcmd': ['build', "Command to pass to setup.py to build the extension", CUSTOM],
             'check_ldshared': [None, 'Check Python value of $LDSHARED, correct if needed to "$CC -shared"', CUSTOM],
             'download_dep_fail': [None, "Fail if downloaded dependencies are detected", CUSTOM],
@@ -193,6 +454,8 @@ class PythonPackage(ExtensionEasyBlock):
             'pip_ignore_installed': [True, "Let pip ignore installed Python packages (i.e. don't remove them)", CUSTOM],
             'req_py_majver': [2, "Required major Python version (only relevant when using system Python)", CUSTOM],
             'req_py_minver': [6, "Required minor Python version (only relevant when using system Python)", CUSTOM],
+            'requires_exts': [[], "List of names of extensions that must be installed first "
+                                  "(only relevant when installing extensions in parallel)", CUSTOM],
             'runtest': [True, "Run unit tests.", CUSTOM],  # overrides default
             'unpack_sources': [True, "Unpack sources prior to build/install", CUSTOM],
             'use_easy_install': [False, "Install using '%s' (deprecated)" % EASY_INSTALL_INSTALL_CMD, CUSTOM],
@@ -200,6 +463,9 @@ class PythonPackage(ExtensionEasyBlock):
             'use_pip_editable': [False, "Install using 'pip install --editable'", CUSTOM],
             'use_pip_for_deps': [False, "Install dependencies using '%s'" % PIP_INSTALL_CMD, CUSTOM],
             'use_setup_py_develop': [False, "Install using '%s' (deprecated)" % SETUP_PY_DEVELOP_CMD, CUSTOM],
+            'wheel_cache': [None, "Location of cache for wheels built with 'pip wheel' "
+                                  "(True: use 'wheelcache' subdirectory of build path; requires use_pip)", CUSTOM],
+            'wheel_cache_max_size': [10240, "Maximum size of wheel cache (in MB)", CUSTOM],
             'zipped_egg': [False, "Install as a zipped eggs (requires use_easy_install)", CUSTOM],
         })
         return ExtensionEasyBlock.extra_options(extra_vars=extra_vars)
@@ -223,6 +489,9 @@ class PythonPackage(ExtensionEasyBlock):
 
         self.install_cmd_output = ''
 
+        # result of checking import of Python module (see batch_import_check)
+        self.batch_check_result = None
+
         # make sure there's no site.cfg in $HOME, because setup.py will find it and use it
         home = os.path.expanduser('~')
         if os.path.exists(os.path.join(home, 'site.cfg')):
@@ -405,6 +674,14 @@ class PythonPackage(ExtensionEasyBlock):
         if installopts is None:
             installopts = self.cfg['installopts']
 
+        if self.cfg.get('wheel_cache') and not self.dry_run:
+            if self.install_cmd == PIP_INSTALL_CMD and not self.cfg.get('use_pip_editable', False):
+                wheel = self.get_cached_wheel(loc, installopts)
+                if wheel:
+                    loc = wheel
+            else:
+                self.log.info("Not using wheel cache, only supported when installing with 'pip install'")
+
         if self.cfg.get('use_pip_editable', False):
             # add --editable option when requested, in the right place (i.e. right before the location specification)
             loc = "--editable %s" % loc
@@ -422,6 +699,83 @@ class PythonPackage(ExtensionEasyBlock):
 
         return ' '.join(cmd)
 
+    def get_cached_wheel(self, loc, installopts):
+        """
+        Obtain wheel for this Python package from wheel cache, after building it with 'pip wheel' if needed.
+
+        Wheels are cached using a key composed of the checksums of the sources & patches, the toolchain,
+        the Python version and relevant environment variables (see WHEEL_CACHE_ENV_VARS).
+
+        :param loc: location of sources to build wheel from
+        :param installopts: options for install command
+        :return: path to cached wheel, or None if wheel could not be built
+        """
+        if isinstance(self.src, string_type):
+            src_paths = [self.src]
+        else:
+            src_paths = [src['path'] for src in self.src]
+        patch_paths = [p['path'] if isinstance(p, dict) else p for p in self.patches]
+
+        key_items = [compute_checksum(path, checksum_type='sha256') for path in src_paths + patch_paths]
+        key_items.extend([self.name, self.version, self.toolchain.name, self.toolchain.version])
+        key_items.append(probe_python(self.python_cmd)['version'])
+        key_items.extend('%s=%s' % (key, os.getenv(key, '')) for key in WHEEL_CACHE_ENV_VARS)
+        key_items.extend([self.cfg['preinstallopts'], installopts])
+        key = hashlib.sha256('\n'.join(key_items).encode('utf-8')).hexdigest()
+        self.log.debug("Key for wheel cache for %s: %s (based on: %s)", self.name, key, key_items)
+
+        wheel_cache = self.cfg['wheel_cache']
+        if wheel_cache is True:
+            wheel_cache = os.path.join(build_path(), 'wheelcache')
+        mkdir(wheel_cache, parents=True)
+
+        entry = os.path.join(wheel_cache, key)
+        wheels = glob.glob(os.path.join(entry, '*.whl'))
+        if wheels:
+            self.log.info("Found wheel for %s in wheel cache: %s", self.name, wheels[0])
+            _wheel_cache_stats['hits'] += 1
+            # mark entry as recently used
+            os.utime(entry, None)
+        else:
+            _wheel_cache_stats['misses'] += 1
+
+            # build wheel in temporary directory, and move it in place once it's built;
+            # this avoids that incomplete entries are picked up (for example when installing extensions in parallel)
+            tmpdir = tempfile.mkdtemp(prefix='.%s-' % key, dir=wheel_cache)
+            wheel_opts = ['--no-deps', '--wheel-dir=%s' % tmpdir]
+            if '--no-build-isolation' in installopts:
+                wheel_opts.append('--no-build-isolation')
+            cmd = ' '.join([self.cfg['preinstallopts'], 'pip wheel'] + wheel_opts + [loc])
+            (out, ec) = run_cmd(cmd, log_all=False, log_ok=False, simple=False)
+
+            wheels = glob.glob(os.path.join(tmpdir, '*.whl'))
+            if ec or len(wheels) != 1:
+                self.log.warning("Failed to build wheel for %s (exit code %s), not using wheel cache: %s",
+                                 self.name, ec, out)
+                remove_dir(tmpdir)
+                return None
+
+            try:
+                os.rename(tmpdir, entry)
+            except OSError as err:
+                # entry may have been created in the meantime
+                self.log.info("Failed to move %s to %s (%s), discarding it", tmpdir, entry, err)
+                remove_dir(tmpdir)
+
+            wheels = glob.glob(os.path.join(entry, '*.whl'))
+            if not wheels:
+                # entry that was created in the meantime may have been evicted already, or be incomplete
+                self.log.warning("No wheel found for %s in %s, not using wheel cache", self.name, entry)
+                return None
+            self.log.info("Added wheel for %s to wheel cache: %s", self.name, wheels[0])
+
+        cache_size, cache_cnt = evict_wheel_cache(wheel_cache, self.cfg['wheel_cache_max_size'], keep=entry)
+        stats = ["%s %s" % (_wheel_cache_stats[x], x) for x in ['hits', 'misses', 'evicted']]
+        self.log.info("Wheel cache stats: %s; %d entries, %.1f MB (max. %s MB) in %s", ', '.join(stats),
+                      cache_cnt, cache_size / (1024.0 * 1024), self.cfg['wheel_cache_max_size'], wheel_cache)
+
+        return wheels[0]
+
     def extract_step(self):
         """Unpack source files, unless instructed otherwise."""
         if self.cfg.get('unpack_sources', True):
@@ -480,7 +834,7 @@ class PythonPackage(ExtensionEasyBlock):
         # ensure that LDSHARED uses CC
         if self.cfg.get('check_ldshared', False):
             curr_cc = os.getenv('CC')
-            python_ldshared = get_config_vars('LDSHARED')[0]
+            python_ldshared = probe_python(self.python_cmd)['ldshared']
             if python_ldshared and curr_cc:
                 if python_ldshared.split(' ')[0] == curr_cc:
                     self.log.info("Python's value for $LDSHARED ('%s') uses current $CC value ('%s'), not touching it",
@@ -592,12 +946,85 @@ class PythonPackage(ExtensionEasyBlock):
         kwargs.setdefault('unpack_src', self.cfg.get('unpack_sources', True))
         super(PythonPackage, self).run(*args, **kwargs)
 
+        # if the parent installs extensions in parallel, installation is deferred (see install_deferred_exts),
+        # but only if the run method is not customised (since it may require the extension to be installed)
+        if self.can_defer_install():
+            run_method = getattr(self.run, '__func__', self.run)
+            if run_method is getattr(PythonPackage.run, '__func__', PythonPackage.run):
+                requires = set(normalize_python_pkg_name(x) for x in self.cfg['requires_exts'])
+                if self.ext_dir:
+                    requires.update(det_python_requirements(self.ext_dir))
+                self.defer_install(normalize_python_pkg_name(self.name), requires)
+                return
+            else:
+                # extensions for which installation was deferred may be required for this one
+                self.master.install_deferred_exts()
+
         # configure, build, test, install
         self.configure_step()
         self.build_step()
         self.test_step()
         self.install_step()
 
+    def can_defer_install(self):
+        """
+        Determine whether installation of this extension can be deferred.
+
+        Installations that update .pth files in site-packages are not deferred, since they are not safe to perform
+        concurrently with other installations in the same prefix: entries for other Python packages may get lost.
+        """
+        res = super(PythonPackage, self).can_defer_install()
+        if res and install_updates_pth_files(self.install_cmd, self.cfg.get('use_pip_editable', False)):
+            self.log.info("Not deferring installation of extension %s, since it may update .pth files", self.name)
+            res = False
+        return res
+
+    def deferred_install_step(self):
+        """Install extension for which installation was deferred; return output of install command."""
+        self.configure_step()
+        self.build_step()
+        self.test_step()
+        self.install_step()
+
+        return self.install_cmd_output
+
+    def install_deferred_done(self, res):
+        """Keep track of output of install command for extension for which installation was deferred."""
+        self.install_cmd_output = res
+        super(PythonPackage, self).install_deferred_done(res)
+
+    def get_exts_filter(self, exts_filter):
+        """Return filter to use for extension sanity check, taking into account the specified default filter."""
+        # disabling templating is required here to support legacy string templates like name/version
+        self.cfg.enable_templating = False
+        res = self.cfg['exts_filter'] or exts_filter
+        self.cfg.enable_templating = True
+        return tuple(res) if res else res
+
+    def batch_import_check(self, exts_filters):
+        """
+        Check importing of Python modules for all Python package extensions of the parent in a single Python session,
+        for those that use the same 'python' command and one of the specified filters
+        (the first one being the default) to check the import.
+        Result is stored in 'batch_check_result' of each extension (if available).
+        """
+        exts = []
+        for ext in self.master.ext_instances:
+            if isinstance(ext, PythonPackage) and ext.batch_check_result is None and ext.cfg['batch_import_check']:
+                modname = ext.options.get('modulename', ext.name)
+                if ext.python_cmd == self.python_cmd and ext.get_exts_filter(exts_filters[0]) in exts_filters:
+                    if modname:
+                        exts.append((ext, modname))
+
+        def check_imports(modnames):
+            """Check importing of specified Python modules, from installation directory."""
+            cwd = change_dir(self.installdir)
+            res = check_python_imports(self.python_cmd, modnames)
+            change_dir(cwd)
+            return res
+
+        batch_check_exts(exts, check_imports, "import of Python modules")
+
     def sanity_check_step(self, *args, **kwargs):
         """
         Custom sanity check for Python packages
@@ -645,6 +1072,19 @@ class PythonPackage(ExtensionEasyBlock):
                 exts_filter = (orig_exts_filter[0].replace('python', self.python_cmd), orig_exts_filter[1])
                 kwargs.update({'exts_filter': exts_filter})
 
+            # check importing of Python modules for all extensions at once (if the default filter is used),
+            # only the extensions for which this fails are checked separately (using the filter command)
+            orig_exts_filter = EXTS_FILTER_PYTHON_PACKAGES
+            exts_filters = [(orig_exts_filter[0].replace('python', self.python_cmd), orig_exts_filter[1]),
+                            orig_exts_filter]
+            if self.is_extension and self.cfg['batch_import_check'] and not self.dry_run:
+                if self.batch_check_result is None and self.get_exts_filter(kwargs['exts_filter']) in exts_filters:
+                    self.batch_import_check(exts_filters)
+
+                if batch_check_passed(self, "import of Python module"):
+                    self.cfg['exts_filter'] = None
+                    kwargs['exts_filter'] = None
+
         parent_success, parent_fail_msg = super(PythonPackage, self).sanity_check_step(*args, **kwargs)
 
         if parent_fail_msg:
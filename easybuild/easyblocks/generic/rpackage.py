@@ -33,16 +33,46 @@ EasyBuild support for building and installing R packages, implemented as an easy
 @author: Balazs Hajgato (Vrije Universiteit Brussel)
 """
 import os
+import re
 import shutil
+import tarfile
 
+from easybuild.easyblocks.generic.batchcheck import batch_check_exts, batch_check_passed, run_batch_check
+from easybuild.easyblocks.generic.paralleltasks import DeferrableExtension
 from easybuild.easyblocks.r import EXTS_FILTER_R_PACKAGES, EB_R
 from easybuild.framework.easyconfig import CUSTOM
 from easybuild.framework.extensioneasyblock import ExtensionEasyBlock
 from easybuild.tools.build_log import EasyBuildError
-from easybuild.tools.filetools import mkdir
+from easybuild.tools.filetools import change_dir, mkdir, read_file
 from easybuild.tools.run import run_cmd, parse_log_for_error
 
 
+# packages that are part of R itself (and can hence be ignored as dependencies), see det_r_pkg_deps
+R_BASE_PKGS = ['R', 'base', 'compiler', 'datasets', 'grDevices', 'graphics', 'grid', 'methods', 'parallel',
+               'splines', 'stats', 'stats4', 'tcltk', 'tools', 'utils']
+
+# maximum time (in seconds) allowed for loading a single R package, see check_r_libraries
+R_LOAD_CHECK_TIMEOUT = 300
+# R code to check loading of R packages in a single R session;
+# result for each package is printed on a single line (tab-separated), right after trying to load it
+R_LOAD_CHECK_PREFIX = 'EB_LOAD_CHECK'
+R_LOAD_CHECK_CODE = """
+eb_load_check <- function(pkg, timeout) {
+    start_time <- proc.time()[["elapsed"]]
+    err <- tryCatch({
+        setTimeLimit(elapsed=timeout, transient=TRUE)
+        library(pkg, character.only=TRUE)
+        ""
+    }, error=function(e) conditionMessage(e))
+    setTimeLimit(elapsed=Inf)
+    ok <- if (err == "") "OK" else "FAILED"
+    elapsed <- proc.time()[["elapsed"]] - start_time
+    cat(sprintf("\\n%(prefix)s\\t%%s\\t%%s\\t%%.3f\\t%%s\\n", pkg, ok, elapsed, gsub("[\\t\\n]", " ", err)))
+}
+for (pkg in c(%(pkgs)s)) eb_load_check(pkg, %(timeout)s)
+"""
+
+
 def make_R_install_option(opt, values, cmdline=False):
     """
     Make option list for install.packages, to specify in R environment.
@@ -62,7 +92,70 @@ def make_R_install_option(opt, values, cmdline=False):
     return txt
 
 
-class RPackage(ExtensionEasyBlock):
+def det_r_pkg_deps(path):
+    """
+    Determine names of R packages required by R package at specified location (source tarball or directory),
+    based on the 'Depends', 'Imports' and 'LinkingTo' fields in the DESCRIPTION file.
+    Packages that are part of R itself are not included.
+
+    For source tarballs, only the DESCRIPTION file is read (the tarball is not unpacked).
+    :return: set of names of required R packages
+    """
+    descr = None
+    if os.path.isdir(path):
+        descr_path = os.path.join(path, 'DESCRIPTION')
+        if os.path.isfile(descr_path):
+            descr = read_file(descr_path)
+    elif tarfile.is_tarfile(path):
+        tar = tarfile.open(path, 'r:*')
+        for member in tar:
+            # DESCRIPTION file is located in top-level directory, which is named after the R package
+            if member.isfile() and re.match(r'^(\./)?[^/]+/DESCRIPTION$', member.name):
+                descr = tar.extractfile(member).read().decode('utf-8', 'ignore')
+                break
+        tar.close()
+
+    res = set()
+    if descr is not None:
+        # field values may be continued on next line(s), which start with whitespace
+        field_regex = re.compile(r'^(?:Depends|Imports|LinkingTo):(.*(?:\n[ \t].*)*)', re.M)
+        for field_value in field_regex.findall(descr):
+            for dep in field_value.split(','):
+                # strip off version requirement, e.g. 'Rcpp (>= 0.11.0)'
+                dep = re.sub(r'\(.*\)', '', dep).strip()
+                if dep and dep not in R_BASE_PKGS:
+                    res.add(dep)
+
+    return res
+
+
+def check_r_libraries(names, timeout=R_LOAD_CHECK_TIMEOUT):
+    """
+    Check loading of specified R packages in a single R session (in current working directory).
+
+    :param names: list of names of R packages to load
+    :param timeout: maximum time (in seconds) allowed for loading a single R package
+    :return: dict with result for each of the R packages: whether loading worked ('ok'),
+             time spent on loading in seconds ('time') and error message ('error');
+             no result is available for packages that could not be checked (for example when R crashed)
+    """
+    r_code = R_LOAD_CHECK_CODE % {
+        'pkgs': ', '.join('"%s"' % name for name in names),
+        'prefix': R_LOAD_CHECK_PREFIX,
+        'timeout': timeout,
+    }
+
+    def parse_result(txt):
+        """Parse (tab-separated) result for a single R package."""
+        fields = txt.split('\t')
+        if len(fields) == 5:
+            return (fields[1], {'ok': fields[2] == 'OK', 'time': float(fields[3]), 'error': fields[4]})
+        return None
+
+    return run_batch_check("R -q --no-save", names, R_LOAD_CHECK_PREFIX, parse_result, inp=r_code)
+
+
+class RPackage(DeferrableExtension, ExtensionEasyBlock):
     """
     Install an R package as a separate module, or as an extension.
     """
@@ -72,6 +165,8 @@ class RPackage(ExtensionEasyBlock):
         """Extra easyconfig parameters specific to RPackage."""
         extra_vars = ExtensionEasyBlock.extra_options(extra_vars=extra_vars)
         extra_vars.update({
+            'batch_load_check': [True, "Check loading of all R package extensions in a single R session "
+                                       "(failures are checked again separately)", CUSTOM],
             'exts_subdir': ['', "Subdirectory where R extensions should be installed info", CUSTOM],
             'unpack_sources': [False, "Unpack sources before installation", CUSTOM],
         })
@@ -86,6 +181,12 @@ class RPackage(ExtensionEasyBlock):
         self.configureargs = []
         self.ext_src = None
 
+        # install command, only relevant when installation of this extension is deferred (see run)
+        self.deferred_cmd = None
+
+        # result of checking loading of R package (see batch_load_check)
+        self.batch_check_result = None
+
     def make_r_cmd(self, prefix=None):
         """Create a command to run in R to install an R package."""
         confvars = "confvars"
@@ -220,21 +321,77 @@ class RPackage(ExtensionEasyBlock):
         else:
             super(RPackage, self).run()
 
+        # if the parent installs extensions in parallel, installation is deferred (see install_deferred_exts)
         if self.src:
             self.ext_src = self.src
             self.log.debug("Installing R package %s version %s." % (self.name, self.version))
             cmd, stdin = self.make_cmdline_cmd(prefix=lib_install_prefix)
+
+            if self.can_defer_install():
+                # use per-package lock, rather than locking the whole library directory
+                self.deferred_cmd = cmd + ' --pkglock'
+                self.defer_install(self.name, det_r_pkg_deps(self.ext_dir or self.ext_src))
+                return
         else:
             self.log.debug("Installing most recent version of R package %s (source not found)." % self.name)
             cmd, stdin = self.make_r_cmd(prefix=lib_install_prefix)
 
+            # extensions for which installation was deferred may be required for this one
+            if self.can_defer_install():
+                self.master.install_deferred_exts()
+
         self.install_R_package(cmd, inp=stdin)
 
+    def deferred_install_step(self):
+        """Install R package for which installation was deferred."""
+        self.install_R_package(self.deferred_cmd)
+
+    def get_exts_filter(self):
+        """Return filter to use for extension sanity check."""
+        # disabling templating is required here to support legacy string templates like name/version
+        self.cfg.enable_templating = False
+        res = self.cfg['exts_filter'] or EXTS_FILTER_R_PACKAGES
+        self.cfg.enable_templating = True
+        return tuple(res)
+
+    def batch_load_check(self):
+        """
+        Check loading of all R package extensions of the parent that use the default filter in a single R session.
+        Result is stored in 'batch_check_result' of each extension (if available).
+        """
+        exts = []
+        for ext in self.master.ext_instances:
+            if isinstance(ext, RPackage) and ext.batch_check_result is None and ext.cfg['batch_load_check']:
+                modname = ext.options.get('modulename', ext.name)
+                if ext.get_exts_filter() == EXTS_FILTER_R_PACKAGES and modname:
+                    exts.append((ext, modname))
+
+        def check_loading(names):
+            """Check loading of specified R packages, from installation directory."""
+            cwd = change_dir(self.installdir)
+            res = check_r_libraries(names)
+            change_dir(cwd)
+            return res
+
+        batch_check_exts(exts, check_loading, "loading of R packages")
+
     def sanity_check_step(self, *args, **kwargs):
         """
         Custom sanity check for R packages
         """
-        return super(RPackage, self).sanity_check_step(EXTS_FILTER_R_PACKAGES, *args, **kwargs)
+        exts_filter = EXTS_FILTER_R_PACKAGES
+
+        # check loading of all R packages at once (if the default filter is used),
+        # only the extensions for which this fails are checked separately (using the filter command)
+        if self.is_extension and self.cfg['batch_load_check'] and not self.dry_run:
+            if self.batch_check_result is None and self.get_exts_filter() == EXTS_FILTER_R_PACKAGES:
+                self.batch_load_check()
+
+            if batch_check_passed(self, "loading of R package"):
+                self.cfg['exts_filter'] = None
+                exts_filter = None
+
+        return super(RPackage, self).sanity_check_step(exts_filter, *args, **kwargs)
 
     def make_module_extra(self):
         """Add install path to R_LIBS"""
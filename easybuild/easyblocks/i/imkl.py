@@ -34,18 +34,18 @@ EasyBuild support for installing the Intel Math Kernel Library (MKL), implemente
 @author: Lumir Jasiok (IT4Innovations)
 """
 
+import functools
 import itertools
 import os
-import shutil
 import tempfile
 from distutils.version import LooseVersion
 
-import easybuild.tools.environment as env
 import easybuild.tools.toolchain as toolchain
 from easybuild.easyblocks.generic.intelbase import IntelBase, ACTIVATION_NAME_2012, LICENSE_FILE_NAME_2012
+from easybuild.easyblocks.generic.paralleltasks import run_tasks_parallel
 from easybuild.framework.easyconfig import CUSTOM
 from easybuild.tools.build_log import EasyBuildError
-from easybuild.tools.filetools import apply_regex_substitutions, change_dir, rmtree2
+from easybuild.tools.filetools import apply_regex_substitutions, change_dir, copy_dir, mkdir, rmtree2
 from easybuild.tools.modules import get_software_root
 from easybuild.tools.run import run_cmd
 from easybuild.tools.systemtools import get_shared_lib_ext
@@ -287,10 +287,12 @@ class EB_imkl(IntelBase):
                 for lib in self.cdftlibs:
                     apply_regex_substitutions(os.path.join(interfacedir, lib, 'makefile'), regex_subs)
 
+            # determine all combinations of interface library, flags and extra options to build
+            builds = []
             for lib in fftw2libs + fftw3libs + self.cdftlibs:
                 buildopts = [compopt]
                 if lib in fftw3libs:
-                    buildopts.append('install_to=$INSTALL_DIR')
+                    buildopts.append('install_to=%(install_dir)s')
                 elif lib in self.cdftlibs:
                     if self.mpi_spec is not None:
                         buildopts.append('mpi=%s' % self.mpi_spec)
@@ -308,48 +310,86 @@ class EB_imkl(IntelBase):
                 allopts = [list(opts) for opts in itertools.product(intflags, precflags)]
 
                 for flags, extraopts in itertools.product(['', '-fPIC'], allopts):
-                    tup = (lib, flags, buildopts, extraopts)
-                    self.log.debug("Building lib %s with: flags %s, buildopts %s, extraopts %s" % tup)
-
-                    tmpbuild = tempfile.mkdtemp(dir=self.builddir)
-                    self.log.debug("Created temporary directory %s" % tmpbuild)
-
-                    # always set INSTALL_DIR, SPEC_OPT, COPTS and CFLAGS
-                    # fftw2x(c|f): use $INSTALL_DIR, $CFLAGS and $COPTS
-                    # fftw3x(c|f): use $CFLAGS
-                    # fftw*cdft: use $INSTALL_DIR and $SPEC_OPT
-                    env.setvar('INSTALL_DIR', tmpbuild)
-                    env.setvar('SPEC_OPT', flags)
-                    env.setvar('COPTS', flags)
-                    env.setvar('CFLAGS', flags)
-
-                    try:
-                        intdir = os.path.join(interfacedir, lib)
-                        os.chdir(intdir)
-                        self.log.info("Changed to interface %s directory %s" % (lib, intdir))
-                    except OSError as err:
-                        raise EasyBuildError("Can't change to interface %s directory %s: %s", lib, intdir, err)
-
-                    fullcmd = "%s %s" % (cmd, ' '.join(buildopts + extraopts))
-                    res = run_cmd(fullcmd, log_all=True, simple=True)
-                    if not res:
-                        raise EasyBuildError("Building %s (flags: %s, fullcmd: %s) failed", lib, flags, fullcmd)
-
-                    for fn in os.listdir(tmpbuild):
-                        src = os.path.join(tmpbuild, fn)
-                        if flags == '-fPIC':
-                            # add _pic to filename
-                            ff = fn.split('.')
-                            fn = '.'.join(ff[:-1]) + '_pic.' + ff[-1]
-                        dest = os.path.join(self.installdir, libsubdir, fn)
-                        try:
-                            if os.path.isfile(src):
-                                shutil.move(src, dest)
-                                self.log.info("Moved %s to %s" % (src, dest))
-                        except OSError as err:
-                            raise EasyBuildError("Failed to move %s to %s: %s", src, dest, err)
-
-                    rmtree2(tmpbuild)
+                    builds.append((lib, flags, buildopts, extraopts))
+
+            self.build_interfaces(interfacedir, cmd, builds, os.path.join(self.installdir, libsubdir))
+
+    def build_interfaces(self, interfacedir, cmd, builds, libdir):
+        """
+        Build interface libraries, each in a separate process (using 'parallel' workers),
+        in a copy of the interface directory and with an explicit environment.
+
+        The resulting libraries are only moved into place once all interface libraries were built successfully.
+
+        :param interfacedir: path to directory with sources for interface libraries
+        :param cmd: make command to use
+        :param builds: list of (name of interface library, flags, build options, extra options) tuples
+        :param libdir: directory to install interface libraries to
+        """
+        # staging directory for results, on same filesystem as target directory so results can be moved atomically
+        stagedir = tempfile.mkdtemp(prefix='.eb-interfaces-', dir=libdir)
+        self.log.debug("Created staging directory %s for interface libraries", stagedir)
+
+        def build_interface(idx, lib, flags, buildopts, extraopts):
+            """Build interface library with specified flags and build options."""
+            # use separate copy of interface directory, in same location to retain relative paths in makefiles
+            intdir = intdirs[idx]
+            copy_dir(os.path.join(interfacedir, lib), intdir)
+            change_dir(intdir)
+
+            install_dir = os.path.join(stagedir, str(idx))
+            mkdir(install_dir)
+
+            # always set INSTALL_DIR, SPEC_OPT, COPTS and CFLAGS
+            # fftw2x(c|f): use $INSTALL_DIR, $CFLAGS and $COPTS
+            # fftw3x(c|f): use $CFLAGS
+            # fftw*cdft: use $INSTALL_DIR and $SPEC_OPT
+            envvars = [('INSTALL_DIR', install_dir), ('SPEC_OPT', flags), ('COPTS', flags), ('CFLAGS', flags)]
+
+            buildopts = [opt % {'install_dir': install_dir} for opt in buildopts]
+            fullcmd = ' '.join(["%s='%s'" % envvar for envvar in envvars] + [cmd] + buildopts + extraopts)
+            tup = (lib, flags, buildopts, extraopts)
+            self.log.debug("Building lib %s with: flags %s, buildopts %s, extraopts %s" % tup)
+            res = run_cmd(fullcmd, log_all=True, simple=True)
+            if not res:
+                raise EasyBuildError("Building %s (flags: %s, fullcmd: %s) failed", lib, flags, fullcmd)
+
+            change_dir(interfacedir)
+            rmtree2(intdir)
+
+        intdirs = [os.path.join(interfacedir, '%s.eb-build%d' % (b[0], idx)) for (idx, b) in enumerate(builds)]
+
+        tasks = []
+        for idx, (lib, flags, buildopts, extraopts) in enumerate(builds):
+            label = ' '.join(x for x in [lib, flags] + extraopts if x)
+            tasks.append((label, functools.partial(build_interface, idx, lib, flags, buildopts, extraopts)))
+
+        try:
+            run_tasks_parallel(tasks, self.cfg['parallel'], logfile=self.logfile)
+        except EasyBuildError:
+            for intdir in [stagedir] + intdirs:
+                if os.path.exists(intdir):
+                    rmtree2(intdir)
+            raise
+
+        # move interface libraries into place
+        for idx, (_, flags, _, _) in enumerate(builds):
+            install_dir = os.path.join(stagedir, str(idx))
+            for fn in sorted(os.listdir(install_dir)):
+                src = os.path.join(install_dir, fn)
+                if flags == '-fPIC':
+                    # add _pic to filename
+                    ff = fn.split('.')
+                    fn = '.'.join(ff[:-1]) + '_pic.' + ff[-1]
+                dest = os.path.join(libdir, fn)
+                try:
+                    if os.path.isfile(src):
+                        os.rename(src, dest)
+                        self.log.info("Moved %s to %s" % (src, dest))
+                except OSError as err:
+                    raise EasyBuildError("Failed to move %s to %s: %s", src, dest, err)
+
+        rmtree2(stagedir)
 
     def sanity_check_step(self):
         """Custom sanity check paths for Intel MKL."""
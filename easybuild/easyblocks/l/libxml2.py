@@ -59,6 +59,10 @@ class EB_libxml2(ConfigureMake, PythonPackage):
         self.with_python_bindings = False
         self.require_python = False
 
+        # class variables that are normally initialized by ConfigureMake constructor
+        self.compiler_cache = None
+        self.compiler_cache_stats = None
+
     def configure_step(self):
         """
         Configure libxml2 build
@@ -27,19 +27,23 @@ EasyBuild support for building and installing NWChem, implemented as an easybloc
 
 @author: Kenneth Hoste (Ghent University)
 """
+import functools
+import json
 import os
 import re
 import shutil
 import stat
 import tempfile
+import time
 
 import easybuild.tools.config as config
 import easybuild.tools.environment as env
 import easybuild.tools.toolchain as toolchain
 from distutils.version import LooseVersion
 from easybuild.easyblocks.generic.configuremake import ConfigureMake
+from easybuild.easyblocks.generic.paralleltasks import no_mpi_binding_cmd, run_tasks_parallel
 from easybuild.framework.easyconfig import CUSTOM
-from easybuild.tools.build_log import EasyBuildError
+from easybuild.tools.build_log import EasyBuildError, print_msg
 from easybuild.tools.filetools import adjust_permissions, change_dir, mkdir, remove_file, symlink, write_file
 from easybuild.tools.modules import get_software_libdir, get_software_root, get_software_version
 from easybuild.tools.run import run_cmd
@@ -80,6 +84,9 @@ class EB_NWChem(ConfigureMake):
             'tests': [True, "Run example test cases", CUSTOM],
             # lots of tests fail, so allow a certain fail ratio
             'max_fail_ratio': [0.5, "Maximum test case fail ratio", CUSTOM],
+            'parallel_test_cases': [False, "Run test cases for different directories concurrently "
+                                           "(using 'parallel' cores in total)", CUSTOM],
+            'test_cases_cores': [1, "Number of cores (MPI ranks) to use for each test case", CUSTOM],
         }
         return ConfigureMake.extra_options(extra_vars)
 
@@ -395,6 +402,80 @@ class EB_NWChem(ConfigureMake):
 
         super(EB_NWChem, self).cleanup_step()
 
+    def run_test_cases(self, testdir, tests, cores, no_binding=False):
+        """
+        Run specified tests (in order) in a temporary copy of the specified test case directory.
+
+        :param testdir: directory with files for test cases
+        :param tests: list of tests to run
+        :param cores: number of cores (MPI ranks) to use for each test
+        :param no_binding: disable binding of MPI processes to cores (when test cases are run concurrently)
+        :return: list of results for each test, incl. wall/CPU time and 'Total times' reported by NWChem
+        """
+        success_regexp = re.compile(r"Total times\s*cpu:\s*(?P<cpu>[0-9.]+)s?\s*wall:\s*(?P<wall>[0-9.]+)s?")
+
+        cwd = os.getcwd()
+
+        # run test in a temporary dir
+        tmpdir = tempfile.mkdtemp(prefix='nwchem_test_')
+        change_dir(tmpdir)
+
+        # copy all files in test case dir
+        for item in os.listdir(testdir):
+            test_file = os.path.join(testdir, item)
+            if os.path.isfile(test_file):
+                self.log.debug("Copying %s to %s" % (test_file, tmpdir))
+                shutil.copy2(test_file, tmpdir)
+
+        results = []
+        for testx in tests:
+            cmd = "nwchem %s" % testx
+            if cores > 1:
+                cmd = self.toolchain.mpi_cmd_for(cmd, cores)
+                if no_binding:
+                    cmd = no_mpi_binding_cmd(cmd)
+            msg = "Running test '%s' (from %s) in %s..." % (cmd, testdir, tmpdir)
+            self.log.info(msg)
+
+            start_time, start_times = time.time(), os.times()
+            (out, ec) = run_cmd(cmd, simple=False, log_all=False, log_ok=False, log_output=True)
+            end_times = os.times()
+
+            result = {
+                'dir': testdir,
+                'test': testx,
+                'exit_code': ec,
+                'msg': msg,
+                'output': out,
+                'wall_time': round(time.time() - start_time, 3),
+                # CPU time consumed by (terminated) child processes, i.e. the NWChem run
+                'cpu_time': round(sum(end_times[2:4]) - sum(start_times[2:4]), 3),
+            }
+
+            # check exit code and output
+            total_times = success_regexp.search(out)
+            if total_times:
+                result.update({
+                    'nwchem_cpu_time': float(total_times.group('cpu')),
+                    'nwchem_wall_time': float(total_times.group('wall')),
+                })
+
+            if ec:
+                result.update({'success': False, 'status_msg': "Test %s failed (exit code: %s)!" % (testx, ec)})
+            elif total_times:
+                result.update({'success': True, 'status_msg': "Test %s successful!" % testx})
+            else:
+                msg = "No 'Total times' found for test %s (but exit code is %s)!" % (testx, ec)
+                result.update({'success': False, 'status_msg': msg})
+
+            results.append(result)
+
+        # go back
+        change_dir(cwd)
+        shutil.rmtree(tmpdir)
+
+        return results
+
     def test_cases_step(self):
         """Run provided list of test cases, or provided examples is no test cases were specified."""
 
@@ -442,61 +523,48 @@ class EB_NWChem(ConfigureMake):
                 raise EasyBuildError("Failed to symlink %s to %s: %s", self.home_nwchemrc, self.local_nwchemrc, err)
 
             # run tests, keep track of fail ratio
-            cwd = os.getcwd()
-
             fail = 0.0
             tot = 0.0
 
-            success_regexp = re.compile("Total times\s*cpu:.*wall:.*")
+            # test cases for different directories are independent, tests for a particular directory are run in order
+            cores = self.cfg['test_cases_cores']
+            max_workers = 1
+            if self.cfg['parallel_test_cases']:
+                max_workers = max(1, self.cfg['parallel'] // cores)
+
+            # avoid that MPI processes of concurrently running test cases are bound to the same cores
+            no_binding = max_workers > 1
+
+            tasks = []
+            for idx, (testdir, tests) in enumerate(self.cfg['tests']):
+                label = '%s (%d)' % (testdir, idx)
+                task = functools.partial(self.run_test_cases, testdir, tests, cores, no_binding=no_binding)
+                tasks.append((label, task))
+
+            print_msg("running %d sets of NWChem test cases (max. %d at a time, using %d cores each)..." %
+                      (len(tasks), max_workers, cores), silent=self.silent)
+            res = run_tasks_parallel(tasks, max_workers, logfile=self.logfile)
 
             test_cases_logfn = os.path.join(self.installdir, config.log_path(), 'test_cases.log')
             test_cases_log = open(test_cases_logfn, "w")
 
-            for (testdir, tests) in self.cfg['tests']:
-
-                # run test in a temporary dir
-                tmpdir = tempfile.mkdtemp(prefix='nwchem_test_')
-                change_dir(tmpdir)
-
-                # copy all files in test case dir
-                for item in os.listdir(testdir):
-                    test_file = os.path.join(testdir, item)
-                    if os.path.isfile(test_file):
-                        self.log.debug("Copying %s to %s" % (test_file, tmpdir))
-                        shutil.copy2(test_file, tmpdir)
-
-                # run tests
-                for testx in tests:
-                    cmd = "nwchem %s" % testx
-                    msg = "Running test '%s' (from %s) in %s..." % (cmd, testdir, tmpdir)
-                    self.log.info(msg)
-                    test_cases_log.write("\n%s\n" % msg)
-                    (out, ec) = run_cmd(cmd, simple=False, log_all=False, log_ok=False, log_output=True)
-
-                    # check exit code and output
-                    if ec:
-                        msg = "Test %s failed (exit code: %s)!" % (testx, ec)
-                        self.log.warning(msg)
-                        test_cases_log.write('FAIL: %s' % msg)
-                        fail += 1
+            results = []
+            for label, _ in tasks:
+                self.log.info("Test cases for %s completed in %.1fs", label, res[label]['time'])
+                for result in res[label]['result']:
+                    test_cases_log.write("\n%s\n" % result['msg'])
+                    if result['success']:
+                        self.log.info(result['status_msg'])
+                        test_cases_log.write('SUCCESS: %s' % result['status_msg'])
                     else:
-                        if success_regexp.search(out):
-                            msg = "Test %s successful!" % testx
-                            self.log.info(msg)
-                            test_cases_log.write('SUCCESS: %s' % msg)
-                        else:
-                            msg = "No 'Total times' found for test %s (but exit code is %s)!" % (testx, ec)
-                            self.log.warning(msg)
-                            test_cases_log.write('FAIL: %s' % msg)
-                            fail += 1
-
-                    test_cases_log.write("\nOUTPUT:\n\n%s\n\n" % out)
+                        self.log.warning(result['status_msg'])
+                        test_cases_log.write('FAIL: %s' % result['status_msg'])
+                        fail += 1
 
-                    tot += 1
+                    test_cases_log.write("\nOUTPUT:\n\n%s\n\n" % result.pop('output'))
 
-                # go back
-                change_dir(cwd)
-                shutil.rmtree(tmpdir)
+                    tot += 1
+                    results.append(result)
 
             fail_ratio = fail / tot
             fail_pcnt = fail_ratio * 100
@@ -508,6 +576,11 @@ class EB_NWChem(ConfigureMake):
             test_cases_log.close()
             self.log.info("Log for test cases saved at %s" % test_cases_logfn)
 
+            # also save results in machine-readable format (incl. timings), next to log for test cases
+            test_cases_resfn = os.path.join(self.installdir, config.log_path(), 'test_cases.json')
+            write_file(test_cases_resfn, json.dumps(results, indent=4, sort_keys=True))
+            self.log.info("Results for test cases saved at %s" % test_cases_resfn)
+
             if fail_ratio > self.cfg['max_fail_ratio']:
                 max_fail_pcnt = self.cfg['max_fail_ratio'] * 100
                 raise EasyBuildError("Over %s%% of test cases failed, assuming broken build.", max_fail_pcnt)
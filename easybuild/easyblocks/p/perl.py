@@ -30,14 +30,41 @@ EasyBuild support for Perl, implemented as an easyblock
 """
 import os
 
+from easybuild.base import fancylogger
+from easybuild.easyblocks.generic.batchcheck import run_batch_check
 from easybuild.easyblocks.generic.configuremake import ConfigureMake
 from easybuild.framework.easyconfig import CUSTOM
+from easybuild.tools.build_log import EasyBuildError
+from easybuild.tools.config import build_option
+from easybuild.tools.filetools import which
+from easybuild.tools.modules import get_software_root
 from easybuild.tools.py2vs3 import string_type
 from easybuild.tools.run import run_cmd
 
 # perldoc -lm seems to be the safest way to test if a module is available, based on exit code
 EXTS_FILTER_PERL_MODULES = ("perldoc -lm %(ext_name)s ", "")
 
+# %Config keys that are obtained by probing the 'perl' command (see probe_perl_config)
+PERL_CONFIG_KEYS = ['PERL_API_REVISION', 'archname', 'sitearch', 'siteprefix', 'sitelib', 'version']
+
+# Perl code to print values of %Config keys, one per line (tab-separated)
+PERL_CONFIG_PREFIX = 'EB_PERL_CONFIG'
+PERL_CONFIG_PERLCODE = 'print "\\n%s\\t$_\\t$Config::Config{$_}\\n" foreach @ARGV' % PERL_CONFIG_PREFIX
+
+# Perl code to check whether Perl modules are available in a single Perl process,
+# by locating the corresponding .pm file in @INC (like 'perldoc -lm' does);
+# result for each module is printed on a single line (tab-separated)
+PERL_MODULE_CHECK_PREFIX = 'EB_MODULE_CHECK'
+PERL_MODULE_CHECK_PERLCODE = ' '.join([
+    'foreach my $mod (@ARGV) {',
+    '(my $file = $mod) =~ s{::}{/}g;',
+    'my ($path) = grep { -f $_ } map { "$_/$file.pm" } @INC;',
+    'print "\\n%(prefix)s\\t$mod\\t", ($path ? "OK\\t$path" : "FAILED\\tnot found in \\@INC"), "\\n";',
+    '}',
+]) % {'prefix': PERL_MODULE_CHECK_PREFIX}
+
+_perl_config_cache = {}
+
 
 class EB_Perl(ConfigureMake):
     """Support for building and installing Perl."""
@@ -120,13 +147,103 @@ class EB_Perl(ConfigureMake):
         super(EB_Perl, self).sanity_check_step(custom_paths=custom_paths)
 
 
+def perl_config_cache_key():
+    """
+    Determine key for cached %Config values of 'perl' command.
+
+    The key is composed of the resolved path to the 'perl' command (+ its mtime and inode),
+    the value of $PATH and the installation prefix of the Perl module (if any),
+    so cached values are invalidated when either of these change.
+    Returns None if the 'perl' command could not be resolved.
+    """
+    perl_path = which('perl')
+    if perl_path is None:
+        return None
+
+    perl_path = os.path.realpath(perl_path)
+    try:
+        perl_stat = os.stat(perl_path)
+    except OSError:
+        return None
+
+    return (perl_path, perl_stat.st_mtime, perl_stat.st_ino, os.getenv('PATH'), get_software_root('Perl'))
+
+
+def clear_perl_config_cache():
+    """Clear cached %Config values of 'perl' command."""
+    _perl_config_cache.clear()
+
+
+def probe_perl_config():
+    """
+    Obtain values for %Config keys listed in PERL_CONFIG_KEYS for 'perl' command in $PATH,
+    using a single run of the Perl interpreter.
+
+    Results are cached per 'perl' command, see perl_config_cache_key.
+
+    :return: dict with value for each of the keys in PERL_CONFIG_KEYS
+    """
+    log = fancylogger.getLogger('probe_perl_config', fname=False)
+
+    key = perl_config_cache_key()
+    if key is not None and key in _perl_config_cache:
+        res = _perl_config_cache[key]
+        log.debug("Using cached %%Config values for 'perl' command: %s", res)
+        return dict(res)
+
+    cmd = "perl -MConfig -e '%s' %s" % (PERL_CONFIG_PERLCODE, ' '.join(PERL_CONFIG_KEYS))
+    (out, ec) = run_cmd(cmd, log_all=True, simple=False, trace=False)
+
+    res = {}
+    for line in out.split('\n'):
+        fields = line.split('\t')
+        if fields[0] == PERL_CONFIG_PREFIX and len(fields) == 3:
+            res[fields[1]] = fields[2]
+
+    # command is not actually run in dry run mode, so no values are available
+    if build_option('extended_dry_run'):
+        return dict((x, '') for x in PERL_CONFIG_KEYS)
+
+    missing = [x for x in PERL_CONFIG_KEYS if x not in res]
+    if missing:
+        raise EasyBuildError("Failed to determine %s by probing 'perl' command: %s (exit code %s)",
+                             ', '.join(missing), out, ec)
+
+    log.debug("%%Config values for 'perl' command: %s", res)
+    if key is not None:
+        _perl_config_cache[key] = res
+
+    return dict(res)
+
+
+def check_perl_modules(names):
+    """
+    Check whether specified Perl modules are available, using a single run of the Perl interpreter.
+
+    :param names: list of names of Perl modules (e.g. 'File::Which')
+    :return: dict with result for each of the Perl modules: whether module was found ('ok'),
+             path to .pm file ('path') and error message ('error'); no result is available for modules
+             that could not be checked (for example when 'perl' crashed)
+    """
+    def parse_result(txt):
+        """Parse (tab-separated) result for a single Perl module."""
+        fields = txt.split('\t')
+        if len(fields) == 4:
+            if fields[2] == 'OK':
+                return (fields[1], {'ok': True, 'path': fields[3], 'error': ''})
+            else:
+                return (fields[1], {'ok': False, 'path': None, 'error': fields[3]})
+        return None
+
+    cmd = "perl -e '%s' %s" % (PERL_MODULE_CHECK_PERLCODE, ' '.join("'%s'" % name for name in names))
+    return run_batch_check(cmd, names, PERL_MODULE_CHECK_PREFIX, parse_result)
+
+
 def get_major_perl_version():
     """"
     Returns the major verson of the perl binary in the current path
     """
-    cmd = "perl -MConfig -e 'print $Config::Config{PERL_API_REVISION}'"
-    (perlmajver, _) = run_cmd(cmd, log_all=True, log_output=True, simple=False)
-    return perlmajver
+    return probe_perl_config()['PERL_API_REVISION']
 
 
 def get_site_suffix(tag):
@@ -137,8 +254,10 @@ def get_site_suffix(tag):
 
     @tag: site tag to use, e.g. 'sitearch', 'sitelib'
     """
-    perl_cmd = 'my $a = $Config::Config{"%s"}; $a =~ s/($Config::Config{"siteprefix"})//; print $a' % tag
-    cmd = "perl -MConfig -e '%s'" % perl_cmd
-    (sitesuffix, _) = run_cmd(cmd, log_all=True, log_output=True, simple=False)
+    perl_config = probe_perl_config()
+    if tag not in perl_config:
+        raise EasyBuildError("Unknown site tag '%s', should be one of: %s", tag, ', '.join(PERL_CONFIG_KEYS))
+
+    sitesuffix = perl_config[tag].replace(perl_config['siteprefix'], '', 1)
     # obtained value usually contains leading '/', so strip it off
     return sitesuffix.lstrip(os.path.sep)
@@ -42,6 +42,7 @@ from distutils.version import LooseVersion
 
 import easybuild.tools.environment as env
 from easybuild.easyblocks.generic.configuremake import ConfigureMake
+from easybuild.easyblocks.generic.paralleltasks import ParallelExtsInstall
 from easybuild.framework.easyconfig import CUSTOM
 from easybuild.tools.build_log import EasyBuildError, print_warning
 from easybuild.tools.config import log_path
@@ -91,7 +92,7 @@ if ebpythonprefixes:
 """ % {'EBPYTHONPREFIXES': EBPYTHONPREFIXES}
 
 
-class EB_Python(ConfigureMake):
+class EB_Python(ParallelExtsInstall, ConfigureMake):
     """Support for building/installing Python
     - default configure/build_step/make install works fine
 
@@ -110,6 +111,7 @@ class EB_Python(ConfigureMake):
             'ulimit_unlimited': [False, "Ensure stack size limit is set to '%s' during build" % UNLIMITED, CUSTOM],
             'ebpythonprefixes': [True, "Create sitecustomize.py and allow use of $EBPYTHONPREFIXES", CUSTOM],
         }
+        extra_vars = ParallelExtsInstall.extra_options(extra_vars)
         return ConfigureMake.extra_options(extra_vars)
 
     def __init__(self, *args, **kwargs):
@@ -34,6 +34,7 @@ from distutils.version import LooseVersion
 
 import easybuild.tools.environment as env
 from easybuild.easyblocks.generic.configuremake import ConfigureMake
+from easybuild.easyblocks.generic.paralleltasks import ParallelExtsInstall
 from easybuild.tools.build_log import print_warning
 from easybuild.tools.modules import get_software_root
 from easybuild.tools.systemtools import get_shared_lib_ext
@@ -42,13 +43,19 @@ from easybuild.tools.systemtools import get_shared_lib_ext
 EXTS_FILTER_R_PACKAGES = ("R -q --no-save", "library(%(ext_name)s)")
 
 
-class EB_R(ConfigureMake):
+class EB_R(ParallelExtsInstall, ConfigureMake):
     """
     Build and install R, including list of libraries specified as extensions.
     Install specified version of libraries, install hard-coded library version
     or latest library version (in that order of preference)
     """
 
+    @staticmethod
+    def extra_options():
+        """Add extra config options specific to R."""
+        extra_vars = ParallelExtsInstall.extra_options()
+        return ConfigureMake.extra_options(extra_vars)
+
     def prepare_for_extensions(self):
         """
         We set some default configs here for R packages
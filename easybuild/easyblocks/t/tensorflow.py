@@ -30,10 +30,12 @@ EasyBuild support for building and installing TensorFlow, implemented as an easy
 @author: Damian Alvarez (Forschungzentrum Juelich GmbH)
 """
 import glob
+import hashlib
 import os
 import re
 import stat
 import tempfile
+import time
 from distutils.version import LooseVersion
 
 import easybuild.tools.environment as env
@@ -42,8 +44,9 @@ from easybuild.easyblocks.generic.pythonpackage import PythonPackage
 from easybuild.easyblocks.python import EXTS_FILTER_PYTHON_PACKAGES
 from easybuild.framework.easyconfig import CUSTOM
 from easybuild.tools.build_log import EasyBuildError
+from easybuild.tools.config import build_path
 from easybuild.tools.filetools import adjust_permissions, apply_regex_substitutions, copy_file, mkdir, resolve_path
-from easybuild.tools.filetools import is_readable, read_file, which, write_file
+from easybuild.tools.filetools import is_readable, read_file, remove_file, which, write_file
 from easybuild.tools.modules import get_software_root, get_software_version
 from easybuild.tools.run import run_cmd
 from easybuild.tools.systemtools import X86_64, get_cpu_architecture, get_os_name, get_os_version
@@ -71,6 +74,78 @@ export PATH=$(echo $PATH | tr ':' '\n' | grep -v "^%(wrapper_dir)s$" | tr '\n' '
 %(compiler_path)s "$@"
 """
 
+# name of subdirectory of build path in which Bazel caches are stored (by default)
+BAZEL_CACHE_SUBDIR = 'bazel-cache'
+
+# subdirectories of TensorFlow source tree that contain CROSSTOOL* files, for ranges of TensorFlow versions
+# (minimal version, maximal version (exclusive)); the whole source tree is scanned for versions not listed here
+CROSSTOOL_SEARCH_DIRS = [
+    ('1.0', '2.1', ['third_party', 'tools']),
+]
+# directories to skip when scanning for CROSSTOOL* files
+CROSSTOOL_PRUNE_DIRS = ['.git', '__pycache__', 'testdata', 'test_data']
+
+
+def det_crosstool_search_dirs(tf_version):
+    """Determine list of subdirectories to scan for CROSSTOOL* files for specified TensorFlow version."""
+    for min_ver, max_ver, subdirs in CROSSTOOL_SEARCH_DIRS:
+        if LooseVersion(min_ver) <= LooseVersion(tf_version) < LooseVersion(max_ver):
+            return subdirs
+    return None
+
+
+def find_crosstool_files(topdir, subdirs=None):
+    """
+    Find CROSSTOOL* files in specified subdirectories of given directory (or in entire directory if None),
+    skipping directories listed in CROSSTOOL_PRUNE_DIRS (and not following symlinks, like the bazel-* ones).
+
+    :return: list of paths to CROSSTOOL* files, number of files that were scanned
+    """
+    if subdirs is None:
+        paths = [topdir]
+    else:
+        paths = [os.path.join(topdir, subdir) for subdir in subdirs]
+
+    crosstool_files, scanned = [], 0
+    for path in paths:
+        for dirpath, dirnames, filenames in os.walk(path):
+            dirnames[:] = sorted(d for d in dirnames if d not in CROSSTOOL_PRUNE_DIRS)
+            scanned += len(filenames)
+            crosstool_files.extend(os.path.join(dirpath, f) for f in sorted(filenames) if f.startswith('CROSSTOOL'))
+
+    return crosstool_files, scanned
+
+
+def trim_bazel_cache(path, max_size):
+    """
+    Trim Bazel cache at specified path to (at most) specified size (in bytes),
+    by removing the least recently used files first.
+
+    :return: total size of cache after trimming, number of removed files
+    """
+    entries = []
+    total_size = 0
+    for dirpath, _, filenames in os.walk(path):
+        for filename in filenames:
+            full_path = os.path.join(dirpath, filename)
+            try:
+                st = os.lstat(full_path)
+            except OSError:
+                # file may be gone already (e.g. removed by a concurrent build)
+                continue
+            entries.append((max(st.st_atime, st.st_mtime), st.st_size, full_path))
+            total_size += st.st_size
+
+    removed = 0
+    for _, size, full_path in sorted(entries):
+        if total_size <= max_size:
+            break
+        remove_file(full_path)
+        total_size -= size
+        removed += 1
+
+    return total_size, removed
+
 
 class EB_TensorFlow(PythonPackage):
     """Support for building/installing TensorFlow."""
@@ -86,6 +161,12 @@ class EB_TensorFlow(PythonPackage):
             'with_jemalloc': [None, "Make TensorFlow use jemalloc (usually enabled by default)", CUSTOM],
             'with_mkl_dnn': [with_mkl_dnn_default, "Make TensorFlow use Intel MKL-DNN", CUSTOM],
             'test_script': [None, "Script to test TensorFlow installation with", CUSTOM],
+            'bazel_cache': [False, "Use persistent Bazel disk cache and repository cache, "
+                                   "so compiled actions and downloads can be reused across builds", CUSTOM],
+            'bazel_cache_dir': [None, "Location of persistent Bazel caches (default: '%s' in build path)" %
+                                BAZEL_CACHE_SUBDIR, CUSTOM],
+            'bazel_cache_max_size': [20, "Maximum size of persistent Bazel disk cache (in GiB), "
+                                         "least recently used entries are removed after the build", CUSTOM],
         }
 
         return PythonPackage.extra_options(extra_vars)
@@ -103,6 +184,8 @@ class EB_TensorFlow(PythonPackage):
         self.cfg['exts_filter'] = EXTS_FILTER_PYTHON_PACKAGES
 
         self.test_script = None
+        self.bazel_disk_cache = None
+        self.bazel_repo_cache = None
 
         # locate test script (if specified)
         if self.cfg['test_script']:
@@ -303,6 +386,9 @@ class EB_TensorFlow(PythonPackage):
         for (key, val) in sorted(config_env_vars.items()):
             env.setvar(key, val)
 
+        if self.cfg['bazel_cache']:
+            self.prepare_bazel_cache(config_env_vars)
+
         # patch configure.py (called by configure script) to avoid that Bazel abuses $HOME/.cache/bazel
         regex_subs = [(r"(run_shell\(\['bazel')",
                        r"\1, '--output_base=%s', '--install_base=%s'" % (tmpdir, os.path.join(tmpdir, 'inst_base')))]
@@ -314,6 +400,40 @@ class EB_TensorFlow(PythonPackage):
         cmd = self.cfg['preconfigopts'] + './configure ' + self.cfg['configopts']
         run_cmd(cmd, log_all=True, simple=True)
 
+    def prepare_bazel_cache(self, config_env_vars):
+        """
+        Determine location of persistent Bazel disk cache and repository cache.
+
+        The disk cache is specific to the TensorFlow version and toolchain being used; entries in it are keyed
+        by Bazel on the full command line and inputs of each action, so variants of the same TensorFlow version
+        (with/without CUDA, MKL, ...) can share compiled actions that are not affected by the configuration.
+        Downloads in the repository cache are keyed by checksum, so that cache is shared by all builds.
+        """
+        cache_dir = self.cfg['bazel_cache_dir'] or os.path.join(build_path(), BAZEL_CACHE_SUBDIR)
+
+        tc = self.toolchain
+        subdir = '-'.join([self.name, self.version, tc.name, tc.version])
+        self.bazel_disk_cache = os.path.join(cache_dir, 'disk', subdir)
+        self.bazel_repo_cache = os.path.join(cache_dir, 'repository')
+
+        mkdir(self.bazel_disk_cache, parents=True)
+        mkdir(self.bazel_repo_cache, parents=True)
+
+        # record configuration next to disk cache entries, for reference
+        config_txt = '\n'.join('%s=%s' % (key, val) for (key, val) in sorted(config_env_vars.items()))
+        config_hash = hashlib.sha256(config_txt.encode('utf-8')).hexdigest()[:16]
+        write_file(os.path.join(self.bazel_disk_cache, 'eb-config-%s.txt' % config_hash), config_txt + '\n')
+
+        self.log.info("Using persistent Bazel disk cache %s and repository cache %s (configuration hash: %s)",
+                      self.bazel_disk_cache, self.bazel_repo_cache, config_hash)
+
+    def trim_bazel_cache(self):
+        """Trim persistent Bazel disk cache to maximum allowed size."""
+        max_size = self.cfg['bazel_cache_max_size'] * 1024 ** 3
+        total_size, removed = trim_bazel_cache(self.bazel_disk_cache, max_size)
+        self.log.info("Size of Bazel disk cache %s after removing %d files: %.2f GiB",
+                      self.bazel_disk_cache, removed, float(total_size) / 1024 ** 3)
+
     def build_step(self):
         """Custom build procedure for TensorFlow."""
 
@@ -377,13 +497,18 @@ class EB_TensorFlow(PythonPackage):
         if self.toolchain.options.get('pic', None):
             regex_subs.extend([('-fPIE', '-fPIC'), ('"-pie"', '"-fPIC"')])
 
-        # patch all CROSSTOOL* scripts to fix hardcoding of locations of binutils/GCC binaries
-        for path, dirnames, filenames in os.walk(os.getcwd()):
-            for filename in filenames:
-                if filename.startswith('CROSSTOOL'):
-                    full_path = os.path.join(path, filename)
-                    self.log.info("Patching %s", full_path)
-                    apply_regex_substitutions(full_path, regex_subs)
+        # patch all CROSSTOOL* scripts to fix hardcoding of locations of binutils/GCC binaries;
+        # this is done after running 'configure', and before Bazel generates crosstool files from these templates;
+        # only subdirectories known to contain CROSSTOOL* files are scanned (if known for this TensorFlow version)
+        start_time = time.time()
+        subdirs = det_crosstool_search_dirs(self.version)
+        crosstool_files, scanned = find_crosstool_files(os.getcwd(), subdirs=subdirs)
+        self.log.info("Found %d CROSSTOOL* files in %s after scanning %d files in %.2fs", len(crosstool_files),
+                      subdirs or 'entire source tree', scanned, time.time() - start_time)
+
+        for full_path in crosstool_files:
+            self.log.info("Patching %s", full_path)
+            apply_regex_substitutions(full_path, regex_subs)
 
         tmpdir = tempfile.mkdtemp(suffix='-bazel-build')
         user_root_tmpdir = tempfile.mkdtemp(suffix='-user_root')
@@ -393,6 +518,12 @@ class EB_TensorFlow(PythonPackage):
                '--install_base=%s' % os.path.join(tmpdir, 'inst_base'),
                '--output_user_root=%s' % user_root_tmpdir, 'build']
 
+        # use persistent disk cache & repository cache, if enabled
+        # https://docs.bazel.build/versions/master/remote-caching.html#disk-cache
+        # https://docs.bazel.build/versions/master/guide.html#the-repository-cache
+        if self.bazel_disk_cache:
+            cmd.extend(['--disk_cache=%s' % self.bazel_disk_cache, '--repository_cache=%s' % self.bazel_repo_cache])
+
         # build with optimization enabled
         # cfr. https://docs.bazel.build/versions/master/user-manual.html#flag--compilation_mode
         cmd.append('--compilation_mode=opt')
@@ -456,6 +587,9 @@ class EB_TensorFlow(PythonPackage):
 
         run_cmd(' '.join(cmd), log_all=True, simple=True, log_ok=True)
 
+        if self.bazel_disk_cache and not self.dry_run:
+            self.trim_bazel_cache()
+
         # run generated 'build_pip_package' script to build the .whl
         cmd = "bazel-bin/tensorflow/tools/pip_package/build_pip_package %s" % self.builddir
         run_cmd(cmd, log_all=True, simple=True, log_ok=True)
@@ -32,24 +32,37 @@ EasyBuild support for building and installing WRF, implemented as an easyblock
 @author: Jens Timmerman (Ghent University)
 @author: Andreas Hilboll (University of Bremen)
 """
+import functools
+import json
 import os
 import re
+import shutil
+import time
 
 from distutils.version import LooseVersion
 
 import easybuild.tools.environment as env
 import easybuild.tools.toolchain as toolchain
+from easybuild.easyblocks.generic.paralleltasks import no_mpi_binding_cmd, run_tasks_parallel, split_parallelism
 from easybuild.easyblocks.netcdf import set_netcdf_env_vars  # @UnresolvedImport
 from easybuild.framework.easyblock import EasyBlock
 from easybuild.framework.easyconfig import CUSTOM, MANDATORY
-from easybuild.tools.build_log import EasyBuildError
-from easybuild.tools.config import build_option
-from easybuild.tools.filetools import apply_regex_substitutions, change_dir, patch_perl_script_autoflush, read_file
-from easybuild.tools.filetools import remove_file, symlink
+from easybuild.tools.build_log import EasyBuildError, print_msg
+from easybuild.tools.config import build_option, log_path
+from easybuild.tools.filetools import apply_regex_substitutions, change_dir, mkdir, patch_perl_script_autoflush
+from easybuild.tools.filetools import read_file, remove_dir, remove_file, symlink, write_file
 from easybuild.tools.modules import get_software_root
 from easybuild.tools.run import run_cmd, run_cmd_qa
 
 
+# name of report for WRF test cases, in log directory of installation
+WRF_TESTS_REPORT_FN = 'wrf-tests-report.json'
+
+# timing lines in rsl.error.* output, one per time step, e.g.:
+# Timing for main: time 2001-10-25_00:00:30 on domain   1:    0.07512 elapsed seconds
+WRF_TIMING_REGEX = re.compile(r"^Timing for main:.*:\s*(?P<secs>[0-9.]+)\s+elapsed seconds", re.M)
+
+
 def det_wrf_subdir(wrf_version):
     """Determine WRF subdirectory for given WRF version."""
 
@@ -80,6 +93,8 @@ class EB_WRF(EasyBlock):
                                 "dmpar (MPI), dm+sm (hybrid OpenMP/MPI)).", MANDATORY],
             'rewriteopts': [True, "Replace -O3 with CFLAGS/FFLAGS", CUSTOM],
             'runtest': [True, "Build and run WRF tests", CUSTOM],
+            'parallel_tests': [False, "Run WRF test cases concurrently, each in a separate copy of the run directory "
+                                      "(test cases are still compiled one after the other)", CUSTOM],
         }
         return EasyBlock.extra_options(extra_vars)
 
@@ -295,83 +310,216 @@ class EB_WRF(EasyBlock):
                     if test in self.testcases:
                         self.testcases.remove(test)
 
-            # determine parallel setting (1/2 of available processors + 1)
-            n = self.cfg['parallel'] / 2 + 1
+            # test cases can be compiled only one at a time (since they all share the same source tree),
+            # but each test case gets its own copy of the 'run' directory, so running test cases can overlap
+            # with each other and with compiling the next test case
+            tasks, deps = [], {}
+            if self.cfg['parallel_tests'] and self.cfg['parallel'] > 1:
+                # one core is reserved for compiling test cases (one at a time, using a single job),
+                # remaining cores are split across concurrently running test cases
+                run_workers, nranks = split_parallelism(self.cfg['parallel'] - 1, len(self.testcases))
+                max_workers = run_workers + 1
+                compile_par = '-j 1'
+            else:
+                # determine parallel setting (1/2 of available processors + 1)
+                run_workers, nranks = 1, self.cfg['parallel'] // 2 + 1
+                max_workers = 1
+                compile_par = self.par
 
-            # prepare run command
+            # avoid that MPI processes of concurrently running test cases are bound to the same cores
+            no_binding = run_workers > 1
 
-            # stack limit needs to be set to unlimited for WRF to work well
-            if self.cfg['buildtype'] in self.parallel_build_types:
-                test_cmd = "ulimit -s unlimited && %s && %s" % (self.toolchain.mpi_cmd_for("./ideal.exe", 1),
-                                                                self.toolchain.mpi_cmd_for("./wrf.exe", n))
-            else:
-                test_cmd = "ulimit -s unlimited && ./ideal.exe && ./wrf.exe >rsl.error.0000 2>&1"
+            prev_compile = None
+            for test in self.testcases:
+                compile_label, run_label = 'compile %s' % test, 'run %s' % test
+                tasks.append((compile_label, functools.partial(self.compile_test_case, test, par=compile_par)))
+                tasks.append((run_label, functools.partial(self.run_test_case, test, nranks, no_binding=no_binding)))
+                deps[run_label] = [compile_label]
+                if prev_compile:
+                    deps[compile_label] = [prev_compile]
+                prev_compile = compile_label
+
+            report = []
+            compile_times = {}
+
+            def check_result(label, res):
+                """Check result of completed task; stop as soon as a test case failed."""
+                if label.startswith('compile '):
+                    compile_times[label[len('compile '):]] = res
+                else:
+                    test = label[len('run '):]
+                    for result in res:
+                        result['compile_time'] = compile_times.get(test)
+                        report.append(result)
+                    failed = [r['name'] for r in res if not r['success']]
+                    if failed:
+                        raise EasyBuildError("WRF test case %s failed: %s", test, ', '.join(failed))
+
+            print_msg("building and running %d WRF test cases (max. %d at a time, %d MPI ranks per test case)..." %
+                      (len(self.testcases), run_workers, nranks), silent=self.silent)
+            try:
+                run_tasks_parallel(tasks, max_workers, deps=deps, logfile=self.logfile, done_callback=check_result)
+            finally:
+                self.write_tests_report(report)
+
+    def write_tests_report(self, report):
+        """Log results for (completed) WRF test cases, and write them to report file in installation directory."""
+        self.log.info("Results for WRF test cases:\n" + '\n'.join(
+            "* %(name)s: %(status)s (compile: %(compile_time).1fs, run: %(elapsed).1fs, "
+            "%(timesteps_per_sec)s time steps/s)" % dict(r, status=('FAIL', 'OK')[r['success']]) for r in report))
+
+        report_path = os.path.join(self.installdir, log_path(), WRF_TESTS_REPORT_FN)
+        mkdir(os.path.dirname(report_path), parents=True)
+        write_file(report_path, json.dumps(report, indent=4, sort_keys=True))
+        self.log.info("Report for WRF test cases written to %s", report_path)
+
+    def test_case_rundir(self, test):
+        """Return path to (cloned) run directory for specified test case."""
+        return os.path.join(self.builddir, self.wrfsubdir, 'run_eb_%s' % test)
+
+    def compile_test_case(self, test, par=None):
+        """
+        Compile specified WRF test case, and create a copy of the 'run' directory for it.
 
-            def run_test():
-                """Run a single test and check for success."""
+        Executables are copied (since they are overwritten when compiling the next test case),
+        other files in the 'run' directory are symlinked.
 
-                # regex to check for successful test run
-                re_success = re.compile("SUCCESS COMPLETE WRF")
+        :param test: name of test case
+        :param par: option to control parallelism when compiling (default: same as for compiling WRF itself)
+        :return: time (in seconds) it took to compile the test case
+        """
+        self.log.debug("Building test %s" % test)
+        start_time = time.time()
+
+        if par is None:
+            par = self.par
+        cmd = "tcsh ./compile %s %s" % (par, test)
+        run_cmd(cmd, log_all=True, simple=True)
+
+        rundir = self.test_case_rundir(test)
+        if os.path.exists(rundir):
+            remove_dir(rundir)
+        mkdir(rundir)
+
+        if not self.dry_run:
+            try:
+                for filename in os.listdir('run'):
+                    path = os.path.realpath(os.path.join('run', filename))
+                    if filename.endswith('.exe'):
+                        shutil.copy2(path, os.path.join(rundir, filename))
+                    else:
+                        symlink(path, os.path.join(rundir, filename))
+            except (IOError, OSError) as err:
+                raise EasyBuildError("Failed to create run directory %s for test %s: %s", rundir, test, err)
 
-                # run test
-                run_cmd(test_cmd, log_all=True, simple=True)
+        return round(time.time() - start_time, 3)
 
-                # check for success
+    def run_test_case(self, test, nranks, no_binding=False):
+        """
+        Run specified WRF test case (which was already compiled) in its own run directory.
+
+        :param test: name of test case
+        :param nranks: number of MPI ranks to use for running wrf.exe
+        :param no_binding: disable binding of MPI processes to cores (when test cases are run concurrently)
+        :return: list of results (one per (sub)test), incl. elapsed time and time steps per second
+        """
+        # regex to check for successful test run
+        re_success = re.compile("SUCCESS COMPLETE WRF")
+
+        # stack limit needs to be set to unlimited for WRF to work well
+        if self.cfg['buildtype'] in self.parallel_build_types:
+            test_cmd = "ulimit -s unlimited && %s && %s" % (self.toolchain.mpi_cmd_for("./ideal.exe", 1),
+                                                            self.toolchain.mpi_cmd_for("./wrf.exe", nranks))
+            if no_binding:
+                test_cmd = no_mpi_binding_cmd(test_cmd)
+        else:
+            test_cmd = "ulimit -s unlimited && ./ideal.exe && ./wrf.exe >rsl.error.0000 2>&1"
+
+        rundir = self.test_case_rundir(test)
+
+        def run_test(name):
+            """Run a single test and check for success."""
+
+            # clean up stuff that gets in the way
+            fn_prefs = ["wrfinput_", "namelist.output", "wrfout_", "rsl.out.", "rsl.error."]
+            for filename in os.listdir('.'):
+                for pref in fn_prefs:
+                    if filename.startswith(pref):
+                        remove_file(filename)
+                        self.log.debug("Cleaned up file %s", filename)
+
+            # run test
+            start_time = time.time()
+            (_, ec) = run_cmd(test_cmd, log_all=False, log_ok=False, simple=False)
+            result = {
+                'name': name,
+                'ranks': nranks,
+                'exit_code': ec,
+                'elapsed': round(time.time() - start_time, 3),
+                'success': False,
+                'timesteps': None,
+                'timesteps_per_sec': None,
+            }
+
+            # check for success
+            txt = ''
+            if os.path.exists('rsl.error.0000'):
                 txt = read_file('rsl.error.0000')
-                if re_success.search(txt):
-                    self.log.info("Test %s ran successfully." % test)
 
-                else:
-                    raise EasyBuildError("Test %s failed, pattern '%s' not found.", test, re_success.pattern)
+            if ec == 0 and re_success.search(txt):
+                self.log.info("Test %s ran successfully." % name)
+                result['success'] = True
+            else:
+                self.log.warning("Test %s failed (exit code %s), or pattern '%s' not found.",
+                                 name, ec, re_success.pattern)
 
-                # clean up stuff that gets in the way
-                fn_prefs = ["wrfinput_", "namelist.output", "wrfout_", "rsl.out.", "rsl.error."]
-                for filename in os.listdir('.'):
-                    for pref in fn_prefs:
-                        if filename.startswith(pref):
-                            remove_file(filename)
-                            self.log.debug("Cleaned up file %s", filename)
+            # determine number of time steps per second
+            step_times = [float(x) for x in WRF_TIMING_REGEX.findall(txt)]
+            if step_times:
+                result['timesteps'] = len(step_times)
+                if sum(step_times) > 0:
+                    result['timesteps_per_sec'] = round(len(step_times) / sum(step_times), 3)
 
-            # build and run each test case individually
-            for test in self.testcases:
+            return result
 
-                self.log.debug("Building and running test %s" % test)
+        self.log.debug("Running test %s in %s" % (test, rundir))
+        results = []
+        try:
+            prev_dir = change_dir(rundir)
 
-                # build and install
-                cmd = "tcsh ./compile %s %s" % (self.par, test)
-                run_cmd(cmd, log_all=True, simple=True)
+            if test in ["em_fire"]:
 
-                # run test
-                try:
-                    prev_dir = change_dir('run')
+                # handle tests with subtests seperately
+                testdir = os.path.join(self.builddir, self.wrfsubdir, "test", test)
 
-                    if test in ["em_fire"]:
+                for subtest in [x for x in os.listdir(testdir) if os.path.isdir(os.path.join(testdir, x))]:
 
-                        # handle tests with subtests seperately
-                        testdir = os.path.join("..", "test", test)
+                    subtestdir = os.path.join(testdir, subtest)
 
-                        for subtest in [x for x in os.listdir(testdir) if os.path.isdir(x)]:
+                    # link required files
+                    for filename in os.listdir(subtestdir):
+                        if os.path.lexists(filename):
+                            remove_file(filename)
+                        symlink(os.path.join(subtestdir, filename), filename)
 
-                            subtestdir = os.path.join(testdir, subtest)
+                    # run test
+                    results.append(run_test('%s/%s' % (test, subtest)))
 
-                            # link required files
-                            for filename in os.listdir(subtestdir):
-                                if os.path.exists(filename):
-                                    remove_file(filename)
-                                symlink(os.path.join(subtestdir, filename), filename)
+            else:
 
-                            # run test
-                            run_test()
+                # run test
+                results.append(run_test(test))
 
-                    else:
+            change_dir(prev_dir)
 
-                        # run test
-                        run_test()
+            # only keep run directory around for failing tests
+            if all(result['success'] for result in results):
+                remove_dir(rundir)
 
-                    change_dir(prev_dir)
+        except OSError as err:
+            raise EasyBuildError("An error occured when running test %s: %s", test, err)
 
-                except OSError as err:
-                    raise EasyBuildError("An error occured when running test %s: %s", test, err)
+        return results
 
     # building/installing is done in build_step, so we can run tests
     def install_step(self):
@@ -0,0 +1,537 @@
+##
+# Copyright 2019 Ghent University
+#
+# This file is part of EasyBuild,
+# originally created by the HPC team of Ghent University (http://ugent.be/hpc/en),
+# with support of Ghent University (http://ugent.be/hpc),
+# the Flemish Supercomputer Centre (VSC) (https://www.vscentrum.be),
+# Flemish Research Foundation (FWO) (http://www.fwo.be/en)
+# and the Department of Economy, Science and Innovation (EWI) (http://www.ewi-vlaanderen.be/en).
+#
+# https://github.com/easybuilders/easybuild
+#
+# EasyBuild is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation v2.
+#
+# EasyBuild is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with EasyBuild.  If not, see <http://www.gnu.org/licenses/>.
+##
+"""
+Unit tests for functionality provided by specific easyblocks,
+that can be tested without creating an easyblock instance (no modules tool required).
+"""
+import os
+import shutil
+import stat
+import sys
+import tarfile
+import tempfile
+from unittest import TestLoader, TextTestRunner
+
+from easybuild.base import fancylogger
+from easybuild.base.testing import TestCase
+from easybuild.easyblocks.generic.batchcheck import batch_check_exts, batch_check_passed
+from easybuild.tools.build_log import EasyBuildError
+from easybuild.tools.config import BuildOptions, Singleton, init_build_options
+from easybuild.tools.filetools import adjust_permissions, change_dir, read_file, which, write_file
+
+
+class DummyExtension(object):
+    """Dummy extension, only provides what is required to check it via batch_check_exts."""
+
+    def __init__(self, name):
+        """Constructor for dummy extension."""
+        self.name = name
+        self.log = fancylogger.getLogger('DummyExtension', fname=False)
+        self.batch_check_result = None
+
+
+class EasyblockSpecificTest(TestCase):
+    """Tests for functionality provided by specific easyblocks."""
+
+    def setUp(self):
+        """Test setup."""
+        super(EasyblockSpecificTest, self).setUp()
+
+        # (re)initialize build options, but make sure they can be restored afterwards
+        self.orig_build_options = Singleton._instances.pop(BuildOptions, None)
+        init_build_options(build_options={'extended_dry_run': False, 'silent': True})
+
+        self.orig_environ = os.environ.copy()
+        self.orig_workdir = os.getcwd()
+        self.test_prefix = tempfile.mkdtemp()
+
+    def tearDown(self):
+        """Test cleanup."""
+        change_dir(self.orig_workdir)
+        shutil.rmtree(self.test_prefix)
+
+        for key in set(os.environ.keys()) - set(self.orig_environ.keys()):
+            del os.environ[key]
+        os.environ.update(self.orig_environ)
+
+        Singleton._instances.pop(BuildOptions, None)
+        if self.orig_build_options is not None:
+            Singleton._instances[BuildOptions] = self.orig_build_options
+
+        super(EasyblockSpecificTest, self).tearDown()
+
+    def write_script(self, name, txt):
+        """Create executable script with specified name and contents in a 'bin' subdirectory of test prefix."""
+        path = os.path.join(self.test_prefix, 'bin', name)
+        write_file(path, '#!/bin/bash\n' + txt)
+        adjust_permissions(path, stat.S_IXUSR)
+        return path
+
+    def test_pythonpackage_pick_python_cmd_broken(self):
+        """Test whether pick_python_cmd function skips broken 'python' commands."""
+        from easybuild.easyblocks.generic.pythonpackage import clear_python_probe_cache, pick_python_cmd
+
+        # 'python' commands that are found first in $PATH are broken
+        for python_cmd in ['python', 'python%s' % sys.version_info[0]]:
+            self.write_script(python_cmd, "echo 'this is a broken Python' >&2\nexit 1")
+        os.environ['PATH'] = '%s:%s' % (os.path.join(self.test_prefix, 'bin'), os.getenv('PATH'))
+
+        clear_python_probe_cache()
+        res = pick_python_cmd(sys.version_info[0])
+        self.assertEqual(res, sys.executable)
+
+        # without version requirements, 'python' commands are not run (so broken ones are not detected)
+        self.assertEqual(pick_python_cmd(), os.path.join(self.test_prefix, 'bin', 'python'))
+
+    def test_pythonpackage_batch_import_check(self):
+        """Test checking import of Python modules for all extensions at once."""
+        from easybuild.easyblocks.generic.pythonpackage import check_python_imports
+
+        write_file(os.path.join(self.test_prefix, 'eb_ok.py'), '')
+        write_file(os.path.join(self.test_prefix, 'eb_ok_too.py'), '')
+        write_file(os.path.join(self.test_prefix, 'eb_broken.py'), "raise ImportError('eb_broken is broken')")
+        write_file(os.path.join(self.test_prefix, 'eb_crash.py'), "import os; os._exit(1)")
+        change_dir(self.test_prefix)
+
+        def check_imports(modnames):
+            """Check import of Python modules with Python command used to run the tests."""
+            return check_python_imports(sys.executable, modnames)
+
+        res = check_imports(['eb_ok', 'eb_broken', 'eb_ok_too', 'no_such_module'])
+        self.assertEqual(sorted(res.keys()), ['eb_broken', 'eb_ok', 'eb_ok_too', 'no_such_module'])
+        self.assertTrue(res['eb_ok']['ok'] and res['eb_ok_too']['ok'])
+        self.assertFalse(res['eb_broken']['ok'] or res['no_such_module']['ok'])
+        self.assertTrue('eb_broken is broken' in res['eb_broken']['error'])
+
+        # only extensions for which the check failed are checked again separately (using the filter command)
+        exts = [DummyExtension(name) for name in ['ok', 'broken', 'ok_too']]
+        batch_check_exts([(ext, 'eb_' + ext.name) for ext in exts], check_imports, "import of Python modules")
+        self.assertEqual([batch_check_passed(ext, "import") for ext in exts], [True, False, True])
+
+        # if Python crashes, no result is available for modules that were not checked yet
+        exts = [DummyExtension(name) for name in ['ok', 'crash', 'ok_too']]
+        batch_check_exts([(ext, 'eb_' + ext.name) for ext in exts], check_imports, "import of Python modules")
+        self.assertEqual([batch_check_passed(ext, "import") for ext in exts], [True, False, False])
+        self.assertEqual(exts[2].batch_check_result, {'ok': False, 'error': "no result available"})
+
+    def test_pythonpackage_install_updates_pth_files(self):
+        """Test determining whether install command may update shared .pth files (which prevents deferring it)."""
+        from easybuild.easyblocks.generic.pythonpackage import EASY_INSTALL_INSTALL_CMD, PIP_INSTALL_CMD
+        from easybuild.easyblocks.generic.pythonpackage import SETUP_PY_DEVELOP_CMD, SETUP_PY_INSTALL_CMD
+        from easybuild.easyblocks.generic.pythonpackage import install_updates_pth_files
+
+        self.assertFalse(install_updates_pth_files(PIP_INSTALL_CMD))
+        self.assertTrue(install_updates_pth_files(PIP_INSTALL_CMD, use_pip_editable=True))
+
+        for install_cmd in [EASY_INSTALL_INSTALL_CMD, SETUP_PY_DEVELOP_CMD, SETUP_PY_INSTALL_CMD,
+                            SETUP_PY_INSTALL_CMD + " %(loc)s"]:
+            self.assertTrue(install_updates_pth_files(install_cmd))
+
+    def test_pythonpackage_det_python_requirements(self):
+        """Test determining requirements of Python package from metadata included in sources."""
+        from easybuild.easyblocks.generic.pythonpackage import det_python_requirements
+
+        self.assertEqual(det_python_requirements(self.test_prefix), set())
+
+        requires_txt = '\n'.join([
+            "numpy>=1.13",
+            "python_dateutil >= 2.6.1",
+            "Six",
+            "",
+            "[test]",
+            "pytest",
+        ])
+        write_file(os.path.join(self.test_prefix, 'example.egg-info', 'requires.txt'), requires_txt)
+        self.assertEqual(det_python_requirements(self.test_prefix), set(['numpy', 'python-dateutil', 'six']))
+
+        pkg_info = '\n'.join([
+            "Metadata-Version: 2.1",
+            "Name: example",
+            "Requires-Dist: zope.interface (>=4.0)",
+            "Requires-Dist: sphinx; extra == 'docs'",
+        ])
+        write_file(os.path.join(self.test_prefix, 'PKG-INFO'), pkg_info)
+
+        pyproject_toml = '\n'.join([
+            "[build-system]",
+            'requires = ["setuptools>=40.8.0", "wheel",',
+            '            "Cython"]',
+            "",
+            "[tool.black]",
+            'requires = ["not-a-build-requirement"]',
+        ])
+        write_file(os.path.join(self.test_prefix, 'pyproject.toml'), pyproject_toml)
+
+        expected = set(['cython', 'numpy', 'python-dateutil', 'setuptools', 'six', 'wheel', 'zope-interface'])
+        self.assertEqual(det_python_requirements(self.test_prefix), expected)
+
+    def test_pythonpackage_evict_wheel_cache(self):
+        """Test evicting least recently used entries from wheel cache."""
+        from easybuild.easyblocks.generic.pythonpackage import evict_wheel_cache
+
+        # 4 cache entries of 400KB each, oldest first
+        entries = [os.path.join(self.test_prefix, 'entry%d' % i) for i in range(4)]
+        for idx, entry in enumerate(entries):
+            write_file(os.path.join(entry, 'example.whl'), 'x' * 400 * 1024)
+            os.utime(entry, (1000000000 + idx, 1000000000 + idx))
+        # entries that are still being created are ignored
+        write_file(os.path.join(self.test_prefix, '.entry4.tmp', 'example.whl'), 'x' * 1024 * 1024)
+
+        # nothing is evicted if cache is small enough
+        self.assertEqual(evict_wheel_cache(self.test_prefix, 2), (1600 * 1024, 4))
+        self.assertEqual(sorted(os.listdir(self.test_prefix)), ['.entry4.tmp'] + [os.path.basename(x) for x in entries])
+
+        # least recently used entries are evicted first, until cache size is below limit
+        self.assertEqual(evict_wheel_cache(self.test_prefix, 1), (800 * 1024, 2))
+        self.assertEqual([os.path.exists(x) for x in entries], [False, False, True, True])
+
+        # entry to keep is never evicted, even if it is the least recently used one
+        write_file(os.path.join(entries[0], 'example.whl'), 'x' * 400 * 1024)
+        os.utime(entries[0], (1000000000, 1000000000))
+        self.assertEqual(evict_wheel_cache(self.test_prefix, 0.5, keep=entries[0]), (400 * 1024, 1))
+        self.assertEqual([os.path.exists(x) for x in entries], [True, False, False, False])
+        self.assertTrue(os.path.exists(os.path.join(self.test_prefix, '.entry4.tmp')))
+
+    def test_rpackage_det_r_pkg_deps(self):
+        """Test determining dependencies of R package from DESCRIPTION file."""
+        from easybuild.easyblocks.generic.rpackage import det_r_pkg_deps
+
+        pkgdir = os.path.join(self.test_prefix, 'example')
+        self.assertEqual(det_r_pkg_deps(self.test_prefix), set())
+
+        descr_txt = '\n'.join([
+            "Package: example",
+            "Version: 1.0",
+            "Depends: R (>= 3.2.0), methods,",
+            "    ggplot2 (>= 3.0.0)",
+            "Imports:",
+            "    Rcpp (>= 0.11.0),",
+            "\tdata.table, stats, utils",
+            "Suggests: testthat",
+            "LinkingTo: Rcpp, RcppArmadillo",
+            "Description: Example R package, which Depends: on nothing in this line.",
+        ])
+        write_file(os.path.join(pkgdir, 'DESCRIPTION'), descr_txt)
+        expected = set(['ggplot2', 'Rcpp', 'data.table', 'RcppArmadillo'])
+        self.assertEqual(det_r_pkg_deps(pkgdir), expected)
+
+        # DESCRIPTION file is also found in source tarballs, without unpacking them
+        tarball = os.path.join(self.test_prefix, 'example_1.0.tar.gz')
+        tar = tarfile.open(tarball, 'w:gz')
+        tar.add(pkgdir, arcname='example')
+        tar.close()
+        self.assertEqual(det_r_pkg_deps(tarball), expected)
+
+    def test_perl_batch_module_check(self):
+        """Test checking availability of Perl modules for all extensions at once."""
+        from easybuild.easyblocks.perl import check_perl_modules
+
+        if which('perl') is None:
+            print("Skipping test_perl_batch_module_check, no 'perl' command available")
+            return
+
+        res = check_perl_modules(['strict', 'No::Such::Module'])
+        self.assertTrue(res['strict']['ok'])
+        self.assertTrue(res['strict']['path'].endswith('strict.pm'))
+        self.assertFalse(res['No::Such::Module']['ok'])
+        self.assertEqual(res['No::Such::Module']['error'], "not found in @INC")
+
+        exts = [DummyExtension(name) for name in ['strict', 'No::Such::Module', 'warnings']]
+        batch_check_exts([(ext, ext.name) for ext in exts], check_perl_modules, "availability of Perl modules")
+        self.assertEqual([batch_check_passed(ext, "availability") for ext in exts], [True, False, True])
+
+    def test_boost_bjam_stats(self):
+        """Test determining statistics for bjam run based on its output."""
+        from easybuild.easyblocks.boost import det_bjam_stats
+
+        self.assertEqual(det_bjam_stats(''), {'found': 0, 'updating': 0, 'compiled': 0})
+
+        out = '\n'.join([
+            "...found 3451 targets...",
+            "...updating 12 targets...",
+            "common.mkdir bin.v2/libs/system",
+            "gcc.compile.c++ bin.v2/libs/system/build/gcc/release/threading-multi/error_code.o",
+            "gcc.compile.c bin.v2/libs/atomic/build/gcc/release/threading-multi/lockpool.o",
+            "gcc.compile.c++.pch bin.v2/libs/math/build/gcc/release/threading-multi/pch.hpp.gch",
+            "gcc.link.dll bin.v2/libs/system/build/gcc/release/threading-multi/libboost_system.so.1.71.0",
+            "  gcc.compile.c++ this line is not a compilation action",
+            "...updated 12 targets...",
+            # install step, which is run separately with the same options
+            "...found 3460 targets...",
+            "...updating 1 target...",
+            "common.copy /prefix/lib/libboost_system.so.1.71.0",
+            "...updated 1 target...",
+        ])
+        self.assertEqual(det_bjam_stats(out), {'found': 6911, 'updating': 13, 'compiled': 3})
+
+    def test_compiler_cache_stats(self):
+        """Test obtaining statistics for compiler cache."""
+        from easybuild.easyblocks.generic.configuremake import get_compiler_cache_stats
+
+        # ccache 4.x supports --print-stats (tab-separated counters)
+        ccache_v4 = self.write_script('ccache4', '\n'.join([
+            "if [ \"$1\" == '--print-stats' ]; then",
+            "  echo -e 'cache_miss\\t7'",
+            "  echo -e 'direct_cache_hit\\t3'",
+            "  echo -e 'preprocessed_cache_hit\\t2'",
+            "  echo -e 'stats_updated_timestamp\\t1571234567'",
+            "else",
+            "  exit 1",
+            "fi",
+        ]))
+        self.assertEqual(get_compiler_cache_stats(ccache_v4), {'hits': 5, 'misses': 7})
+
+        # older ccache versions only support -s
+        ccache_v3 = self.write_script('ccache3', '\n'.join([
+            "if [ \"$1\" == '-s' ]; then",
+            "  echo 'cache directory                     /tmp/ccache'",
+            "  echo 'cache hit (direct)                     4'",
+            "  echo 'cache hit (preprocessed)               1'",
+            "  echo 'cache miss                            10'",
+            "  echo 'files in cache                        42'",
+            "else",
+            "  echo \"ccache: invalid option -- '$1'\" >&2",
+            "  exit 1",
+            "fi",
+        ]))
+        self.assertEqual(get_compiler_cache_stats(ccache_v3), {'hits': 5, 'misses': 10})
+
+    def test_cmake_generator(self):
+        """Test determining CMake generator to use."""
+        from easybuild.easyblocks.generic.cmakemake import MAKEFILES_GENERATOR, NINJA_GENERATOR, det_cmake_generator
+
+        self.assertEqual(det_cmake_generator(None), None)
+        self.assertEqual(det_cmake_generator(MAKEFILES_GENERATOR), MAKEFILES_GENERATOR)
+
+        error_pattern = "Unknown CMake generator 'Xcode'"
+        self.assertErrorRegex(EasyBuildError, error_pattern, det_cmake_generator, 'Xcode')
+
+        # fall back to default generator if 'ninja' command is not available
+        os.environ['PATH'] = os.path.join(self.test_prefix, 'bin')
+        self.assertEqual(det_cmake_generator(NINJA_GENERATOR, silent=True), None)
+
+        self.write_script('ninja', "echo 1.9.0")
+        self.assertEqual(det_cmake_generator(NINJA_GENERATOR), NINJA_GENERATOR)
+
+    def test_cp2k_parse_regtest_value(self):
+        """Test extracting values from CP2K output files for regression test."""
+        from easybuild.easyblocks.cp2k import parse_regtest_value
+
+        out_path = os.path.join(self.test_prefix, 'H2O-32.inp.out')
+        self.assertEqual(parse_regtest_value(out_path, 'ENERGY|', 9), None)
+
+        out_txt = '\n'.join([
+            " ENERGY| Total FORCE_EVAL ( QS ) energy (a.u.):              -17.000000000000000",
+            " MD| Step number                                                              10",
+            " ENERGY| Total FORCE_EVAL ( QS ) energy (a.u.):              -17.165828932524599",
+            " Fortran-style value:  1.2345D-03",
+            " Not a number: NaNaN",
+        ])
+        write_file(out_path, out_txt)
+
+        # value is taken from last line that matches pattern
+        self.assertEqual(parse_regtest_value(out_path, 'ENERGY|', 9), -17.165828932524599)
+        self.assertEqual(parse_regtest_value(out_path, 'Step number', 4), 10.0)
+        self.assertEqual(parse_regtest_value(out_path, 'Fortran-style', 3), 1.2345E-03)
+
+        # no value if pattern is not found, column is out of range, or value is not a number
+        self.assertEqual(parse_regtest_value(out_path, 'no such pattern', 1), None)
+        self.assertEqual(parse_regtest_value(out_path, 'ENERGY|', 10), None)
+        self.assertEqual(parse_regtest_value(out_path, 'Not a number', 4), None)
+
+    def test_gcc_build_mode(self):
+        """Test determining build mode for GCC."""
+        from easybuild.easyblocks.gcc import BUILD_MODE_BOOTSTRAP, BUILD_MODE_LTO, BUILD_MODE_PLAIN
+        from easybuild.easyblocks.gcc import BUILD_MODE_PROFILED, det_build_mode
+
+        # default build mode depends on whether 'profiled' is enabled
+        self.assertEqual(det_build_mode(None, False, True), BUILD_MODE_BOOTSTRAP)
+        self.assertEqual(det_build_mode(None, True, True), BUILD_MODE_PROFILED)
+
+        for build_mode in [BUILD_MODE_PLAIN, BUILD_MODE_BOOTSTRAP, BUILD_MODE_PROFILED, BUILD_MODE_LTO]:
+            self.assertEqual(det_build_mode(build_mode, False, True), build_mode)
+        self.assertEqual(det_build_mode(BUILD_MODE_PROFILED, True, False), BUILD_MODE_PROFILED)
+
+        error_pattern = "Unknown build mode 'fast' specified, should be one of: plain, bootstrap"
+        self.assertErrorRegex(EasyBuildError, error_pattern, det_build_mode, 'fast', False, True)
+
+        error_pattern = "Build mode 'plain' conflicts with 'profiled' being enabled"
+        self.assertErrorRegex(EasyBuildError, error_pattern, det_build_mode, BUILD_MODE_PLAIN, True, True)
+
+        error_pattern = "Build mode 'lto' requires that LTO support is enabled"
+        self.assertErrorRegex(EasyBuildError, error_pattern, det_build_mode, BUILD_MODE_LTO, False, False)
+
+    def test_gcc_stage2_deps(self):
+        """Test determining dependencies between libraries built in stage 2 of GCC build."""
+        from easybuild.easyblocks.gcc import det_stage2_deps
+        from easybuild.easyblocks.generic.paralleltasks import det_max_concurrency
+
+        self.assertEqual(det_stage2_deps(['gmp'], False), {})
+
+        # all libraries depend on GMP, CLooG also depends on either ISL or PPL
+        libs = ['gmp', 'ppl', 'isl', 'cloog']
+        deps = det_stage2_deps(libs, True)
+        self.assertEqual(deps, {'ppl': ['gmp'], 'isl': ['gmp'], 'cloog': ['gmp', 'isl']})
+        self.assertEqual(det_max_concurrency(libs, deps), 2)
+
+        deps = det_stage2_deps(libs, False)
+        self.assertEqual(deps, {'ppl': ['gmp'], 'isl': ['gmp'], 'cloog': ['gmp', 'ppl']})
+
+        # only libraries that are actually built are taken into account
+        libs = ['gmp', 'ppl', 'cloog']
+        deps = det_stage2_deps(libs, True)
+        self.assertEqual(deps, {'ppl': ['gmp'], 'cloog': ['gmp']})
+        self.assertEqual(det_max_concurrency(libs, deps), 2)
+
+    def test_atlas_cpu_max_freq(self):
+        """Test determining maximum CPU frequency, which is used in key for cached ATLAS tuning results."""
+        import easybuild.easyblocks.atlas as atlas
+
+        orig_cpuinfo_max_freq_fp = atlas.CPUINFO_MAX_FREQ_FP
+        try:
+            atlas.CPUINFO_MAX_FREQ_FP = os.path.join(self.test_prefix, 'cpuinfo_max_freq')
+            self.assertEqual(atlas.get_cpu_max_freq(), None)
+
+            write_file(atlas.CPUINFO_MAX_FREQ_FP, '3500000\n')
+            self.assertEqual(atlas.get_cpu_max_freq(), 3500000)
+
+            write_file(atlas.CPUINFO_MAX_FREQ_FP, '<unknown>\n')
+            self.assertEqual(atlas.get_cpu_max_freq(), None)
+        finally:
+            atlas.CPUINFO_MAX_FREQ_FP = orig_cpuinfo_max_freq_fp
+
+    def test_gromacs_simd_launchers(self):
+        """Test installing launchers for multi-SIMD GROMACS installations."""
+        from easybuild.easyblocks.gromacs import install_gmx_simd_launchers, is_gmx_simd_launcher
+
+        bindir = os.path.join(self.test_prefix, 'bin')
+        default_bindir = os.path.join(bindir, 'default')
+        write_file(os.path.join(bindir, 'gmx'), 'single precision binary')
+        write_file(os.path.join(bindir, 'gmx_mpi'), 'single precision MPI binary')
+        write_file(os.path.join(bindir, 'demux.pl'), 'not a GROMACS binary')
+
+        launchers = install_gmx_simd_launchers(bindir, ['AVX2_256', 'AVX_512'])
+        self.assertEqual(launchers, [os.path.join(bindir, 'gmx'), os.path.join(bindir, 'gmx_mpi')])
+        self.assertEqual(sorted(os.listdir(default_bindir)), ['gmx', 'gmx_mpi'])
+        self.assertTrue(os.path.exists(os.path.join(bindir, 'demux.pl')))
+
+        launcher_txt = read_file(os.path.join(bindir, 'gmx'))
+        self.assertTrue(is_gmx_simd_launcher(os.path.join(bindir, 'gmx')))
+        self.assertFalse(is_gmx_simd_launcher(os.path.join(default_bindir, 'gmx')))
+        # best GMX_SIMD level is checked first
+        self.assertTrue(launcher_txt.index('$bindir/AVX_512/gmx') < launcher_txt.index('$bindir/AVX2_256/gmx'))
+        self.assertTrue(launcher_txt.endswith('exec "$bindir/default/gmx" "$@"\n'))
+
+        # second iteration (double precision) only moves the newly installed binaries, launchers are left in place
+        write_file(os.path.join(bindir, 'gmx_d'), 'double precision binary')
+        launchers = install_gmx_simd_launchers(bindir, ['AVX2_256', 'AVX_512'])
+        self.assertEqual(launchers, [os.path.join(bindir, 'gmx_d')])
+        self.assertEqual(sorted(os.listdir(default_bindir)), ['gmx', 'gmx_d', 'gmx_mpi'])
+        self.assertEqual(read_file(os.path.join(default_bindir, 'gmx')), 'single precision binary')
+        self.assertEqual(read_file(os.path.join(default_bindir, 'gmx_d')), 'double precision binary')
+        self.assertEqual(read_file(os.path.join(bindir, 'gmx')), launcher_txt)
+
+        # running it again without newly installed binaries is an error
+        error_pattern = "No GROMACS binaries found in %s" % bindir
+        self.assertErrorRegex(EasyBuildError, error_pattern, install_gmx_simd_launchers, bindir, ['AVX2_256'])
+
+    def test_tensorflow_trim_bazel_cache(self):
+        """Test trimming Bazel disk cache by removing least recently used files first."""
+        from easybuild.easyblocks.tensorflow import trim_bazel_cache
+
+        # 4 files of 1KB each in different subdirectories, least recently used first;
+        # most recent of access and modification time is taken into account
+        paths = [os.path.join(self.test_prefix, subdir, 'file%d' % i) for i, subdir in enumerate(['ac', 'cas'] * 2)]
+        for idx, path in enumerate(paths):
+            write_file(path, 'x' * 1024)
+            os.utime(path, (1000000000 + idx * 10, 1000000000))
+        os.utime(paths[0], (1000000000, 1000000015))
+
+        self.assertEqual(trim_bazel_cache(self.test_prefix, 4096), (4096, 0))
+        self.assertEqual([os.path.exists(x) for x in paths], [True] * 4)
+
+        self.assertEqual(trim_bazel_cache(self.test_prefix, 3000), (2048, 2))
+        self.assertEqual([os.path.exists(x) for x in paths], [False, False, True, True])
+
+        self.assertEqual(trim_bazel_cache(self.test_prefix, 0), (0, 2))
+        self.assertEqual([os.path.exists(x) for x in paths], [False] * 4)
+
+    def test_bundle_component_deps(self):
+        """Test determining dependencies between components of a bundle."""
+        from easybuild.easyblocks.generic.bundle import det_component_deps
+        from easybuild.easyblocks.generic.paralleltasks import det_max_concurrency
+
+        labels = ['one-1.0', 'two-2.0', 'three-3.0', 'four-4.0']
+
+        # if no required components are specified, components require all earlier components
+        comps = [(label, label.split('-')[0], None) for label in labels]
+        deps = det_component_deps(comps)
+        expected = {
+            'one-1.0': [],
+            'two-2.0': ['one-1.0'],
+            'three-3.0': ['one-1.0', 'two-2.0'],
+            'four-4.0': ['one-1.0', 'two-2.0', 'three-3.0'],
+        }
+        self.assertEqual(deps, expected)
+        self.assertEqual(det_max_concurrency(labels, deps), 1)
+
+        # components are only independent if that is specified explicitly
+        comps = [
+            ('one-1.0', 'one', []),
+            ('two-2.0', 'two', []),
+            ('three-3.0', 'three', ['one']),
+            ('four-4.0', 'four', None),
+        ]
+        deps = det_component_deps(comps)
+        expected = {
+            'one-1.0': [],
+            'two-2.0': [],
+            'three-3.0': ['one-1.0'],
+            'four-4.0': ['one-1.0', 'two-2.0', 'three-3.0'],
+        }
+        self.assertEqual(deps, expected)
+        self.assertEqual(det_max_concurrency(labels, deps), 2)
+
+        deps = det_component_deps([(label, label.split('-')[0], []) for label in labels])
+        self.assertEqual(det_max_concurrency(labels, deps), 4)
+
+        # only earlier components can be required
+        comps = [('one-1.0', 'one', ['two']), ('two-2.0', 'two', [])]
+        error_pattern = "Component one-1.0 requires two, which is not an earlier component"
+        self.assertErrorRegex(EasyBuildError, error_pattern, det_component_deps, comps)
+
+        error_pattern = "Circular dependencies found between tasks"
+        deps = {'one': ['two'], 'two': ['one']}
+        self.assertErrorRegex(EasyBuildError, error_pattern, det_max_concurrency, ['one', 'two'], deps)
+
+
+def suite():
+    """ returns all test cases in this module """
+    return TestLoader().loadTestsFromTestCase(EasyblockSpecificTest)
+
+
+if __name__ == '__main__':
+    res = TextTestRunner(verbosity=1).run(suite())
+    sys.exit(len(res.failures))
@@ -195,6 +195,9 @@ def suite():
     all_pys = glob.glob('%s/*/*.py' % easyblocks_path)
     easyblocks = [eb for eb in all_pys if not eb.endswith('__init__.py') and '/test/' not in eb]
 
+    # filter out modules that do not provide an easyblock
+    easyblocks = [eb for eb in easyblocks if os.path.basename(eb) not in ['batchcheck.py', 'paralleltasks.py']]
+
     for easyblock in easyblocks:
         # dynamically define new inner functions that can be added as class methods to InitTest
         if os.path.basename(easyblock) == 'systemcompiler.py':
@@ -346,8 +346,9 @@ def suite():
     all_pys = glob.glob('%s/*/*.py' % easyblocks_path)
     easyblocks = [eb for eb in all_pys if os.path.basename(eb) != '__init__.py' and '/test/' not in eb]
 
-    # filter out no longer supported easyblocks, or easyblocks that are tested in a different way
-    excluded_easyblocks = ['versionindependendpythonpackage.py']
+    # filter out no longer supported easyblocks, or easyblocks that are tested in a different way,
+    # and modules that do not provide an easyblock
+    excluded_easyblocks = ['versionindependendpythonpackage.py', 'batchcheck.py', 'paralleltasks.py']
     easyblocks = [e for e in easyblocks if os.path.basename(e) not in excluded_easyblocks]
 
     # add dummy PrgEnv-* modules, required for testing CrayToolchain easyblock
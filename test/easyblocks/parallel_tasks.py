@@ -0,0 +1,344 @@
+##
+# Copyright 2019 Ghent University
+#
+# This file is part of EasyBuild,
+# originally created by the HPC team of Ghent University (http://ugent.be/hpc/en),
+# with support of Ghent University (http://ugent.be/hpc),
+# the Flemish Supercomputer Centre (VSC) (https://www.vscentrum.be),
+# Flemish Research Foundation (FWO) (http://www.fwo.be/en)
+# and the Department of Economy, Science and Innovation (EWI) (http://www.ewi-vlaanderen.be/en).
+#
+# https://github.com/easybuilders/easybuild
+#
+# EasyBuild is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation v2.
+#
+# EasyBuild is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with EasyBuild.  If not, see <http://www.gnu.org/licenses/>.
+##
+"""
+Unit tests for running tasks in parallel, and for installing extensions in parallel.
+"""
+import os
+import shutil
+import sys
+import tempfile
+import time
+from unittest import TestLoader, TextTestRunner
+
+from easybuild.base import fancylogger
+from easybuild.base.testing import TestCase
+from easybuild.easyblocks.generic.paralleltasks import DeferrableExtension, ParallelExtsInstall
+from easybuild.easyblocks.generic.paralleltasks import no_mpi_binding_cmd, run_tasks_parallel, split_parallelism
+from easybuild.tools.build_log import EasyBuildError
+from easybuild.tools.config import BuildOptions, Singleton, init_build_options
+from easybuild.tools.filetools import change_dir, write_file
+
+
+class DummyParent(object):
+    """Dummy parent easyblock, only provides what is required by ParallelExtsInstall."""
+
+    def __init__(self, parallel, parallel_exts_install=True):
+        """Constructor for dummy parent easyblock."""
+        self.cfg = {'parallel': parallel, 'parallel_exts_install': parallel_exts_install}
+        self.dry_run = False
+        self.log = fancylogger.getLogger('DummyParent', fname=False)
+        self.logfile = None
+        self.silent = True
+        self.exts = []
+
+    def extensions_step(self):
+        """Process all extensions."""
+        for ext in self.exts:
+            ext.run()
+            ext.postrun()
+
+
+class DummyParallelParent(ParallelExtsInstall, DummyParent):
+    """Dummy parent easyblock that supports installing extensions in parallel."""
+    pass
+
+
+class DummyExtension(object):
+    """Dummy extension, only provides what is required by DeferrableExtension."""
+
+    def __init__(self, master, name, requires, workdir):
+        """Constructor for dummy extension."""
+        self.master = master
+        self.is_extension = True
+        self.name = name
+        self.version = '1.0'
+        self.requires = requires
+        self.workdir = workdir
+        self.log = fancylogger.getLogger('DummyExtension', fname=False)
+        self.postrun_done = False
+
+    def install(self):
+        """Install extension: write file that records environment, working directory and installed extensions."""
+        installed = sorted(os.listdir(self.workdir))
+        txt = '\n'.join([os.getenv('EB_TEST_EXT', ''), os.getcwd(), ','.join(installed)])
+        write_file(os.path.join(self.workdir, self.name), txt)
+        return os.getpid()
+
+    def postrun(self):
+        """Post-installation step."""
+        self.postrun_done = True
+
+
+class DummyDeferrableExtension(DeferrableExtension, DummyExtension):
+    """Dummy extension for which installation can be deferred."""
+
+    def __init__(self, *args, **kwargs):
+        """Constructor for dummy extension for which installation can be deferred."""
+        self.deferrable = kwargs.pop('deferrable', True)
+        super(DummyDeferrableExtension, self).__init__(*args, **kwargs)
+        self.install_pid = None
+
+    def run(self):
+        """Install extension, or defer installation."""
+        os.environ['EB_TEST_EXT'] = self.name
+        change_dir(self.workdir)
+        if self.can_defer_install():
+            if self.deferrable:
+                self.defer_install(self.name, self.requires)
+                return
+            else:
+                self.master.install_deferred_exts()
+        self.install()
+
+    def deferred_install_step(self):
+        """Install extension for which installation was deferred."""
+        return self.install()
+
+    def install_deferred_done(self, res):
+        """Keep track of result of deferred installation."""
+        self.install_pid = res
+        super(DummyDeferrableExtension, self).install_deferred_done(res)
+
+
+def set_build_options(**build_options):
+    """(Re)initialize build options with specified values."""
+    Singleton._instances.pop(BuildOptions, None)
+    init_build_options(build_options=build_options)
+
+
+class ParallelTasksTest(TestCase):
+    """Tests for running tasks in parallel."""
+
+    def setUp(self):
+        """Test setup."""
+        super(ParallelTasksTest, self).setUp()
+        self.orig_build_options = Singleton._instances.get(BuildOptions)
+        set_build_options(extended_dry_run=False, silent=True)
+        self.orig_workdir = os.getcwd()
+        self.test_prefix = tempfile.mkdtemp()
+
+    def tearDown(self):
+        """Test cleanup."""
+        change_dir(self.orig_workdir)
+        shutil.rmtree(self.test_prefix)
+        Singleton._instances.pop(BuildOptions, None)
+        if self.orig_build_options is not None:
+            Singleton._instances[BuildOptions] = self.orig_build_options
+        super(ParallelTasksTest, self).tearDown()
+
+    def test_split_parallelism(self):
+        """Test split_parallelism function."""
+        self.assertEqual(split_parallelism(8, 2), (2, 4))
+        self.assertEqual(split_parallelism(8, 3), (3, 2))
+        self.assertEqual(split_parallelism(8, 16), (8, 1))
+        self.assertEqual(split_parallelism(1, 4), (1, 1))
+        self.assertEqual(split_parallelism(4, 0), (1, 4))
+
+    def test_run_tasks_parallel_deps(self):
+        """Test scheduling of tasks taking into account dependencies between them."""
+        done = []
+
+        def task(label, delay):
+            """Return function for task with specified label that takes (at least) the specified time."""
+            def func():
+                time.sleep(delay)
+                return (label, os.getpid())
+            return func
+
+        tasks = [('a', task('a', 0.5)), ('b', task('b', 0)), ('c', task('c', 0))]
+        deps = {'b': ['a']}
+        res = run_tasks_parallel(tasks, 2, deps=deps, done_callback=lambda label, _: done.append(label))
+
+        # 'c' doesn't have to wait for 'a' to complete, 'b' does
+        self.assertEqual(done, ['c', 'a', 'b'])
+        for label in ['a', 'b', 'c']:
+            self.assertEqual(res[label]['result'][0], label)
+            # tasks are run in separate processes
+            self.assertFalse(res[label]['result'][1] == os.getpid())
+            for key in ['cpu_time', 'max_rss', 'time']:
+                self.assertTrue(key in res[label])
+        self.assertTrue(res['a']['time'] >= 0.5)
+
+        # unknown tasks in dependencies result in an error
+        error_pattern = "Unknown tasks found in dependencies for task 'b'"
+        self.assertErrorRegex(EasyBuildError, error_pattern, run_tasks_parallel, tasks, 2, deps={'b': ['d']})
+
+        # circular dependencies are detected
+        error_pattern = "Circular dependencies found between tasks: a, b"
+        deps = {'a': ['b'], 'b': ['a']}
+        self.assertErrorRegex(EasyBuildError, error_pattern, run_tasks_parallel, tasks, 2, deps=deps)
+
+    def test_run_tasks_parallel_isolation(self):
+        """Test whether tasks run in parallel can not affect each other or the main process."""
+
+        def task():
+            """Task that changes the environment and working directory."""
+            os.environ['EB_TEST_TASK'] = 'changed'
+            change_dir(self.test_prefix)
+            return os.getenv('EB_TEST_TASK')
+
+        os.environ['EB_TEST_TASK'] = 'orig'
+        res = run_tasks_parallel([('one', task), ('two', task)], 2)
+        self.assertEqual(res['one']['result'], 'changed')
+        self.assertEqual(os.getenv('EB_TEST_TASK'), 'orig')
+        self.assertEqual(os.getcwd(), self.orig_workdir)
+
+    def test_run_tasks_parallel_failure(self):
+        """Test handling of failing tasks."""
+        marker = os.path.join(self.test_prefix, 'marker')
+
+        def failing_task():
+            """Task that fails."""
+            raise EasyBuildError("oops, something went wrong")
+
+        def task():
+            """Task that leaves a marker file."""
+            write_file(marker, 'done')
+
+        tasks = [('ok', lambda: None), ('fail', failing_task), ('dep', task)]
+        error_pattern = r"1 task\(s\) failed: fail \(oops, something went wrong\)"
+        self.assertErrorRegex(EasyBuildError, error_pattern, run_tasks_parallel, tasks, 2, deps={'dep': ['fail']})
+        # tasks that depend on a failed task are not started
+        self.assertFalse(os.path.exists(marker))
+
+        # task that exits in an unexpected way
+        tasks = [('exit', lambda: os._exit(3))]
+        error_pattern = "exit \\(no result available \\(exit status 768\\)\\)"
+        self.assertErrorRegex(EasyBuildError, error_pattern, run_tasks_parallel, tasks, 2)
+
+        # in serial mode, errors are passed down as is
+        tasks = [('ok', lambda: None), ('fail', failing_task), ('dep', task)]
+        error_pattern = "oops, something went wrong"
+        self.assertErrorRegex(EasyBuildError, error_pattern, run_tasks_parallel, tasks, 1, deps={'dep': ['fail']})
+        self.assertFalse(os.path.exists(marker))
+
+        # errors raised by done callback stop running tasks right away, remaining tasks are not started
+        def check_result(label, res):
+            """Callback that checks task result."""
+            if not res:
+                raise EasyBuildError("task %s returned a bad result", label)
+
+        tasks = [('slow', lambda: time.sleep(30)), ('bad', lambda: False), ('dep', task)]
+        start_time = time.time()
+        error_pattern = "task bad returned a bad result"
+        self.assertErrorRegex(EasyBuildError, error_pattern, run_tasks_parallel, tasks, 2, deps={'dep': ['bad']},
+                              done_callback=check_result)
+        self.assertTrue(time.time() - start_time < 30)
+        self.assertFalse(os.path.exists(marker))
+
+    def test_no_mpi_binding_cmd(self):
+        """Test no_mpi_binding_cmd function."""
+        expected = "export HYDRA_BIND=none I_MPI_PIN=off MV2_ENABLE_AFFINITY=0 "
+        expected += "OMPI_MCA_hwloc_base_binding_policy=none && mpirun -np 2 ./test"
+        self.assertEqual(no_mpi_binding_cmd("mpirun -np 2 ./test"), expected)
+
+    def test_run_tasks_parallel_serial(self):
+        """Test running tasks one after the other in the current process."""
+        order = []
+
+        def task(label):
+            """Return function for task with specified label."""
+            def func():
+                order.append(label)
+                return os.getpid()
+            return func
+
+        tasks = [('a', task('a')), ('b', task('b')), ('c', task('c'))]
+        res = run_tasks_parallel(tasks, 1, deps={'a': ['c']})
+
+        # tasks are run in specified order, but only once their dependencies are done
+        self.assertEqual(order, ['b', 'c', 'a'])
+        for label in order:
+            self.assertEqual(res[label]['result'], os.getpid())
+
+        # tasks are also run in the current process in dry run mode
+        set_build_options(extended_dry_run=True, silent=True)
+        order[:] = []
+        res = run_tasks_parallel(tasks, 4)
+        self.assertEqual(order, ['a', 'b', 'c'])
+        self.assertEqual(res['a']['result'], os.getpid())
+
+        error_pattern = "Circular dependencies found between tasks: a, b"
+        deps = {'a': ['b'], 'b': ['a']}
+        self.assertErrorRegex(EasyBuildError, error_pattern, run_tasks_parallel, tasks, 1, deps=deps)
+
+    def test_parallel_exts_install(self):
+        """Test installing extensions in parallel."""
+        for parallel in [1, 3]:
+            workdir = os.path.join(self.test_prefix, 'parallel%d' % parallel)
+            os.mkdir(workdir)
+
+            parent = DummyParallelParent(parallel)
+            ext_a = DummyDeferrableExtension(parent, 'a', [], workdir)
+            ext_b = DummyDeferrableExtension(parent, 'b', ['a'], workdir)
+            # extensions that can not be deferred wait for all deferred installations
+            ext_c = DummyDeferrableExtension(parent, 'c', [], workdir, deferrable=False)
+            ext_d = DummyDeferrableExtension(parent, 'd', ['x'], workdir)
+            parent.exts = [ext_a, ext_b, ext_c, ext_d]
+
+            os.environ['EB_TEST_EXT'] = 'parent'
+            parent.extensions_step()
+
+            # environment and working directory of main process are restored
+            self.assertEqual(os.getenv('EB_TEST_EXT'), 'd')
+            self.assertEqual(os.getcwd(), workdir)
+            self.assertEqual(parent.deferred_exts, [])
+
+            # deferred installations are done in environment and working directory of when they were deferred,
+            # taking into account dependencies between extensions
+            for ext, installed in [(ext_a, ''), (ext_b, 'a'), (ext_c, 'a,b'), (ext_d, 'a,b,c')]:
+                ext_txt = open(os.path.join(workdir, ext.name)).read().split('\n')
+                self.assertEqual(ext_txt[:2], [ext.name, workdir])
+                self.assertEqual(ext_txt[2], installed)
+                self.assertTrue(ext.postrun_done)
+                self.assertEqual(ext.deferred, None)
+                if ext is not ext_c:
+                    self.assertEqual(ext.install_pid == os.getpid(), parallel == 1)
+
+        # nothing is deferred if installing extensions in parallel is not enabled
+        workdir = os.path.join(self.test_prefix, 'serial')
+        os.mkdir(workdir)
+        parent = DummyParallelParent(3, parallel_exts_install=False)
+        ext_a = DummyDeferrableExtension(parent, 'a', [], workdir)
+        parent.exts = [ext_a]
+        parent.extensions_step()
+        self.assertTrue(os.path.exists(os.path.join(workdir, 'a')))
+        self.assertEqual(parent.deferred_exts, None)
+        self.assertEqual(ext_a.deferred, None)
+
+        # installation of extensions is never deferred if parent easyblock doesn't support it
+        parent = DummyParent(3)
+        ext = DummyDeferrableExtension(parent, 'x', [], workdir)
+        self.assertFalse(ext.can_defer_install())
+
+
+def suite():
+    """ returns all test cases in this module """
+    return TestLoader().loadTestsFromTestCase(ParallelTasksTest)
+
+
+if __name__ == '__main__':
+    res = TextTestRunner(verbosity=1).run(suite())
+    sys.exit(len(res.failures))